@@ -5,6 +5,7 @@ __version__ = "0.1.0"
 from app import core
 from app import models
 from app import schemas
+from app import repositories
 from app import services
 from app import api
 from app import utils
@@ -1,28 +1,93 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, status, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional, Literal
 
 from app.services.note_service import (
     create_note, 
     get_note_by_id, 
     get_user_notes, 
+    get_user_notes_page,
+    search_user_notes,
+    search_encrypted_notes,
+    list_user_tags,
+    get_user_notes_etag,
+    get_note_etag,
+    get_note_content,
+    iter_note_content,
     update_note, 
-    delete_note
+    delete_note,
+    list_note_revisions,
+    get_note_revision,
+    apply_note_batch,
+    export_user_notes,
+    import_user_notes,
+    analyze_imported_notes
 )
-from app.schemas.note import Note, NoteCreate, NoteUpdate
+from app.services.event_service import stream_note_events
+from app.services.idempotency_service import (
+    IdempotencyKeyReused,
+    IdempotencyInProgress,
+    validate_idempotency_key,
+    request_fingerprint,
+    run_idempotent,
+)
+from app.repositories import VersionConflict
+from app.schemas.note import (
+    Note, NoteCreate, NoteUpdate, NoteImportResult, NoteBatchRequest, NoteBatchResult, NoteEncryptedSearch, NoteTag,
+    NoteRevision, NoteRevisionContent,
+)
+from app.models.note import SUMMARY_FIELDS, parse_projection
 from app.schemas.user import User
 from app.core.security import get_current_user
+from app.core.config import settings
+from app.utils.etag import version_etag, parse_if_match, etag_matches
+from app.utils.ranges import parse_range
+from app.utils.serialization import FastJSONResponse
 
 router = APIRouter()
 
+# Most tags a listing can be filtered on
+MAX_FILTER_TAGS = 10
+
+# Note responses may be kept by the browser but must be revalidated (If-None-Match) before reuse
+CACHE_CONTROL = "private, no-cache"
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def _created(note: Note) -> Response:
+    return FastJSONResponse(content=note.model_dump(mode="json"), status_code=status.HTTP_201_CREATED, headers={"ETag": version_etag(note.version)})
+
+async def _run_once(user_id: str, idempotency_key: str, fingerprint: str, operation) -> Response:
+    """Run a write through run_idempotent, mapping its errors to HTTP errors."""
+    try:
+        return await run_idempotent(user_id, validate_idempotency_key(idempotency_key), fingerprint, operation)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers={"Retry-After": "1"})
+
 @router.post("/", response_model=Note, status_code=status.HTTP_201_CREATED)
 async def create_user_note(
     note_create: NoteCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Client-chosen key under which a retry replays the first response"),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new note for the current user."""
     try:
+        if idempotency_key is not None:
+            async def create() -> Response:
+                return _created(await create_note(note_create, current_user.id))
+            fingerprint = request_fingerprint("create", note_create.model_dump(mode="json"))
+            return await _run_once(current_user.id, idempotency_key, fingerprint, create)
         note = await create_note(note_create, current_user.id)
+        response.headers["ETag"] = version_etag(note.version)
         return note
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -31,32 +96,293 @@ async def create_user_note(
 
 @router.get("/", response_model=List[Note])
 async def read_user_notes(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    view: Literal["full", "summary"] = Query("full", description="summary returns NoteSummary entries without content"),
+    fields: Optional[str] = Query(None, description="Comma-separated note fields to return, e.g. id,title,updated_at"),
+    sort: Optional[Literal["updated", "created", "sensitivity", "title"]] = Query(None, description="Order of the notes; updated by default, sensitivity with min_sensitivity"),
+    min_sensitivity: Optional[int] = Query(None, ge=0, le=100, description="Only notes with at least this sensitivity score"),
+    tags: Optional[str] = Query(None, description="Comma-separated tags the notes must carry"),
+    tag_mode: Literal["all", "any"] = Query("all", description="Whether notes need all the tags or any of them"),
+    if_none_match: Optional[str] = Header(None, description="ETag of a previously fetched page"),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all notes for the current user."""
+    """
+    Get all notes for the current user.
+    
+    Without skip, pages are read by cursor: the X-Next-Cursor response header
+    holds the cursor for the next page (absent on the last page) and
+    X-Total-Count the number of notes.
+    
+    view=summary or fields= return only the requested fields of each note,
+    and only those are read from storage.
+    
+    sort=created (newest first), sensitivity (highest first) or title (A to
+    Z) and min_sensitivity= read from secondary indexes when SORT_INDEXES is
+    enabled; they page by cursor only.
+    
+    tags=a,b lists only notes tagged a and b (a or b with tag_mode=any);
+    the filter runs on the server's tag sets, so X-Total-Count counts the
+    matching notes and other notes are never read.
+    
+    The ETag changes whenever any of the user's notes is written; with a
+    matching If-None-Match the answer is an empty 304 and no note is read.
+    """
     try:
-        notes = await get_user_notes(current_user.id, skip, limit)
-        return notes
+        selected = parse_projection(fields) if fields else (SUMMARY_FIELDS if view == "summary" else None)
+        if sort is None:
+            sort = "sensitivity" if min_sensitivity is not None else "updated"
+        selected_tags = [tag for tag in tags.split(",") if tag.strip()] if tags else None
+        if selected_tags and len(selected_tags) > MAX_FILTER_TAGS:
+            raise ValueError(f"At most {MAX_FILTER_TAGS} tags can be filtered on")
+        if skip and (sort != "updated" or selected_tags):
+            raise ValueError("skip cannot be combined with sort, min_sensitivity or tags; page with cursor")
+        
+        if if_none_match:
+            etag = await get_user_notes_etag(current_user.id)
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+        
+        if skip and not cursor:
+            listing = await get_user_notes(current_user.id, skip, limit, selected)
+            headers = {}
+        else:
+            listing = await get_user_notes_page(current_user.id, cursor, limit, selected, sort, min_sensitivity, selected_tags, tag_mode == "any")
+            headers = {"X-Total-Count": str(listing.total)}
+            if listing.next_cursor:
+                headers["X-Next-Cursor"] = listing.next_cursor
+        headers["ETag"] = listing.etag
+        headers["Cache-Control"] = CACHE_CONTROL
+        
+        if selected or settings.FAST_JSON_RESPONSES:
+            # Projections and fast-path listings are already JSON-ready (and
+            # projections do not match the Note model)
+            response_class = FastJSONResponse if settings.FAST_JSON_RESPONSES else JSONResponse
+            return response_class(content=listing.notes, headers=headers)
+        response.headers.update(headers)
+        return listing.notes
+    except ValueError as e:
+        # This is for malformed cursors, unknown fields and unavailable orders
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve notes: {str(e)}"
         )
 
+@router.get("/tags", response_model=List[NoteTag])
+async def read_user_tags(current_user: User = Depends(get_current_user)):
+    """Get the current user's tags with the number of notes carrying each, most used first."""
+    try:
+        return await list_user_tags(current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve tags: {str(e)}"
+        )
+
+@router.get("/search", response_model=List[Note])
+async def search_notes(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for; the last one may be the start of a title word"),
+    limit: int = Query(20, ge=1, le=100),
+    if_none_match: Optional[str] = Header(None, description="ETag of a previous answer to the same search"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Search the current user's plaintext notes by title and content.
+    
+    Notes matching every word are returned best match first, with
+    X-Total-Count holding the number of matches. Encrypted notes are not
+    searchable. The ETag is that of the note list, so a matching
+    If-None-Match answers 304 until any note is written.
+    """
+    if not settings.SEARCH_INDEX:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note search is not enabled"
+        )
+    try:
+        if if_none_match:
+            etag = await get_user_notes_etag(current_user.id)
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+        
+        listing = await search_user_notes(current_user.id, q, limit)
+        headers = {"X-Total-Count": str(listing.total), "ETag": listing.etag, "Cache-Control": CACHE_CONTROL}
+        
+        if settings.FAST_JSON_RESPONSES:
+            return FastJSONResponse(content=listing.notes, headers=headers)
+        response.headers.update(headers)
+        return listing.notes
+    except ValueError as e:
+        # A query without any searchable word
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search notes: {str(e)}"
+        )
+
+@router.post("/search/encrypted", response_model=List[Note])
+async def search_encrypted_user_notes(
+    search: NoteEncryptedSearch,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Search the current user's encrypted notes by keyword, without decrypting them.
+    
+    Send the words (q) with the password the notes were encrypted with, or
+    search_tokens computed by the client as for note creation. Only notes
+    encrypted with that password (or key) whose content has every word are
+    found; they are returned as stored, ciphertext included, with
+    X-Total-Count holding the number of matches. The password travels in the
+    request body, never in the URL.
+    """
+    if not settings.SEARCH_INDEX:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note search is not enabled"
+        )
+    try:
+        listing = await search_encrypted_notes(current_user.id, search)
+        headers = {"X-Total-Count": str(listing.total), "Cache-Control": "no-store"}
+        
+        if settings.FAST_JSON_RESPONSES:
+            return FastJSONResponse(content=listing.notes, headers=headers)
+        response.headers.update(headers)
+        return listing.notes
+    except ValueError as e:
+        # Missing password or tokens, or a query without any searchable word
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search notes: {str(e)}"
+        )
+
+@router.post("/batch", response_model=List[NoteBatchResult])
+async def batch_user_notes(
+    batch: NoteBatchRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Apply up to 100 create/update/delete operations in one request.
+    
+    Ownership of all referenced notes is checked in a single read and all
+    writes are committed together. Each operation gets its own result with
+    an HTTP-style status (201, 200, 204, 400 or 404). If another request
+    changed one of the notes in the meantime, nothing is written and the
+    batch fails with 409.
+    """
+    try:
+        return await apply_note_batch(current_user.id, batch.operations)
+    except VersionConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{str(e)}; retry the batch"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply note batch: {str(e)}"
+        )
+
+@router.get("/export")
+async def export_notes(current_user: User = Depends(get_current_user)):
+    """
+    Export all notes of the current user as NDJSON (one Note per line).
+    
+    Encrypted notes are exported as stored (ciphertext and salt), so the
+    file can be re-imported with POST /notes/import.
+    """
+    return StreamingResponse(
+        export_user_notes(current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'}
+    )
+
+@router.post("/import", response_model=NoteImportResult)
+async def import_notes(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Import notes from an NDJSON request body in the format written by /notes/export.
+    
+    Notes are written in batches; sensitivity analysis of imported plaintext
+    notes without a score runs in the background after the response.
+    """
+    try:
+        result, pending_analysis = await import_user_notes(current_user.id, request.stream())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import notes: {str(e)}"
+        )
+    
+    if pending_analysis:
+        background_tasks.add_task(analyze_imported_notes, current_user.id, pending_analysis)
+    return result
+
+@router.get("/events")
+async def note_events(current_user: User = Depends(get_current_user)):
+    """
+    Stream changes to the current user's notes as Server-Sent Events (with NOTE_EVENTS enabled).
+    
+    A "ready" event opens the stream with the note list's ETag: refetch the
+    list if it differs from the one you hold (If-None-Match makes that a
+    304 otherwise). Each "note" event then carries the type of change
+    (created, updated, deleted, or analyzed when a deferred sensitivity
+    score lands), the note id, its new version and its sensitivity score.
+    "resync" means events were missed and the list should be refetched.
+    """
+    if not settings.NOTE_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note events are not enabled"
+        )
+    return StreamingResponse(
+        stream_note_events(current_user.id),
+        media_type="text/event-stream",
+        # Proxies such as nginx must pass the events on as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{note_id}", response_model=Note)
 async def read_user_note(
     note_id: str,
+    response: Response,
     decrypt_password: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None, description="ETag of a previously fetched version of the note"),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get a specific note for the current user.
     
     For encrypted notes, provide the decrypt_password as a query parameter to view decrypted content.
+    The ETag response header holds the note's version, for If-Match on updates;
+    with a matching If-None-Match the answer is an empty 304 and the note body is not read.
     """
     try:
+        if if_none_match:
+            etag = await get_note_etag(note_id, current_user.id)
+            if etag is not None and etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+        
         note = await get_note_by_id(note_id, current_user.id, decrypt_password)
         
         if not note:
@@ -79,6 +405,8 @@ async def read_user_note(
                         detail=f"Failed to decrypt note: {error_message}"
                     )
             
+        response.headers["ETag"] = version_etag(note.version)
+        response.headers["Cache-Control"] = CACHE_CONTROL
         return note
     except ValueError as e:
         # This is for decryption errors
@@ -95,25 +423,96 @@ async def read_user_note(
             detail=f"Failed to retrieve note: {str(e)}"
         )
 
+@router.get("/{note_id}/content")
+async def read_note_content(
+    note_id: str,
+    range: Optional[str] = Header(None, description="One byte range: bytes=first-last, bytes=first- or bytes=-suffix"),
+    if_range: Optional[str] = Header(None, description="ETag of the content the Range was computed on"),
+    if_none_match: Optional[str] = Header(None, description="ETag of previously fetched content"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream the stored content of a note as text (ciphertext for encrypted notes).
+    
+    Single byte ranges are served as 206 Partial Content, to resume a download
+    or page through a large note; the ETag is that of the content bytes, for
+    If-Range. Content stored in chunks (see CONTENT_CHUNK_THRESHOLD) is read
+    one chunk at a time and only for the chunks the range spans.
+    """
+    try:
+        content = await get_note_content(note_id, current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve note content: {str(e)}"
+        )
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
+        )
+    if if_none_match and etag_matches(if_none_match, content.etag):
+        return _not_modified(content.etag)
+    
+    headers = {"ETag": content.etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    status_code = status.HTTP_200_OK
+    start, end = 0, content.length - 1
+    # A Range computed on other content is ignored: If-Range compares strongly
+    if range and (not if_range or if_range.strip() == content.etag):
+        try:
+            requested = parse_range(range, content.length)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Range not satisfiable",
+                headers={"Content-Range": f"bytes */{content.length}"}
+            )
+        if requested is not None:
+            start, end = requested
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{content.length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_note_content(note_id, current_user.id, content, start, end),
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
 @router.put("/{note_id}", response_model=Note)
 async def update_user_note(
     note_id: str,
     note_update: NoteUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag of the note version this update is based on"),
     current_user: User = Depends(get_current_user)
 ):
     """
     Update a specific note for the current user.
     
     If updating an encrypted note or adding encryption, provide the encryption_password.
+    
+    Send the ETag of the version you edited as If-Match to get 412 instead of
+    overwriting someone else's change; the new ETag is returned.
     """
     try:
-        note = await update_note(note_id, current_user.id, note_update)
+        expected_version = parse_if_match(if_match) if if_match else None
+        note = await update_note(note_id, current_user.id, note_update, expected_version)
         if not note:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Note not found"
             )
+        response.headers["ETag"] = version_etag(note.version)
         return note
+    except VersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Note has been modified; fetch it again and retry"
+        )
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
     except ValueError as e:
         # This is for encryption errors
         raise HTTPException(
@@ -145,12 +544,79 @@ async def delete_user_note(
             detail=f"Failed to delete note: {str(e)}"
         )
 
+def _require_revisions() -> None:
+    if not settings.NOTE_REVISIONS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note revisions are not enabled"
+        )
+
+@router.get("/{note_id}/revisions", response_model=List[NoteRevision])
+async def read_note_revisions(
+    note_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List the recorded revisions of a note, newest first.
+    
+    Each revision is the title and content the note had at that version,
+    before an update replaced them. Encrypted versions are not recorded.
+    """
+    _require_revisions()
+    try:
+        revisions = await list_note_revisions(note_id, current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve note revisions: {str(e)}"
+        )
+    if revisions is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
+        )
+    return revisions
+
+@router.get("/{note_id}/revisions/{version}", response_model=NoteRevisionContent)
+async def read_note_revision(
+    note_id: str,
+    version: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Get one revision of a note with its content, rebuilt from the stored diffs."""
+    _require_revisions()
+    try:
+        revision = await get_note_revision(note_id, current_user.id, version)
+    except VersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Note is being modified; retry"
+        )
+    except ValueError as e:
+        # Its diffs no longer apply to the current note
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve note revision: {str(e)}"
+        )
+    if revision is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Revision not found"
+        )
+    return revision
+
 @router.post("/{note_id}/recreate", response_model=Note, status_code=status.HTTP_201_CREATED)
 async def recreate_note(
     note_id: str,
     note_create: NoteCreate,
     delete_original: bool = Query(False, description="Whether to delete the original note after recreation"),
     decrypt_password: Optional[str] = Query(None, description="Password to decrypt the original note if needed"),
+    idempotency_key: Optional[str] = Header(None, description="Client-chosen key under which a retry replays the first response"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -159,7 +625,7 @@ async def recreate_note(
     
     Optionally delete the original note after successful recreation.
     """
-    try:
+    async def recreate() -> Note:
         # First, get the original note with decryption if provided
         original_note = await get_note_by_id(
             note_id, 
@@ -186,6 +652,7 @@ async def recreate_note(
             "title": note_create.title if note_create.title is not None else original_note.title,
             "content": note_create.content if note_create.content is not None else original_note.content,
             "is_encrypted": note_create.is_encrypted,
+            "tags": note_create.tags or original_note.tags,
             "encryption_password": note_create.encryption_password
         }
         
@@ -195,8 +662,18 @@ async def recreate_note(
         # Optionally delete the original note
         if delete_original:
             await delete_note(note_id, current_user.id)
-            
+        
         return new_note
+
+    try:
+        if idempotency_key is not None:
+            async def recreate_once() -> Response:
+                return _created(await recreate())
+            fingerprint = request_fingerprint("recreate", note_id, delete_original, decrypt_password, note_create.model_dump(mode="json"))
+            return await _run_once(current_user.id, idempotency_key, fingerprint, recreate_once)
+        return await recreate()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from typing import List
 
-from app.services.user_service import create_user, get_user_by_id, update_user, delete_user
+from app.services.user_service import create_user, get_user_by_id, update_user, delete_user, purge_user_data
 from app.schemas.user import User, UserCreate, UserUpdate
 from app.core.security import get_current_user
 
@@ -61,11 +61,20 @@ async def update_user_me(
         )
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user_me(current_user: User = Depends(get_current_user)):
-    """Delete current user."""
+async def delete_user_me(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Delete current user.
+    
+    The account is gone when this returns; its notes are purged in the
+    background after the response.
+    """
     deleted = await delete_user(current_user.id)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
-        ) 
\ No newline at end of file
+        )
+    background_tasks.add_task(purge_user_data, current_user.id) 
\ No newline at end of file
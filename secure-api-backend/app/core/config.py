@@ -11,11 +11,91 @@ class Settings(BaseSettings):
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     PROJECT_NAME: str = "Secure Note API"
     
+    # Storage backend: "redis", or "memory" for in-process storage in tests and benchmarks
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "redis").lower()
+    
+    # Serve note listings and exports straight from stored records with orjson,
+    # skipping the per-note Note model round trip (output bytes are unchanged)
+    FAST_JSON_RESPONSES: bool = os.getenv("FAST_JSON_RESPONSES", "False").lower() == "true"
+    
+    # Encoding of newly written notes: "hash" (one string field per note field) or
+    # "packed" (compact msgpack record); notes in either encoding are always readable
+    NOTE_RECORD_CODEC: str = os.getenv("NOTE_RECORD_CODEC", "hash").lower()
+    # Compression of plaintext note content: "none", "zlib" or "zstd" (needs the
+    # zstandard package), for content of at least CONTENT_COMPRESSION_THRESHOLD bytes.
+    # Compressed content is marked per note, so changing these never breaks reads.
+    CONTENT_COMPRESSION: str = os.getenv("CONTENT_COMPRESSION", "none").lower()
+    CONTENT_COMPRESSION_THRESHOLD: int = int(os.getenv("CONTENT_COMPRESSION_THRESHOLD", 1024))
+    # 1-9 for zlib, 1-22 for zstd
+    CONTENT_COMPRESSION_LEVEL: int = int(os.getenv("CONTENT_COMPRESSION_LEVEL", 6))
+    # Store identical plaintext note bodies once per user, reference counted, and
+    # reuse their sensitivity analysis; notes stored either way are always readable
+    CONTENT_DEDUP: bool = os.getenv("CONTENT_DEDUP", "False").lower() == "true"
+    # Store note content of at least CONTENT_CHUNK_THRESHOLD bytes (0 = never) in
+    # CONTENT_CHUNK_SIZE-byte chunks, so GET /notes/{id}/content streams it and
+    # serves byte ranges without loading it whole; notes stored either way are
+    # always readable
+    CONTENT_CHUNK_THRESHOLD: int = int(os.getenv("CONTENT_CHUNK_THRESHOLD", 0))
+    CONTENT_CHUNK_SIZE: int = int(os.getenv("CONTENT_CHUNK_SIZE", 256 * 1024))
+
+    # Longest line (one note) POST /notes/import buffers; a longer line is
+    # reported as failed and ends the import
+    IMPORT_MAX_LINE_BYTES: int = int(os.getenv("IMPORT_MAX_LINE_BYTES", 16 * 1024 * 1024))
+
+    # Maintain a per-user full-text index of plaintext notes for GET /notes/search
+    # (run scripts.rebuild_note_indexes after turning it on for existing notes)
+    SEARCH_INDEX: bool = os.getenv("SEARCH_INDEX", "False").lower() == "true"
+    
+    # Maintain per-user indexes of notes by creation time, sensitivity and title
+    # for GET /notes?sort=&min_sensitivity= (run scripts.rebuild_note_indexes
+    # after turning it on for existing notes)
+    SORT_INDEXES: bool = os.getenv("SORT_INDEXES", "False").lower() == "true"
+
+    # Keep the previous titles and contents of plaintext notes for
+    # GET /notes/{id}/revisions, as diffs with a full snapshot every
+    # NOTE_REVISIONS_SNAPSHOT_INTERVAL revisions; the oldest revisions of a
+    # note are dropped beyond NOTE_REVISIONS_MAX of them or NOTE_REVISIONS_MAX_BYTES
+    NOTE_REVISIONS: bool = os.getenv("NOTE_REVISIONS", "False").lower() == "true"
+    NOTE_REVISIONS_MAX: int = int(os.getenv("NOTE_REVISIONS_MAX", 50))
+    NOTE_REVISIONS_MAX_BYTES: int = int(os.getenv("NOTE_REVISIONS_MAX_BYTES", 256 * 1024))
+    NOTE_REVISIONS_SNAPSHOT_INTERVAL: int = int(os.getenv("NOTE_REVISIONS_SNAPSHOT_INTERVAL", 10))
+
+    # Move notes neither written nor read for COLD_AFTER_DAYS days out of Redis,
+    # into compressed append-only segment files under COLD_SEGMENT_DIR (run
+    # scripts.tier_cold_notes periodically, on the API's host); a stub stays in
+    # Redis and opening or writing the note moves it back. Listings, search,
+    # export and /content read cold notes from their segment without moving
+    # them back (see app.services.tiering_service). Notes moved out stay
+    # readable with this off.
+    COLD_TIERING: bool = os.getenv("COLD_TIERING", "False").lower() == "true"
+    COLD_AFTER_DAYS: float = float(os.getenv("COLD_AFTER_DAYS", 30))
+    COLD_SEGMENT_DIR: str = os.getenv("COLD_SEGMENT_DIR", "cold_segments")
+    COLD_SEGMENT_MAX_BYTES: int = int(os.getenv("COLD_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+
+    # Publish a small event for every note write (Redis pub/sub) and stream a
+    # user's events on GET /notes/events; idle streams get a comment line
+    # every NOTE_EVENTS_HEARTBEAT_SECONDS so proxies keep them open
+    NOTE_EVENTS: bool = os.getenv("NOTE_EVENTS", "False").lower() == "true"
+    NOTE_EVENTS_HEARTBEAT_SECONDS: float = float(os.getenv("NOTE_EVENTS_HEARTBEAT_SECONDS", 15))
+
+    # Replay the response of POST /notes and POST /notes/{id}/recreate made with
+    # an Idempotency-Key already used in the last IDEMPOTENCY_TTL_SECONDS; a
+    # retry while the first request runs waits for it, up to
+    # IDEMPOTENCY_LOCK_SECONDS, after which the key is free to be retried
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+
     # Redis configs
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB: int = int(os.getenv("REDIS_DB", 0))
     REDIS_PASSWORD: Optional[str] = os.getenv("REDIS_PASSWORD", None)
+    # Connect to a Redis Cluster seeded from REDIS_HOST:REDIS_PORT (REDIS_DB is ignored)
+    REDIS_CLUSTER: bool = os.getenv("REDIS_CLUSTER", "False").lower() == "true"
+    # Comma-separated host:port list of read replicas of the primary (standalone mode only)
+    REDIS_REPLICAS: str = os.getenv("REDIS_REPLICAS", "")
+    # How long (seconds) a replica's replication offset is trusted before it is re-read
+    REDIS_REPLICA_OFFSET_TTL: float = float(os.getenv("REDIS_REPLICA_OFFSET_TTL", 0.1))
     
     # Security configs
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your_super_secret_key_for_jwt_tokens")
@@ -26,7 +106,9 @@ class Settings(BaseSettings):
     CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
     CORS_ALLOW_CREDENTIALS: bool = os.getenv("CORS_ALLOW_CREDENTIALS", "True").lower() == "true"
     CORS_ALLOW_METHODS: List[str] = os.getenv("CORS_ALLOW_METHODS", "GET,POST,PUT,DELETE,OPTIONS").split(",")
-    CORS_ALLOW_HEADERS: List[str] = os.getenv("CORS_ALLOW_HEADERS", "Authorization,Content-Type").split(",")
+    CORS_ALLOW_HEADERS: List[str] = os.getenv("CORS_ALLOW_HEADERS", "Authorization,Content-Type,Idempotency-Key").split(",")
+    # Response headers the frontend may read (pagination, caching, ranges, replays)
+    CORS_EXPOSE_HEADERS: List[str] = ["X-Next-Cursor", "X-Total-Count", "ETag", "Content-Range", "Idempotent-Replayed"]
     
     # Security headers config
     ENABLE_XSS_PROTECTION: bool = os.getenv("ENABLE_XSS_PROTECTION", "True").lower() == "true"
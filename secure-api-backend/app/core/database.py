@@ -1,41 +1,324 @@
+import itertools
+import time
 import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
 from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
 from app.core.config import settings
 
 # Redis key prefixes
 USER_PREFIX = "user:"
 NOTE_PREFIX = "note:"
 USER_NOTES_PREFIX = "user_notes:"
+USER_NOTES_VERSION_PREFIX = "user_notes_version:"
+NOTE_BODIES_PREFIX = "note_bodies:"
+NOTE_TERMS_PREFIX = "note_terms:"
+NOTE_TERM_LISTS_PREFIX = "note_term_lists:"
+NOTE_SEARCH_PREFIX = "note_search:"
+USER_NOTES_BY_PREFIX = "user_notes_by:"
+NOTE_SORT_TITLES_PREFIX = "note_sort_titles:"
+NOTE_TAGS_PREFIX = "note_tags:"
+USER_TAGS_PREFIX = "user_tags:"
+NOTE_REVISIONS_PREFIX = "note_revisions:"
+NOTE_CHUNKS_PREFIX = "note_chunks:"
+NOTE_ACCESS_PREFIX = "note_access:"
+NOTE_EVENTS_PREFIX = "note_events:"
+IDEMPOTENCY_PREFIX = "idempotency:"
+USER_PURGE_PREFIX = "user_purge:"
+# Deleted users whose data is still to be purged, scored by deletion time
+DELETED_USERS_KEY = "deleted_users"
+
+# Everything owned by one user carries the user id as a {hash tag}, so in
+# cluster mode the user hash, their notes and their note index share a slot
+# and can still be written in a single MULTI/EXEC.
+def user_key(user_id: str) -> str:
+    """Key of a user hash."""
+    return f"{USER_PREFIX}{{{user_id}}}"
+
+def note_key(user_id: str, note_id: str) -> str:
+    """Key of a note hash, co-located with its owner."""
+    return f"{NOTE_PREFIX}{{{user_id}}}:{note_id}"
+
+def user_notes_key(user_id: str) -> str:
+    """Key of a user's note index (sorted by last update)."""
+    return f"{USER_NOTES_PREFIX}{{{user_id}}}"
+
+def user_notes_version_key(user_id: str) -> str:
+    """Key of a user's note list version, bumped by every write to their notes."""
+    return f"{USER_NOTES_VERSION_PREFIX}{{{user_id}}}"
+
+def note_bodies_key(user_id: str) -> str:
+    """Key of a user's deduplicated note bodies (see CONTENT_DEDUP)."""
+    return f"{NOTE_BODIES_PREFIX}{{{user_id}}}"
+
+def note_terms_prefix(user_id: str) -> str:
+    """Prefix of a user's search postings: the key of term t is the prefix + t."""
+    return f"{NOTE_TERMS_PREFIX}{{{user_id}}}:"
+
+def note_term_lists_key(user_id: str) -> str:
+    """Key of the hash holding the search terms each of a user's notes is indexed under."""
+    return f"{NOTE_TERM_LISTS_PREFIX}{{{user_id}}}"
+
+def note_search_key(user_id: str, search_id: str) -> str:
+    """Key of a temporary search result set, co-located with the user's postings."""
+    return f"{NOTE_SEARCH_PREFIX}{{{user_id}}}:{search_id}"
+
+def user_notes_sort_key(user_id: str, order: str) -> str:
+    """Key of a user's secondary note index in the given order (see SORT_INDEXES)."""
+    return f"{USER_NOTES_BY_PREFIX}{{{user_id}}}:{order}"
+
+def note_sort_titles_key(user_id: str) -> str:
+    """Key of the hash holding each of a user's notes' member in their title index."""
+    return f"{NOTE_SORT_TITLES_PREFIX}{{{user_id}}}"
+
+def note_tags_prefix(user_id: str) -> str:
+    """Prefix of a user's tag sets: the key of the ids of notes tagged t is the prefix + t."""
+    return f"{NOTE_TAGS_PREFIX}{{{user_id}}}:"
+
+def note_revisions_key(user_id: str, note_id: str) -> str:
+    """Key of the revision history of a note (see NOTE_REVISIONS), co-located with it."""
+    return f"{NOTE_REVISIONS_PREFIX}{{{user_id}}}:{note_id}"
+
+def note_chunks_key(user_id: str, note_id: str) -> str:
+    """Key of the content chunks of a note (see CONTENT_CHUNK_THRESHOLD), co-located with it."""
+    return f"{NOTE_CHUNKS_PREFIX}{{{user_id}}}:{note_id}"
+
+def note_access_key(user_id: str) -> str:
+    """Key of the time each of a user's notes was last read (see COLD_TIERING)."""
+    return f"{NOTE_ACCESS_PREFIX}{{{user_id}}}"
+
+def note_events_channel(user_id: str) -> str:
+    """Pub/sub channel of a user's note events (see NOTE_EVENTS)."""
+    return f"{NOTE_EVENTS_PREFIX}{{{user_id}}}"
+
+def idempotency_record_key(user_id: str, key: str) -> str:
+    """Key of the record of a user's request made with an Idempotency-Key."""
+    return f"{IDEMPOTENCY_PREFIX}{{{user_id}}}:{key}"
+
+def user_tags_key(user_id: str) -> str:
+    """Key of a user's tags, scored by the number of notes carrying them."""
+    return f"{USER_TAGS_PREFIX}{{{user_id}}}"
+
+def user_purge_key(user_id: str) -> str:
+    """Key of the progress of the purge of a deleted user's notes."""
+    return f"{USER_PURGE_PREFIX}{{{user_id}}}"
+
+def username_key(username: str) -> str:
+    """Key of the username -> user id lookup."""
+    return f"{USER_PREFIX}username:{username}"
+
+def email_key(email: str) -> str:
+    """Key of the email -> user id lookup."""
+    return f"{USER_PREFIX}email:{email}"
+
+def build_redis_url(host: str, port: int) -> str:
+    """Build a connection URL for one Redis server."""
+    return f"redis://{':' + settings.REDIS_PASSWORD + '@' if settings.REDIS_PASSWORD else ''}{host}:{port}/{settings.REDIS_DB}"
+
+# Packed note records hold binary values: surrogate escapes let them pass
+# through decode_responses and be encoded back to the original bytes
+ENCODING_ERRORS = "surrogateescape"
 
 async def get_redis_pool():
     """Create and return a Redis connection pool."""
-    redis_url = f"redis://{':' + settings.REDIS_PASSWORD + '@' if settings.REDIS_PASSWORD else ''}{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
-    return redis.ConnectionPool.from_url(redis_url, decode_responses=True)
+    return redis.ConnectionPool.from_url(build_redis_url(settings.REDIS_HOST, settings.REDIS_PORT), decode_responses=True, encoding_errors=ENCODING_ERRORS)
+
+async def get_redis_cluster():
+    """Create and return a Redis Cluster client (it manages its own node pools)."""
+    cluster = RedisCluster(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True,
+        encoding_errors=ENCODING_ERRORS,
+    )
+    await cluster.initialize()
+    return cluster
+
+class ReplicaNode:
+    """A read replica and the replication offset it last reported."""
+
+    def __init__(self, address: str):
+        host, _, port = address.strip().partition(":")
+        self.address = address.strip()
+        self.pool = redis.ConnectionPool.from_url(build_redis_url(host, int(port or 6379)), decode_responses=True, encoding_errors=ENCODING_ERRORS)
+        self.offset = -1
+        self.checked_at = 0.0
+
+    async def refresh(self) -> None:
+        """Re-read the replica's offset; an unreachable replica reports -1."""
+        client = redis.Redis(connection_pool=self.pool)
+        try:
+            info = await client.info("replication")
+            self.offset = int(info.get("slave_repl_offset", -1))
+        except Exception:
+            self.offset = -1
+        finally:
+            self.checked_at = time.monotonic()
+            await client.aclose()
 
-# Global connection pool
+class ReadRouter:
+    """
+    Route reads to replicas while keeping read-your-writes consistency.
+
+    After a write, the primary's replication offset is remembered for each
+    session (user) that wrote. A read from that session only goes to a replica
+    whose applied offset has caught up with it; otherwise it falls back to the
+    primary. Offsets are tracked per process, so a session's reads are only
+    guaranteed consistent with writes served by the same worker.
+    """
+
+    # Upper bound on remembered sessions before settled entries are pruned
+    MAX_SESSIONS = 10000
+
+    def __init__(self, addresses: List[str], offset_ttl: float):
+        self.replicas = [ReplicaNode(address) for address in addresses]
+        self.offset_ttl = offset_ttl
+        self._round_robin = itertools.cycle(range(len(self.replicas)))
+        self._session_offsets: Dict[str, int] = {}
+
+    async def record_write(self, client, session_ids) -> None:
+        """Remember the primary offset that now covers the sessions' writes."""
+        info = await client.info("replication")
+        offset = int(info.get("master_repl_offset", 0))
+        for session_id in session_ids:
+            if offset > self._session_offsets.get(session_id, -1):
+                self._session_offsets[session_id] = offset
+        if len(self._session_offsets) > self.MAX_SESSIONS:
+            self._prune()
+
+    async def pool_for(self, session_id: Optional[str]):
+        """Return a replica pool that has applied the session's writes, if any."""
+        required = self._session_offsets.get(session_id, 0) if session_id else 0
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._round_robin)]
+            if time.monotonic() - replica.checked_at > self.offset_ttl:
+                await replica.refresh()
+            if replica.offset >= required and replica.offset >= 0:
+                return replica.pool
+        return None
+
+    def _prune(self) -> None:
+        """Forget sessions whose writes every replica has already applied."""
+        settled = min(replica.offset for replica in self.replicas)
+        self._session_offsets = {
+            session_id: offset
+            for session_id, offset in self._session_offsets.items()
+            if offset > settled
+        }
+
+    async def close(self) -> None:
+        for replica in self.replicas:
+            await replica.pool.disconnect()
+
+def get_read_router() -> Optional[ReadRouter]:
+    """Create the replica router if replicas are configured (standalone mode only)."""
+    addresses = [address for address in settings.REDIS_REPLICAS.split(",") if address.strip()]
+    if not addresses or settings.REDIS_CLUSTER:
+        return None
+    return ReadRouter(addresses, settings.REDIS_REPLICA_OFFSET_TTL)
+
+# Global connection pool (standalone) or cluster client (cluster mode)
 redis_pool = None
+redis_cluster = None
+read_router = None
 
 @asynccontextmanager
-async def get_redis_client():
-    """Get a Redis client from the connection pool."""
-    global redis_pool
+async def get_redis_client(read_only: bool = False, session_id: Optional[str] = None):
+    """
+    Get a Redis client from the connection pool.
+
+    Pass read_only=True for pure reads; when replicas are configured they may
+    be served by a replica that has caught up with session_id's last write.
+    """
+    global redis_pool, redis_cluster
+    if settings.REDIS_CLUSTER:
+        if redis_cluster is None:
+            redis_cluster = await get_redis_cluster()
+        # The cluster client is shared and must stay open
+        yield redis_cluster
+        return
+
     if redis_pool is None:
         redis_pool = await get_redis_pool()
-    
-    client = redis.Redis(connection_pool=redis_pool)
+
+    pool = redis_pool
+    if read_only and read_router is not None:
+        pool = await read_router.pool_for(session_id) or redis_pool
+
+    client = redis.Redis(connection_pool=pool)
     try:
         yield client
     finally:
-        await client.close()
+        await client.aclose()
+
+async def record_write(client, *session_ids: str) -> None:
+    """Note that the given sessions just wrote through the primary client."""
+    if read_router is not None:
+        await read_router.record_write(client, session_ids)
+
+def cross_slot_pipeline(client):
+    """
+    Pipeline for writes that touch keys of different users or lookups.
+
+    Standalone Redis keeps MULTI/EXEC; a cluster cannot run a transaction
+    across slots, so there the commands are only batched per node, and are
+    neither atomic nor applied in order.
+    """
+    return client.pipeline(transaction=not settings.REDIS_CLUSTER)
+
+async def write_in_order(client, *writes: Callable) -> None:
+    """
+    Apply writes that touch keys of different slots, each a function of a client.
+
+    Standalone Redis applies them in one MULTI/EXEC. In cluster mode they are
+    applied one by one, in the given order, so a failure part way (or a
+    crash) leaves the first ones applied and not the others: callers order
+    them so that any such prefix can be cleaned up later.
+    """
+    if settings.REDIS_CLUSTER:
+        for write in writes:
+            await write(client)
+        return
+    async with client.pipeline(transaction=True) as pipe:
+        for write in writes:
+            await write(pipe)
+        await pipe.execute()
+
+async def get_pubsub():
+    """
+    Open a pub/sub connection of its own.
+
+    In cluster mode it goes to the REDIS_HOST node: messages published on any
+    node of a cluster are delivered to the subscribers of every node.
+    """
+    global redis_pool
+    if settings.REDIS_CLUSTER:
+        client = redis.Redis.from_url(build_redis_url(settings.REDIS_HOST, settings.REDIS_PORT), decode_responses=True, encoding_errors=ENCODING_ERRORS)
+    else:
+        if redis_pool is None:
+            redis_pool = await get_redis_pool()
+        client = redis.Redis(connection_pool=redis_pool)
+    return client.pubsub(ignore_subscribe_messages=True)
 
 async def initialize_redis():
     """Initialize Redis connection at application startup."""
-    global redis_pool
-    redis_pool = await get_redis_pool()
-    
+    global redis_pool, redis_cluster, read_router
+    if settings.REDIS_CLUSTER:
+        redis_cluster = await get_redis_cluster()
+    else:
+        redis_pool = await get_redis_pool()
+        read_router = get_read_router()
+
 async def close_redis():
     """Close Redis connections at application shutdown."""
-    global redis_pool
+    global redis_pool, redis_cluster, read_router
     if redis_pool:
         await redis_pool.disconnect()
-        redis_pool = None 
\ No newline at end of file
+        redis_pool = None
+    if read_router:
+        await read_router.close()
+        read_router = None
+    if redis_cluster:
+        await redis_cluster.aclose()
+        redis_cluster = None
@@ -6,6 +6,7 @@ import uvicorn
 from app.api.api import api_router
 from app.core.config import settings
 from app.core.database import initialize_redis, close_redis
+from app.services.event_service import close_note_events
 from app.middlewares.rate_limiter import RateLimiter
 from app.middlewares.security import SecurityHeadersMiddleware
 
@@ -16,6 +17,7 @@ async def lifespan(app: FastAPI):
     await initialize_redis()
     yield
     # Shutdown events
+    await close_note_events()
     await close_redis()
 
 # Create FastAPI app
@@ -56,6 +58,7 @@ if settings.DEBUG:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=settings.CORS_EXPOSE_HEADERS,
     )
 else:
     app.add_middleware(
@@ -64,6 +67,7 @@ else:
         allow_credentials=settings.CORS_ALLOW_CREDENTIALS,
         allow_methods=settings.CORS_ALLOW_METHODS,
         allow_headers=settings.CORS_ALLOW_HEADERS,
+        expose_headers=settings.CORS_EXPOSE_HEADERS,
     )
 
 # Include API router
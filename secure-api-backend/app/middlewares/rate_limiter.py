@@ -3,10 +3,16 @@ from starlette.middleware.base import BaseHTTPMiddleware
 import time
 from typing import Dict, Optional, Callable, Union
 
+from app.core.config import settings
 from app.core.database import get_redis_client
 
 class RateLimiter(BaseHTTPMiddleware):
-    """Rate limiter middleware using Redis."""
+    """
+    Rate limiter middleware using Redis.
+    
+    With the in-memory storage backend the hits are counted in this
+    process instead, the same way.
+    """
     
     def __init__(
         self,
@@ -23,6 +29,9 @@ class RateLimiter(BaseHTTPMiddleware):
         self.prefix = prefix
         self.exempt_paths = exempt_paths or {}
         self.get_key = get_key or self._default_key_func
+        # key -> {hit timestamp: score}, for the in-memory storage backend
+        self._hits: Dict[str, Dict[str, int]] = {}
+        self._swept_at = 0
     
     async def dispatch(self, request: Request, call_next):
         """Handle request and check rate limits."""
@@ -32,15 +41,33 @@ class RateLimiter(BaseHTTPMiddleware):
         rate_limit_key = self.get_key(request)
         
         # Check and update rate limit
+        current_time = int(time.time())
+        window_start = current_time - self.window_seconds
+        
+        # Create a Redis key
+        key = f"{self.prefix}{rate_limit_key}"
+        
+        if settings.STORAGE_BACKEND == "memory":
+            hit_count = self._count_hit_in_memory(key, current_time, window_start)
+        else:
+            hit_count = await self._count_hit(key, current_time, window_start)
+        
+        # Check if rate limit is exceeded
+        if hit_count > self.requests_limit:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Please try again later.",
+                headers={"Retry-After": str(self.window_seconds)},
+            )
+        
+        # Process the request if rate limit is not exceeded
+        return await call_next(request)
+    
+    async def _count_hit(self, key: str, current_time: int, window_start: int) -> int:
+        """Record a hit in Redis and return the hits already in the window."""
         async with get_redis_client() as redis:
-            current_time = int(time.time())
-            window_start = current_time - self.window_seconds
-            
-            # Create a Redis key
-            key = f"{self.prefix}{rate_limit_key}"
-            
             # Use a Redis pipeline for atomic operations
-            async with redis.pipeline() as pipe:
+            async with redis.pipeline(transaction=True) as pipe:
                 # Remove any hits older than the window
                 await pipe.zremrangebyscore(key, 0, window_start)
                 
@@ -55,18 +82,20 @@ class RateLimiter(BaseHTTPMiddleware):
                 
                 # Execute pipeline and get results
                 results = await pipe.execute()
-                hit_count = results[1]
-            
-            # Check if rate limit is exceeded
-            if hit_count > self.requests_limit:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Rate limit exceeded. Please try again later.",
-                    headers={"Retry-After": str(self.window_seconds)},
-                )
-        
-        # Process the request if rate limit is not exceeded
-        return await call_next(request)
+                return results[1]
+    
+    def _count_hit_in_memory(self, key: str, current_time: int, window_start: int) -> int:
+        """Record a hit in this process and return the hits already in the window."""
+        # Once per window, drop the keys whose hits are all older than it, as Redis expires them
+        if current_time - self._swept_at >= self.window_seconds:
+            self._hits = {k: hits for k, hits in self._hits.items() if max(hits.values()) > window_start}
+            self._swept_at = current_time
+        hits = self._hits.setdefault(key, {})
+        for member in [m for m, score in hits.items() if score <= window_start]:
+            del hits[member]
+        hit_count = len(hits)
+        hits[str(current_time)] = current_time
+        return hit_count
     
     def _is_exempt(self, request: Request) -> bool:
         """Check if the path is exempt from rate limiting."""
@@ -1,112 +1,523 @@
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterable
+import hashlib
+import json
 import time
+import unicodedata
 import uuid
-from app.schemas.note import NoteCreate, Note, NoteUpdate, NoteSensitivity
-
-def create_note_dict(note_create: NoteCreate, user_id: str) -> Dict:
-    """Create a new note dictionary for Redis."""
-    now = time.time()
-    note_id = str(uuid.uuid4())
-    
-    # Create the base note dictionary
-    note_dict = {
-        "id": note_id,
-        "user_id": str(user_id),
-        "title": note_create.title or "",
-        "content": note_create.content or "",
-        "is_encrypted": str(bool(note_create.is_encrypted)),
-        "created_at": str(now),
-        "updated_at": str(now),
-        "sensitivity_score": "0",
-        "sensitivity_explanation": ""
-    }
-    
-    # Add salt if it exists (for encrypted notes)
-    # Check for salt in both object attributes and model_dump
-    if hasattr(note_create, "salt") and note_create.salt is not None:
-        note_dict["salt"] = str(note_create.salt)
-    elif isinstance(note_create.model_dump(), dict) and "salt" in note_create.model_dump() and note_create.model_dump().get("salt") is not None:
-        note_dict["salt"] = str(note_create.model_dump().get("salt"))
-    
-    # Ensure all values are strings
-    for key, value in list(note_dict.items()):
-        if value is None:
-            note_dict[key] = ""
-        elif not isinstance(value, str):
-            note_dict[key] = str(value)
-    
-    return note_dict
-
-def update_note_dict(note_dict: Dict, note_update: NoteUpdate) -> Dict:
-    """Update a note dictionary with new values."""
-    updated_dict = note_dict.copy()
-    updated_dict["updated_at"] = str(time.time())
-    
-    if note_update.title is not None:
-        updated_dict["title"] = note_update.title or ""
-    
-    if note_update.content is not None:
-        updated_dict["content"] = note_update.content or ""
-    
-    if note_update.is_encrypted is not None:
-        updated_dict["is_encrypted"] = str(bool(note_update.is_encrypted))
-    
-    # Add salt if it exists (for encrypted notes)
-    # Check for salt in both object attributes and model_dump
-    if hasattr(note_update, "salt") and note_update.salt is not None:
-        updated_dict["salt"] = str(note_update.salt)
-    elif isinstance(note_update.model_dump(exclude_unset=True), dict) and "salt" in note_update.model_dump(exclude_unset=True):
-        updated_dict["salt"] = str(note_update.model_dump(exclude_unset=True).get("salt") or "")
-    
-    # Ensure all values are strings for Redis
-    for key, value in list(updated_dict.items()):
-        if value is None:
-            updated_dict[key] = ""
-        elif not isinstance(value, str):
-            updated_dict[key] = str(value)
-    
-    return updated_dict
-
-def note_dict_to_schema(note_dict: Dict) -> Note:
-    """Convert a note dictionary to a Note schema."""
-    # Convert string booleans back to Python booleans
-    try:
-        is_encrypted = note_dict.get("is_encrypted", "False").lower() == "true"
-    except AttributeError:
-        # Handle case where is_encrypted might not be a string
-        is_encrypted = bool(note_dict.get("is_encrypted", False))
+import msgpack
+from app.core.config import settings
+from app.schemas.note import Note, NoteImport
+from app.utils.compression import compress_text, decompress_text, CODEC_IDS, CODEC_NAMES
+from app.utils.search import index_terms, encode_terms, blind_terms
+from app.utils.chunks import needs_chunks, split_content, format_layout
+
+# Encodings of a stored note hash (NOTE_RECORD_CODEC)
+HASH_CODEC = "hash"
+PACKED_CODEC = "packed"
+
+# The packed codec keeps these as plain hash fields, so scripts, version
+# checks and projections read them without decoding the record...
+PACKED_PLAIN_FIELDS = ("id", "user_id", "version", "tags")
+# ...and stores everything else in this field: a format byte followed by a
+# msgpack array of the PACKED_SLOTS values
+PACKED_FIELD = "rec"
+PACKED_FORMAT = 1
+PACKED_SLOTS = (
+    "title", "content", "is_encrypted", "created_at", "updated_at",
+    "salt", "sensitivity_score", "sensitivity_explanation",
+)
+
+# Compressed content (see CONTENT_COMPRESSION) is marked per note: in the hash
+# codec this field names the codec of the binary "content" value, in the
+# packed codec the content is a msgpack ext value whose type is the codec id
+CONTENT_CODEC_FIELD = "content_codec"
+
+# With CONTENT_DEDUP, plaintext content is stored once per user in a body
+# store keyed by its digest, and the note hash holds that digest in
+# BODY_FIELD. The BODY_STORE_FIELDS of a hash given to the repository are
+# moved to the body store (content and its codec are put back on read);
+# BODY_SENSITIVITY_FIELD carries the body's analysis for later notes to reuse.
+BODY_FIELD = "body"
+BODY_SENSITIVITY_FIELD = "body_sensitivity"
+BODY_STORE_FIELDS = ("content", CONTENT_CODEC_FIELD, BODY_SENSITIVITY_FIELD)
+
+# Content of at least CONTENT_CHUNK_THRESHOLD bytes is stored in chunks (see
+# app.utils.chunks) instead: the note hash holds their layout in CHUNKS_FIELD
+# (a plain field in both codecs, never deduplicated), and hashes given to the
+# repository carry the chunks in CHUNK_DATA_FIELD, which the repository
+# moves to the note's chunk hash (content is put back on read)
+CHUNKS_FIELD = "chunks"
+CHUNK_DATA_FIELD = "chunk_data"
+
+# A note moved out to a cold segment (see COLD_TIERING) is left in Redis as a
+# stub of its plain fields and the locator of its archived hash in this
+# field; the repository reads the archived hash back in its place, keeping
+# this field so callers can move the note back
+COLD_FIELD = "cold"
+
+# With SEARCH_INDEX, hashes given to the repository carry the note's encoded
+# search terms in this field (for encrypted notes only their blind index,
+# if any); the repository moves them to the user's search index
+SEARCH_TERMS_FIELD = "search_terms"
+
+# With SORT_INDEXES, hashes given to the repository carry the note's keys in
+# the secondary indexes in this field: (created_at, sensitivity_score, title
+# member); the repository moves them to the user's indexes
+SORT_KEYS_FIELD = "sort_keys"
+
+# With NOTE_REVISIONS, hashes of updated notes carry the revision they record
+# in this field: (revision hash fields to set, revision fields to drop), see
+# app.utils.revisions.record_revision; the repository writes them to the
+# note's revisions
+REVISION_FIELD = "revision"
+
+# Orders of a user's note listing: the main index (by last update) and the
+# secondary indexes. Titles sort ascending, the others newest/highest first.
+UPDATED_ORDER = "updated"
+CREATED_ORDER = "created"
+SENSITIVITY_ORDER = "sensitivity"
+TITLE_ORDER = "title"
+SECONDARY_ORDERS = (CREATED_ORDER, SENSITIVITY_ORDER, TITLE_ORDER)
+
+# A note's tags, comma-separated (tags never contain commas); WRITE_NOTES_SCRIPT
+# keeps the user's tag sets in line with this field
+TAGS_FIELD = "tags"
+TAG_SEPARATOR = ","
+
+# Blind index of an encrypted note: space-separated HMAC tokens of the words
+# of its plaintext, indexed instead of the words (plain field in both codecs)
+BLIND_INDEX_FIELD = "blind_index"
+
+class NoteRecord:
+    """
+    A stored note, parsed once from its Redis hash.
     
-    # Ensure created_at and updated_at are valid floats
-    try:
-        created_at = float(note_dict.get("created_at", time.time()))
-    except (ValueError, TypeError):
-        created_at = time.time()
+    Notes are handled as these slotted records between reading and writing
+    them, instead of string dicts that are re-parsed (and Pydantic models that
+    are re-validated) at every step. from_hash/to_hash convert to and from the
+    stored hash, in either codec.
+    
+    A record read from a packed hash is decoded lazily: id, user_id and
+    version are available at once, the packed fields are decoded when one of
+    them is first read (so read one before assigning any).
+    """
+    __slots__ = (
+        "id", "user_id", "title", "content", "is_encrypted", "created_at", "updated_at",
+        "salt", "sensitivity_score", "sensitivity_explanation", "version", "tags", "blind_index", "_packed",
+    )
+    
+    def __init__(self, id: str, user_id: str, title: str, content: str, is_encrypted: bool = False,
+                 created_at: float = 0.0, updated_at: float = 0.0, salt: Optional[str] = None,
+                 sensitivity_score: int = 0, sensitivity_explanation: str = "", version: int = 1,
+                 tags: Optional[List[str]] = None, blind_index: Optional[str] = None):
+        self.id = id
+        self.user_id = user_id
+        self.title = title
+        self.content = content
+        self.is_encrypted = is_encrypted
+        self.created_at = created_at
+        self.updated_at = updated_at
+        # Base64 salt of encrypted content; None when the hash has no salt field
+        self.salt = salt
+        self.sensitivity_score = sensitivity_score
+        self.sensitivity_explanation = sensitivity_explanation
+        # Bumped on every write; notes written before versioning read as 0
+        self.version = version
+        # Normalized tags (see normalize_tags), in the order they were given
+        self.tags = tags or []
+        # Blind index tokens of encrypted content, None when it has none
+        self.blind_index = blind_index
+        # Packed fields not decoded yet (see from_hash)
+        self._packed = None
+    
+    def __getattr__(self, name: str):
+        # Only reached for unset slots: decode the packed fields on first use
+        if name == "_packed" or self._packed is None:
+            raise AttributeError(name)
+        self._unpack()
+        return getattr(self, name)
+    
+    def _unpack(self) -> None:
+        """Decode the packed fields."""
+        packed, self._packed = self._packed, None
+        if packed[0] != PACKED_FORMAT:
+            raise ValueError(f"Unknown note record format: {packed[0]}")
+        (self.title, self.content, self.is_encrypted, self.created_at, self.updated_at,
+         self.salt, self.sensitivity_score, self.sensitivity_explanation) = msgpack.unpackb(packed[1:])
+        if isinstance(self.content, msgpack.ExtType):
+            self.content = decompress_text(CODEC_NAMES[self.content.code], self.content.data)
+    
+    @classmethod
+    def new(cls, user_id: str, title: str, content: str, is_encrypted: bool = False, salt: Optional[str] = None,
+            tags: Optional[List[str]] = None) -> "NoteRecord":
+        """Create the record of a new note."""
+        now = time.time()
+        return cls(
+            id=str(uuid.uuid4()),
+            user_id=str(user_id),
+            title=title or "",
+            content=content or "",
+            is_encrypted=bool(is_encrypted),
+            created_at=now,
+            updated_at=now,
+            salt=salt,
+            tags=normalize_tags(tags or []),
+        )
+    
+    @classmethod
+    def from_import(cls, note_import: NoteImport, user_id: str) -> "NoteRecord":
+        """Create a record from an imported note, keeping its stored form."""
+        created_at = note_import.created_at or time.time()
+        record = cls(
+            id=str(uuid.uuid4()),
+            user_id=str(user_id),
+            title=note_import.title,
+            content=note_import.content,
+            is_encrypted=bool(note_import.is_encrypted),
+            created_at=created_at,
+            updated_at=note_import.updated_at or created_at,
+            tags=normalize_tags(note_import.tags),
+        )
+        
+        # Encrypted content is imported as ciphertext, so it needs its salt
+        if note_import.is_encrypted:
+            record.salt = note_import.salt or ""
+        
+        if note_import.sensitivity is not None:
+            record.sensitivity_score = note_import.sensitivity.sensitivity_score
+            record.sensitivity_explanation = note_import.sensitivity.explanation
+        
+        return record
+    
+    @classmethod
+    def from_hash(cls, data: Dict[str, str]) -> "NoteRecord":
+        """Parse a stored note hash, in either codec."""
+        packed = data.get(PACKED_FIELD)
+        if packed is not None:
+            record = cls.__new__(cls)
+            record.id = data.get("id", "")
+            record.user_id = data.get("user_id", "")
+            record.version = note_version(data)
+            record.tags = _stored_tags(data)
+            record.blind_index = data.get(BLIND_INDEX_FIELD) or None
+            # Redis hands binary values back as surrogate-escaped str
+            record._packed = packed.encode("utf-8", "surrogateescape") if isinstance(packed, str) else packed
+            if BODY_FIELD in data or CHUNKS_FIELD in data:
+                # Content stored by reference or in chunks comes with the hash, not in the record
+                record._unpack()
+                record.content = _stored_content(data)
+            return record
+        
+        # Timestamps that are missing or invalid read as now
+        try:
+            created_at = float(data["created_at"])
+        except (KeyError, ValueError, TypeError):
+            created_at = time.time()
+        try:
+            updated_at = float(data["updated_at"])
+        except (KeyError, ValueError, TypeError):
+            updated_at = time.time()
         
+        return cls(
+            id=data.get("id", ""),
+            user_id=data.get("user_id", ""),
+            title=data.get("title", ""),
+            content=_stored_content(data),
+            is_encrypted=str(data.get("is_encrypted", "False")).lower() == "true",
+            created_at=created_at,
+            updated_at=updated_at,
+            salt=data.get("salt"),
+            sensitivity_score=int(data.get("sensitivity_score") or 0),
+            sensitivity_explanation=data.get("sensitivity_explanation", ""),
+            version=note_version(data),
+            tags=_stored_tags(data),
+            blind_index=data.get(BLIND_INDEX_FIELD) or None,
+        )
+    
+    def to_hash(self, codec: Optional[str] = None) -> Dict:
+        """
+        Encode the record as the hash stored in Redis.
+        
+        The codec defaults to NOTE_RECORD_CODEC: "hash" writes every field as
+        a string, "packed" writes the compact layout described above.
+        """
+        chunked = needs_chunks(self.content)
+        # Only plaintext is deduplicated: equal ciphertexts never occur
+        by_reference = settings.CONTENT_DEDUP and not self.is_encrypted and not chunked
+        packed = (codec or settings.NOTE_RECORD_CODEC) == PACKED_CODEC
+        if packed:
+            data = {
+                "id": self.id,
+                "user_id": self.user_id,
+                "version": str(self.version),
+                PACKED_FIELD: self.pack(include_content=not (by_reference or chunked)),
+            }
+        else:
+            data = {
+                "id": self.id,
+                "user_id": self.user_id,
+                "title": self.title,
+                "is_encrypted": str(self.is_encrypted),
+                "created_at": str(self.created_at),
+                "updated_at": str(self.updated_at),
+                "sensitivity_score": str(self.sensitivity_score),
+                "sensitivity_explanation": self.sensitivity_explanation,
+                "version": str(self.version),
+            }
+            if self.salt is not None:
+                data["salt"] = self.salt
+        
+        if chunked:
+            layout, chunks = split_content(self.content, compressible=not self.is_encrypted)
+            data[CHUNKS_FIELD] = format_layout(layout)
+            data[CHUNK_DATA_FIELD] = chunks
+        elif by_reference or not packed:
+            compressed = self._compressed_content()
+            data["content"] = compressed[1] if compressed else self.content
+            if compressed:
+                data[CONTENT_CODEC_FIELD] = compressed[0]
+        if by_reference:
+            data[BODY_FIELD] = content_digest(self.content)
+            data[BODY_SENSITIVITY_FIELD] = json.dumps([self.sensitivity_score, self.sensitivity_explanation])
+        if self.tags:
+            data[TAGS_FIELD] = TAG_SEPARATOR.join(self.tags)
+        # Only encrypted notes keep a blind index
+        blind_index = self.blind_index if self.is_encrypted else None
+        if blind_index:
+            data[BLIND_INDEX_FIELD] = blind_index
+        if settings.SORT_INDEXES:
+            data[SORT_KEYS_FIELD] = (self.created_at, self.sensitivity_score, title_sort_member(self.title, self.id))
+        if settings.SEARCH_INDEX:
+            if self.is_encrypted:
+                terms = blind_terms(blind_index.split()) if blind_index else {}
+            else:
+                terms = index_terms(self.title, self.content)
+            data[SEARCH_TERMS_FIELD] = encode_terms(terms)
+        return data
+    
+    def to_archive(self) -> Dict[str, str]:
+        """The note as archived in a cold segment: a hash-codec hash with the content inline, uncompressed."""
+        data = {
+            "id": self.id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "content": self.content,
+            "is_encrypted": str(self.is_encrypted),
+            "created_at": str(self.created_at),
+            "updated_at": str(self.updated_at),
+            "sensitivity_score": str(self.sensitivity_score),
+            "sensitivity_explanation": self.sensitivity_explanation,
+            "version": str(self.version),
+        }
+        if self.salt is not None:
+            data["salt"] = self.salt
+        if self.tags:
+            data[TAGS_FIELD] = TAG_SEPARATOR.join(self.tags)
+        if self.blind_index and self.is_encrypted:
+            data[BLIND_INDEX_FIELD] = self.blind_index
+        return data
+    
+    def to_cold_stub(self, locator: str) -> Dict[str, str]:
+        """The stub left in Redis for the note once archived at locator."""
+        data = {"id": self.id, "user_id": self.user_id, "version": str(self.version), COLD_FIELD: locator}
+        # Tag sets follow the tags field, so the stub keeps it
+        if self.tags:
+            data[TAGS_FIELD] = TAG_SEPARATOR.join(self.tags)
+        return data
+    
+    def _compressed_content(self):
+        """(codec, bytes) of the content as compressed for storage, None to store it as is."""
+        # Ciphertext does not compress, only plaintext is worth trying
+        return None if self.is_encrypted else compress_text(self.content)
+    
+    def pack(self, include_content: bool = True) -> bytes:
+        """Encode the packed fields (format byte + msgpack array); without content it packs as nil."""
+        if self._packed is not None and include_content:
+            # Never decoded, so unchanged
+            return self._packed
+        values = [getattr(self, slot) for slot in PACKED_SLOTS]
+        compressed = self._compressed_content() if include_content else None
+        if not include_content:
+            values[PACKED_SLOTS.index("content")] = None
+        elif compressed:
+            values[PACKED_SLOTS.index("content")] = msgpack.ExtType(CODEC_IDS[compressed[0]], compressed[1])
+        return bytes((PACKED_FORMAT,)) + msgpack.packb(values)
+    
+    def to_json(self) -> Dict:
+        """
+        Convert the record to the JSON-ready dict a Note serializes to.
+        
+        Encoding the result gives the same bytes as the Note response model,
+        without building and validating the model first.
+        """
+        # Fields in the order of the Note model
+        return {
+            "title": self.title,
+            "content": self.content,
+            "is_encrypted": self.is_encrypted,
+            "tags": list(self.tags),
+            "id": self.id,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            # Salt only belongs to encrypted notes
+            "salt": self.salt if self.is_encrypted else None,
+            "sensitivity": {
+                "sensitivity_score": self.sensitivity_score,
+                "explanation": self.sensitivity_explanation,
+            },
+            "version": self.version,
+        }
+    
+    def to_schema(self) -> Note:
+        """Convert the record to a Note schema."""
+        # Validating the plain dict (in pydantic-core) is cheaper than model_construct
+        return Note.model_validate(self.to_json())
+    
+    def to_projection(self, fields: Iterable[str]) -> Dict:
+        """Convert the record to a JSON-ready dict with only the selected fields."""
+        data = self.to_json()
+        data["sensitivity_score"] = self.sensitivity_score
+        return {field: data[field] for field in fields}
+    
+    def copy(self) -> "NoteRecord":
+        """Shallow copy of the record (all its values are immutable)."""
+        if self._packed is not None:
+            self._unpack()
+        clone = NoteRecord.__new__(NoteRecord)
+        for slot in NoteRecord.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        return clone
+    
+    def touch(self) -> None:
+        """Mark the record as updated now, as a new version."""
+        self.updated_at = time.time()
+        self.version += 1
+
+def note_version(note_dict: Dict) -> int:
+    """Version of a stored note; notes written before versioning count as 0."""
     try:
-        updated_at = float(note_dict.get("updated_at", time.time()))
+        return int(note_dict.get("version") or 0)
     except (ValueError, TypeError):
-        updated_at = time.time()
+        return 0
+
+def content_digest(content: str) -> str:
+    """Key of a plaintext body in the body store."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def title_sort_member(title: str, note_id: str) -> str:
+    """
+    Member of a note in its user's title index.
     
-    # Create sensitivity information
-    sensitivity = NoteSensitivity(
-        sensitivity_score=int(note_dict.get("sensitivity_score", 0)),
-        explanation=note_dict.get("sensitivity_explanation", "")
-    )
+    Members of that index all have score 0, so Redis orders them bytewise:
+    the case-folded, accent-free title, then the note id to break ties.
+    """
+    key = unicodedata.normalize("NFKD", title.casefold())
+    key = "".join(char for char in key if not unicodedata.combining(char))
+    return f"{key}\x00{note_id}"
+
+def title_member_note_id(member: str) -> str:
+    """Note id of a title index member."""
+    return member.rsplit("\x00", 1)[1]
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """Case-fold tags and drop duplicates, keeping their order."""
+    return list(dict.fromkeys(tag.strip().casefold() for tag in tags if tag.strip()))
+
+def _stored_tags(note_dict: Dict) -> List[str]:
+    value = note_dict.get(TAGS_FIELD)
+    return value.split(TAG_SEPARATOR) if value else []
+
+def _stored_content(note_dict: Dict) -> str:
+    """Content of a hash-codec note dict, decompressed if it was stored compressed."""
+    content = note_dict.get("content", "")
+    codec = note_dict.get(CONTENT_CODEC_FIELD)
+    if not codec:
+        return content
+    # Redis hands binary values back as surrogate-escaped str
+    if isinstance(content, str):
+        content = content.encode("utf-8", "surrogateescape")
+    return decompress_text(codec, content)
+
+def stale_fields(stored: Dict, note_hash: Dict) -> List[str]:
+    """Fields of a stored note hash that its new encoding no longer has, to delete on write."""
+    return [field for field in stored if field not in note_hash]
+
+# Stored hash fields behind each field that can be selected on note listings
+PROJECTION_FIELDS = {
+    "id": ["id"],
+    "user_id": ["user_id"],
+    "title": ["title"],
+    "content": ["content", CONTENT_CODEC_FIELD, BODY_FIELD, CHUNKS_FIELD],
+    "is_encrypted": ["is_encrypted"],
+    "tags": [TAGS_FIELD],
+    "created_at": ["created_at"],
+    "updated_at": ["updated_at"],
+    "salt": ["salt"],
+    "sensitivity": ["sensitivity_score", "sensitivity_explanation"],
+    "sensitivity_score": ["sensitivity_score"],
+    "version": ["version"],
+}
+
+# Fields of the NoteSummary listing view
+SUMMARY_FIELDS = ["id", "title", "is_encrypted", "created_at", "updated_at", "sensitivity_score"]
+
+def parse_projection(fields: str) -> List[str]:
+    """Parse a comma-separated ?fields= value, rejecting unknown fields."""
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in PROJECTION_FIELDS]
+    if unknown or not selected:
+        raise ValueError(f"Unknown note fields: {', '.join(unknown) or fields!r}. Allowed: {', '.join(PROJECTION_FIELDS)}")
+    return selected
+
+def projection_hash_fields(fields: Iterable[str]) -> List[str]:
+    """
+    Hash fields to read for a projection; "id" is always read to detect missing
+    notes, and COLD_FIELD to read cold notes from their segment.
+    
+    Fields that packed notes keep in PACKED_FIELD are read in both layouts,
+    so the projection works whichever codec wrote the note.
+    """
+    hash_fields = ["id", COLD_FIELD]
+    packed = False
+    for field in fields:
+        for hash_field in PROJECTION_FIELDS[field]:
+            if hash_field not in hash_fields:
+                hash_fields.append(hash_field)
+            packed = packed or hash_field not in PACKED_PLAIN_FIELDS
+    if packed:
+        hash_fields.append(PACKED_FIELD)
+    return hash_fields
+
+def note_dict_to_projection(note_dict: Dict, fields: Iterable[str]) -> Dict:
+    """Convert a (partial) note dictionary to a JSON-ready dict with only the selected fields."""
+    if PACKED_FIELD in note_dict:
+        return NoteRecord.from_hash(note_dict).to_projection(fields)
     
-    # Create base note fields with default values for missing fields
-    note_data = {
-        "id": note_dict.get("id", str(uuid.uuid4())),
-        "user_id": note_dict.get("user_id", ""),
-        "title": note_dict.get("title", ""),
-        "content": note_dict.get("content", ""),
-        "is_encrypted": is_encrypted,
-        "created_at": created_at,
-        "updated_at": updated_at,
-        "sensitivity": sensitivity
-    }
-    
-    # Add salt if it exists and the note is encrypted
-    if is_encrypted and "salt" in note_dict and note_dict.get("salt") is not None:
-        note_data["salt"] = note_dict.get("salt")
-    
-    return Note(**note_data) 
\ No newline at end of file
+    projection = {}
+    for field in fields:
+        if field in ("created_at", "updated_at"):
+            try:
+                projection[field] = float(note_dict.get(field, 0))
+            except (ValueError, TypeError):
+                projection[field] = 0.0
+        elif field == "is_encrypted":
+            projection[field] = str(note_dict.get(field, "False")).lower() == "true"
+        elif field == "sensitivity_score":
+            projection[field] = int(note_dict.get("sensitivity_score") or 0)
+        elif field == "version":
+            projection[field] = note_version(note_dict)
+        elif field == "sensitivity":
+            projection[field] = {
+                "sensitivity_score": int(note_dict.get("sensitivity_score") or 0),
+                "explanation": note_dict.get("sensitivity_explanation", ""),
+            }
+        elif field == "salt":
+            projection[field] = note_dict.get("salt") or None
+        elif field == "tags":
+            projection[field] = _stored_tags(note_dict)
+        elif field == "content":
+            projection[field] = _stored_content(note_dict)
+        else:
+            projection[field] = note_dict.get(field, "")
+    return projection
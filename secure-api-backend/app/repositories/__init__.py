@@ -0,0 +1,44 @@
+# Repositories package
+from app.core.config import settings
+from app.repositories.base import UserRepository, NoteRepository, IdempotencyRepository, PurgeProgress, VersionConflict
+
+# Backend instances, created on first use so the memory backend keeps its data
+_user_repository = None
+_note_repository = None
+_idempotency_repository = None
+
+def get_user_repository() -> UserRepository:
+    """Get the user repository for the configured STORAGE_BACKEND."""
+    global _user_repository
+    if _user_repository is None:
+        if settings.STORAGE_BACKEND == "memory":
+            from app.repositories.memory_repository import MemoryUserRepository
+            _user_repository = MemoryUserRepository()
+        else:
+            from app.repositories.redis_repository import RedisUserRepository
+            _user_repository = RedisUserRepository()
+    return _user_repository
+
+def get_note_repository() -> NoteRepository:
+    """Get the note repository for the configured STORAGE_BACKEND."""
+    global _note_repository
+    if _note_repository is None:
+        if settings.STORAGE_BACKEND == "memory":
+            from app.repositories.memory_repository import MemoryNoteRepository
+            _note_repository = MemoryNoteRepository()
+        else:
+            from app.repositories.redis_repository import RedisNoteRepository
+            _note_repository = RedisNoteRepository()
+    return _note_repository
+
+def get_idempotency_repository() -> IdempotencyRepository:
+    """Get the idempotency key repository for the configured STORAGE_BACKEND."""
+    global _idempotency_repository
+    if _idempotency_repository is None:
+        if settings.STORAGE_BACKEND == "memory":
+            from app.repositories.memory_repository import MemoryIdempotencyRepository
+            _idempotency_repository = MemoryIdempotencyRepository()
+        else:
+            from app.repositories.redis_repository import RedisIdempotencyRepository
+            _idempotency_repository = RedisIdempotencyRepository()
+    return _idempotency_repository
@@ -0,0 +1,281 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.models.note import UPDATED_ORDER
+
+class NotePage(NamedTuple):
+    """A page of notes read by keyset pagination."""
+    notes: List[Dict]
+    # Index position (score, note id) to continue from, None on the last page
+    next_position: Optional[Tuple[float, str]]
+    # Number of notes in the user's index
+    total: int
+    # The user's note list version when the page was read
+    version: int = 0
+
+class PurgeProgress(NamedTuple):
+    """Progress of the purge of a deleted user's notes."""
+    # Notes deleted so far
+    deleted: int
+    # Notes left in the user's index
+    remaining: int
+
+class VersionConflict(Exception):
+    """A conditional write found a note at a different version than expected."""
+
+    def __init__(self, note_id: str):
+        super().__init__(f"Note {note_id} was modified concurrently")
+        self.note_id = note_id
+
+class UserRepository(ABC):
+    """Storage for user records and their username/email lookups."""
+
+    @abstractmethod
+    async def username_exists(self, username: str) -> bool:
+        """Check whether a username is taken."""
+
+    @abstractmethod
+    async def email_exists(self, email: str) -> bool:
+        """Check whether an email is taken."""
+
+    @abstractmethod
+    async def create(self, user: Dict) -> None:
+        """Store a new user and index its username and email."""
+
+    @abstractmethod
+    async def get(self, user_id: str, consistent: bool = False) -> Optional[Dict]:
+        """Get a user record by ID (consistent=True reads from the primary)."""
+
+    @abstractmethod
+    async def get_by_username(self, username: str) -> Optional[Dict]:
+        """Get a user record by username."""
+
+    @abstractmethod
+    async def update(self, user: Dict, old_email: Optional[str] = None) -> None:
+        """Store an updated user, moving the email lookup if old_email is given."""
+
+    @abstractmethod
+    async def delete(self, user: Dict) -> None:
+        """
+        Delete a user and its lookups, and queue the purge of their notes.
+
+        Only the user record is removed here, so this costs the same however
+        many notes they have; NoteRepository.purge_notes deletes those later.
+        """
+
+    @abstractmethod
+    async def list_deleted(self, limit: int = 100) -> List[str]:
+        """Get the ids of deleted users whose notes are still queued for purge, oldest first."""
+
+    @abstractmethod
+    async def forget_deleted(self, user_id: str) -> None:
+        """Take a deleted user off the purge queue once their notes are purged."""
+
+class NoteRepository(ABC):
+    """
+    Storage for note records and each user's note index.
+
+    Records are flat dicts in the shape they are stored in Redis: values are
+    written as strings or bytes and read back as strings (binary values
+    surrogate-escaped, see NoteRecord.from_hash). The index orders a user's
+    notes by score (last update time). Every write of a note bumps its
+    "version" field (absent on notes written before versioning, which count
+    as version 0), and every write to a user's notes bumps the version of
+    their note list.
+
+    A record with a "body" digest keeps its content in the user's body store
+    (see BODY_STORE_FIELDS in app.models.note): writes move those fields
+    there and count the body's references, reads put the content back.
+    A record with "search_terms" is re-indexed under those terms in the
+    user's search index as part of its write; deleting a note unindexes it.
+    A record with a "revision" sets and drops those fields of the note's
+    revision hash (see REVISION_FIELD) in the same write; deleting a note
+    deletes its revisions. A record with "chunks" keeps its content in the
+    note's chunk hash, likewise written with it (see CHUNKS_FIELD).
+    A record with a "cold" locator is the stub of a note moved to a cold
+    segment (see COLD_FIELD): reads return the archived hash in its place,
+    and writing the full record over the stub moves the note back.
+    """
+
+    @abstractmethod
+    async def create(self, note: Dict, score: float) -> None:
+        """Store a new note and add it to its owner's index."""
+
+    @abstractmethod
+    async def create_many(self, notes: List[Tuple[Dict, float]]) -> None:
+        """Store several new (note, score) pairs in one batch."""
+
+    @abstractmethod
+    async def get(self, user_id: str, note_id: str, consistent: bool = False) -> Optional[Dict]:
+        """
+        Get a note record.
+
+        Pass consistent=True when the record is about to be modified, so the
+        read is never served by a lagging replica.
+        """
+
+    @abstractmethod
+    async def get_many(self, user_id: str, note_ids: List[str]) -> Dict[str, Dict]:
+        """Get several of a user's notes in one read (from the primary), keyed by id; missing ones are left out."""
+
+    @abstractmethod
+    async def get_revisions(self, user_id: str, note_id: str, fields: Iterable[str] = ()) -> Tuple[Optional[Dict], Dict[str, str]]:
+        """
+        Get a note with its revision index and the given revision fields, in one read from the primary.
+
+        Revisions are hash fields (see app.utils.revisions) written with the
+        note, so the two always match. Returns (None, {}) if the note does
+        not exist; missing revision fields are left out.
+        """
+
+    @abstractmethod
+    async def get_chunks(self, user_id: str, note_id: str, indexes: Iterable[int] = ()) -> Tuple[Optional[str], List[Optional[str]]]:
+        """
+        Get some content chunks of a note stored in chunks, with their layout in the same read.
+
+        Returns (layout, the chunks in the order of indexes); the layout is
+        None if the note's content is not stored in chunks or the note does
+        not exist (see app.utils.chunks).
+        """
+
+    @abstractmethod
+    async def record_access(self, user_id: str, note_id: str) -> None:
+        """Record that a note was just read, which keeps it out of cold storage (see COLD_TIERING)."""
+
+    @abstractmethod
+    async def list_idle(self, user_id: str, before: float) -> List[Tuple[str, float]]:
+        """
+        Get the (id, index score) of a user's notes neither written nor read since before, least recently updated first.
+
+        Notes already in cold storage are left out.
+        """
+
+    @abstractmethod
+    async def get_cold_locators(self, notes: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Get the cold segment locators of (user id, note id) pairs of any users, None for notes not in cold storage."""
+
+    @abstractmethod
+    async def get_body_sensitivity(self, user_id: str, digest: str) -> Optional[Dict]:
+        """Get the sensitivity analysis stored with one of a user's bodies, None if there is none."""
+
+    @abstractmethod
+    async def get_version(self, user_id: str, note_id: str) -> Optional[int]:
+        """Get just the version of a note, None if it does not exist."""
+
+    @abstractmethod
+    async def get_list_version(self, user_id: str) -> int:
+        """Get the version of a user's note list (0 before their first write)."""
+
+    @abstractmethod
+    async def list_page(self, user_id: str, skip: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> NotePage:
+        """
+        Get a page of a user's notes, most recently updated first, dropping dangling ids.
+
+        With fields, only those hash fields are read (they must include "id").
+        The page has no next_position; skip + limit continues it.
+        """
+
+    @abstractmethod
+    async def list_after(self, user_id: str, position: Optional[Tuple[float, str]], limit: int = 100, fields: Optional[List[str]] = None,
+                         order: str = UPDATED_ORDER, min_score: Optional[float] = None,
+                         tags: Optional[List[str]] = None, any_tag: bool = False) -> NotePage:
+        """
+        Get the notes that follow an index position, most recently updated first.
+
+        Position is the (score, note id) of the last entry already seen, or
+        None for the first page. Unlike skip/limit paging the cost does not
+        grow with depth and concurrent writes do not shift later pages.
+        Fields restricts the hash fields read, as for list_page.
+
+        Order picks a secondary index instead (see SORT_INDEXES): creation
+        time or sensitivity score, highest first, or title, A to Z, whose
+        positions are (0.0, title index member). With min_score (not for
+        titles) only entries scoring at least that much are listed and
+        counted in total.
+
+        With tags (not for titles), only notes carrying all of them, or any
+        with any_tag, are listed and counted; the filter runs on the index
+        and tag sets, so other notes are never read.
+        """
+
+    @abstractmethod
+    async def list_tags(self, user_id: str) -> List[Tuple[str, int]]:
+        """Get a user's tags with the number of notes carrying each, most used first."""
+
+    @abstractmethod
+    async def search(self, user_id: str, terms: List[str], last_word: Optional[str] = None, limit: int = 20) -> NotePage:
+        """
+        Get a user's notes indexed under all the terms and the last word, best match first.
+
+        The last word, if any, matches as a whole word or as the prefix of a
+        title word (see app.utils.search). Matches are ranked by the sum of their term
+        weights times each term's inverse document frequency; total is the
+        number of matches.
+        """
+
+    @abstractmethod
+    async def update(self, note: Dict, score: float, removed_fields: Iterable[str] = (), expected_version: Optional[int] = None) -> bool:
+        """
+        Store an updated note, dropping removed_fields, and re-score it in the index.
+
+        With expected_version, the write is a compare-and-set: it raises
+        VersionConflict unless the stored note is still at that version.
+        Returns False (and writes nothing) if the note no longer exists.
+        """
+
+    @abstractmethod
+    async def write_batch(self, user_id: str, saves: List[Tuple[Dict, float, List[str]]], deletes: List[str], expected_versions: Optional[Dict[str, int]] = None) -> None:
+        """
+        Atomically apply a batch of writes to one user's notes.
+
+        Saves are (note, score, removed_fields) tuples that create or update a
+        note as update() does; deletes are note ids to remove. Notes listed in
+        expected_versions must still exist at that version, otherwise nothing
+        is written and VersionConflict is raised.
+        """
+
+    @abstractmethod
+    async def delete(self, user_id: str, note_id: str) -> bool:
+        """Delete a note, remove it from the index and release its body."""
+
+    @abstractmethod
+    async def purge_notes(self, user_id: str, limit: int = 500) -> PurgeProgress:
+        """
+        Delete up to limit notes of a deleted user, with their search postings.
+
+        Each call is atomic and picks up where the last one stopped, so a
+        purge interrupted by a crash is resumed by calling it again. The call
+        that empties the index also drops the user's list version, body store
+        and every index of their notes. Bodies are not released one by one:
+        the whole store goes at the end.
+        """
+
+    @abstractmethod
+    async def get_purge_progress(self, user_id: str) -> PurgeProgress:
+        """Get how far the purge of a deleted user's notes has gone."""
+
+class IdempotencyRepository(ABC):
+    """
+    Records of requests made with an Idempotency-Key, per user and key.
+
+    A record is a flat dict of strings: the "fingerprint" of the request and
+    the "token" of the attempt that owns the key, then, once that attempt
+    has succeeded, its response ("status", "headers", "body"). Records
+    expire after the TTL they were last written with.
+    """
+
+    @abstractmethod
+    async def reserve(self, user_id: str, key: str, record: Dict[str, str], ttl: float) -> Optional[Dict[str, str]]:
+        """Store a record unless the key already has one; returns that one, or None once stored."""
+
+    @abstractmethod
+    async def get(self, user_id: str, key: str) -> Optional[Dict[str, str]]:
+        """Get the record of a key, None if there is none (or it expired)."""
+
+    @abstractmethod
+    async def complete(self, user_id: str, key: str, token: str, response: Dict[str, str], ttl: float) -> bool:
+        """Add the response to the record owned by token; False if another attempt owns the key now."""
+
+    @abstractmethod
+    async def release(self, user_id: str, key: str, token: str) -> None:
+        """Drop the record owned by token, so the request can be made again."""
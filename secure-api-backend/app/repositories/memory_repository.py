@@ -0,0 +1,503 @@
+import bisect
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.models.note import (
+    BODY_FIELD, BODY_SENSITIVITY_FIELD, BODY_STORE_FIELDS, CONTENT_CODEC_FIELD, SEARCH_TERMS_FIELD, SORT_KEYS_FIELD,
+    REVISION_FIELD, CHUNKS_FIELD, CHUNK_DATA_FIELD, COLD_FIELD, TAGS_FIELD, TAG_SEPARATOR,
+    UPDATED_ORDER, CREATED_ORDER, SENSITIVITY_ORDER, TITLE_ORDER, SECONDARY_ORDERS, title_member_note_id,
+)
+from app.utils.search import PREFIX_TERM, TOKEN_TERM, decode_terms, idf
+from app.utils.revisions import INDEX_FIELD as REVISION_INDEX_FIELD
+from app.utils.chunks import LAYOUT_FIELD as CHUNK_LAYOUT_FIELD, parse_layout, join_chunks
+from app.utils.segments import get_segment_store
+from app.repositories.base import UserRepository, NoteRepository, IdempotencyRepository, NotePage, PurgeProgress, VersionConflict
+
+def _project(record: Dict, fields: Optional[List[str]]) -> Dict:
+    """Copy a record, keeping only the given fields if any."""
+    if not fields:
+        return dict(record)
+    return {field: record[field] for field in fields if field in record}
+
+def _stored_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        # As decoded by the Redis pools (see database.ENCODING_ERRORS)
+        return value.decode("utf-8", "surrogateescape")
+    return str(value)
+
+def _stored(record: Dict) -> Dict:
+    """Copy a record the way Redis would hand it back: every value a string."""
+    return {key: _stored_value(value) for key, value in record.items()}
+
+class MemoryUserRepository(UserRepository):
+    """In-process user storage for tests and benchmarks."""
+
+    def __init__(self):
+        self.users: Dict[str, Dict] = {}
+        self.usernames: Dict[str, str] = {}
+        self.emails: Dict[str, str] = {}
+        # Deleted user id -> deletion time, until their notes are purged
+        self.deleted: Dict[str, float] = {}
+
+    async def username_exists(self, username: str) -> bool:
+        return username in self.usernames
+
+    async def email_exists(self, email: str) -> bool:
+        return email in self.emails
+
+    async def create(self, user: Dict) -> None:
+        self.users[user["id"]] = _stored(user)
+        self.usernames[user["username"]] = user["id"]
+        self.emails[user["email"]] = user["id"]
+
+    async def get(self, user_id: str, consistent: bool = False) -> Optional[Dict]:
+        user = self.users.get(user_id)
+        return dict(user) if user else None
+
+    async def get_by_username(self, username: str) -> Optional[Dict]:
+        user_id = self.usernames.get(username)
+        return await self.get(user_id) if user_id else None
+
+    async def update(self, user: Dict, old_email: Optional[str] = None) -> None:
+        if old_email is not None:
+            self.emails.pop(old_email, None)
+            self.emails[user["email"]] = user["id"]
+        self.users.setdefault(user["id"], {}).update(_stored(user))
+
+    async def delete(self, user: Dict) -> None:
+        self.usernames.pop(user["username"], None)
+        self.emails.pop(user["email"], None)
+        self.users.pop(user["id"], None)
+        self.deleted.setdefault(user["id"], time.time())
+
+    async def list_deleted(self, limit: int = 100) -> List[str]:
+        return sorted(self.deleted, key=self.deleted.get)[:limit]
+
+    async def forget_deleted(self, user_id: str) -> None:
+        self.deleted.pop(user_id, None)
+
+class MemoryNoteIndex:
+    """A user's note index: note ids kept sorted by (score, id), like a Redis ZSET."""
+
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.entries: List[tuple] = []
+
+    def add(self, note_id: str, score: float) -> None:
+        self.remove(note_id)
+        self.scores[note_id] = score
+        bisect.insort(self.entries, (score, note_id))
+
+    def remove(self, note_id: str) -> bool:
+        score = self.scores.pop(note_id, None)
+        if score is None:
+            return False
+        del self.entries[bisect.bisect_left(self.entries, (score, note_id))]
+        return True
+
+    def rev_range(self, start: int, stop: int) -> List[str]:
+        """Ids from highest score down, by inclusive rank (ZREVRANGE)."""
+        count = len(self.entries)
+        return [self.entries[count - 1 - rank][1] for rank in range(start, min(stop + 1, count))]
+
+    def rev_after(self, position: Optional[Tuple[float, str]], count: int) -> List[Tuple[float, str]]:
+        """Up to count (score, id) entries below position, highest first."""
+        end = len(self.entries) if position is None else bisect.bisect_left(self.entries, position)
+        return self.entries[max(0, end - count):end][::-1]
+
+    def after(self, position: Optional[Tuple[float, str]], count: int) -> List[Tuple[float, str]]:
+        """Up to count (score, id) entries above position, lowest first."""
+        start = 0 if position is None else bisect.bisect_right(self.entries, position)
+        return self.entries[start:start + count]
+
+    def count_from(self, min_score: float) -> int:
+        """Number of entries scoring at least min_score (ZCOUNT min +inf)."""
+        return len(self.entries) - bisect.bisect_left(self.entries, (min_score,))
+
+class MemoryNoteRepository(NoteRepository):
+    """In-process note storage for tests and benchmarks."""
+
+    def __init__(self):
+        self.notes: Dict[str, Dict[str, Dict]] = {}
+        self.indexes: Dict[str, MemoryNoteIndex] = {}
+        self.list_versions: Dict[str, int] = {}
+        # user id -> body digest -> stored body fields and reference count
+        self.bodies: Dict[str, Dict[str, Dict]] = {}
+        # user id -> search term -> note id -> weight, and note id -> its terms
+        self.postings: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.note_terms: Dict[str, Dict[str, Dict[str, float]]] = {}
+        # user id -> order -> secondary index, and note id -> its title index member
+        self.sort_indexes: Dict[str, Dict[str, MemoryNoteIndex]] = {}
+        self.sort_titles: Dict[str, Dict[str, str]] = {}
+        # user id -> tag -> ids of the notes carrying it
+        self.tags: Dict[str, Dict[str, set]] = {}
+        # user id -> note id -> revision hash (see app.utils.revisions)
+        self.revisions: Dict[str, Dict[str, Dict[str, str]]] = {}
+        # user id -> note id -> chunk hash (see app.utils.chunks)
+        self.chunks: Dict[str, Dict[str, Dict[str, str]]] = {}
+        # user id -> note id -> last read time
+        self.access: Dict[str, Dict[str, float]] = {}
+        # deleted user id -> notes purged so far
+        self.purged: Dict[str, int] = {}
+
+    def _bump_list(self, user_id: str) -> None:
+        self.list_versions[user_id] = self.list_versions.get(user_id, 0) + 1
+
+    async def create(self, note: Dict, score: float) -> None:
+        self._save(note, score, ())
+
+    async def create_many(self, notes: List[Tuple[Dict, float]]) -> None:
+        for note, score in notes:
+            await self.create(note, score)
+
+    async def get(self, user_id: str, note_id: str, consistent: bool = False) -> Optional[Dict]:
+        note = self.notes.get(user_id, {}).get(note_id)
+        return self._resolve_body(user_id, dict(note)) if note else None
+
+    async def get_revisions(self, user_id: str, note_id: str, fields: Iterable[str] = ()) -> Tuple[Optional[Dict], Dict[str, str]]:
+        note = await self.get(user_id, note_id)
+        if note is None:
+            return None, {}
+        revisions = self.revisions.get(user_id, {}).get(note_id, {})
+        return note, {field: revisions[field] for field in [REVISION_INDEX_FIELD, *fields] if field in revisions}
+
+    async def get_many(self, user_id: str, note_ids: List[str]) -> Dict[str, Dict]:
+        notes = self.notes.get(user_id, {})
+        return {note_id: self._resolve_body(user_id, dict(notes[note_id])) for note_id in note_ids if note_id in notes}
+
+    async def get_chunks(self, user_id: str, note_id: str, indexes: Iterable[int] = ()) -> Tuple[Optional[str], List[Optional[str]]]:
+        chunks = self.chunks.get(user_id, {}).get(note_id, {})
+        return chunks.get(CHUNK_LAYOUT_FIELD), [chunks.get(str(index)) for index in indexes]
+
+    async def record_access(self, user_id: str, note_id: str) -> None:
+        self.access.setdefault(user_id, {})[note_id] = time.time()
+
+    async def list_idle(self, user_id: str, before: float) -> List[Tuple[str, float]]:
+        index = self.indexes.get(user_id)
+        if index is None:
+            return []
+        notes = self.notes.get(user_id, {})
+        read_times = self.access.get(user_id, {})
+        return [
+            (note_id, score) for score, note_id in index.entries
+            if score < before and read_times.get(note_id, 0.0) < before and not notes.get(note_id, {}).get(COLD_FIELD)
+        ]
+
+    async def get_cold_locators(self, notes: List[Tuple[str, str]]) -> List[Optional[str]]:
+        return [self.notes.get(user_id, {}).get(note_id, {}).get(COLD_FIELD) for user_id, note_id in notes]
+
+    def _resolve_body(self, user_id: str, note: Dict) -> Dict:
+        """Put the content of a note stored by reference or in chunks back into its dict, reading cold notes from disk."""
+        if note.get(COLD_FIELD):
+            locator = note[COLD_FIELD]
+            note.clear()
+            note.update(get_segment_store().read(locator))
+            note[COLD_FIELD] = locator
+        if note.get(CHUNKS_FIELD):
+            chunks = self.chunks[user_id][note["id"]]
+            layout = parse_layout(chunks[CHUNK_LAYOUT_FIELD])
+            note["content"] = join_chunks(layout, [chunks[str(i)] for i in range(layout.count)])
+        if note.get(BODY_FIELD):
+            body = self.bodies[user_id][note[BODY_FIELD]]
+            note["content"] = body.get("content", "")
+            if CONTENT_CODEC_FIELD in body:
+                note[CONTENT_CODEC_FIELD] = body[CONTENT_CODEC_FIELD]
+        return note
+
+    async def get_body_sensitivity(self, user_id: str, digest: str) -> Optional[Dict]:
+        stored = self.bodies.get(user_id, {}).get(digest, {}).get(BODY_SENSITIVITY_FIELD)
+        if not stored:
+            return None
+        score, explanation = json.loads(stored)
+        return {"sensitivity_score": score, "explanation": explanation}
+
+    async def get_version(self, user_id: str, note_id: str) -> Optional[int]:
+        note = self.notes.get(user_id, {}).get(note_id)
+        return int(note.get("version") or 0) if note else None
+
+    async def get_list_version(self, user_id: str) -> int:
+        return self.list_versions.get(user_id, 0)
+
+    async def list_page(self, user_id: str, skip: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> NotePage:
+        index = self.indexes.get(user_id)
+        if index is None:
+            return NotePage([], None, 0, self.list_versions.get(user_id, 0))
+        notes = self.notes.get(user_id, {})
+        page = []
+        for note_id in index.rev_range(skip, skip + limit - 1):
+            if note_id in notes:
+                page.append(self._resolve_body(user_id, _project(notes[note_id], fields)))
+            else:
+                # Drop index entries whose note no longer exists
+                index.remove(note_id)
+                self._bump_list(user_id)
+        return NotePage(page, None, len(index.entries), self.list_versions.get(user_id, 0))
+
+    async def list_after(self, user_id: str, position: Optional[Tuple[float, str]], limit: int = 100, fields: Optional[List[str]] = None,
+                         order: str = UPDATED_ORDER, min_score: Optional[float] = None,
+                         tags: Optional[List[str]] = None, any_tag: bool = False) -> NotePage:
+        index = self.indexes.get(user_id) if order == UPDATED_ORDER else self.sort_indexes.get(user_id, {}).get(order)
+        if index is None:
+            return NotePage([], None, 0, self.list_versions.get(user_id, 0))
+        if order == TITLE_ORDER:
+            entries = index.after(position, limit + 1)
+            total = len(index.entries)
+        elif tags:
+            tagged = self._tagged(user_id, tags, any_tag)
+            matching = [entry for entry in reversed(index.entries) if entry[1] in tagged and (min_score is None or entry[0] >= min_score)]
+            total = len(matching)
+            if position is not None:
+                matching = [entry for entry in matching if entry < position]
+            entries = matching[:limit + 1]
+        else:
+            entries = index.rev_after(position, limit + 1)
+            if min_score is not None:
+                entries = [entry for entry in entries if entry[0] >= min_score]
+            total = len(index.entries) if min_score is None else index.count_from(min_score)
+        page = entries[:limit]
+        note_ids = [title_member_note_id(member) if order == TITLE_ORDER else member for _, member in page]
+        notes = self.notes.get(user_id, {})
+        next_position = page[-1] if len(entries) > limit else None
+        return NotePage([self._resolve_body(user_id, _project(notes[note_id], fields)) for note_id in note_ids if note_id in notes], next_position, total, self.list_versions.get(user_id, 0))
+
+    async def update(self, note: Dict, score: float, removed_fields: Iterable[str] = (), expected_version: Optional[int] = None) -> bool:
+        user_id = note["user_id"]
+        if expected_version is not None:
+            stored = self.notes.get(user_id, {}).get(note["id"])
+            if stored is None:
+                return False
+            self._check_version(note["id"], stored, expected_version)
+        self._save(note, score, removed_fields)
+        return True
+
+    async def write_batch(self, user_id: str, saves: List[Tuple[Dict, float, List[str]]], deletes: List[str], expected_versions: Optional[Dict[str, int]] = None) -> None:
+        # Check every expectation before writing anything, like the Redis script
+        notes = self.notes.get(user_id, {})
+        for note_id, expected_version in (expected_versions or {}).items():
+            if note_id not in notes:
+                raise VersionConflict(note_id)
+            self._check_version(note_id, notes[note_id], expected_version)
+        for note, score, removed_fields in saves:
+            self._save(note, score, removed_fields)
+        for note_id in deletes:
+            await self.delete(user_id, note_id)
+
+    def _check_version(self, note_id: str, stored: Dict, expected_version: int) -> None:
+        if int(stored.get("version") or 0) != expected_version:
+            raise VersionConflict(note_id)
+
+    def _save(self, note: Dict, score: float, removed_fields: Iterable[str]) -> None:
+        user_id = note["user_id"]
+        stored = self.notes.setdefault(user_id, {}).setdefault(note["id"], {})
+        terms = note.get(SEARCH_TERMS_FIELD)
+        sort_keys = note.get(SORT_KEYS_FIELD)
+        revision = note.get(REVISION_FIELD)
+        chunks = note.get(CHUNK_DATA_FIELD)
+        note = _stored({field: value for field, value in note.items() if field not in (SEARCH_TERMS_FIELD, SORT_KEYS_FIELD, REVISION_FIELD, CHUNK_DATA_FIELD)})
+        old_body = stored.get(BODY_FIELD)
+        old_tags = stored.pop(TAGS_FIELD, None)
+        body = note.get(BODY_FIELD)
+        if body:
+            # Same reference counting as WRITE_NOTES_SCRIPT
+            body_fields = {field: note.pop(field) for field in BODY_STORE_FIELDS if field in note}
+            removed_fields = list(removed_fields) + list(BODY_STORE_FIELDS)
+            if body != old_body:
+                self._acquire_body(user_id, body, body_fields)
+            elif BODY_SENSITIVITY_FIELD in body_fields:
+                self.bodies[user_id][body].setdefault(BODY_SENSITIVITY_FIELD, body_fields[BODY_SENSITIVITY_FIELD])
+        for field in removed_fields:
+            stored.pop(field, None)
+        stored.update(note)
+        # Same chunk replacement as WRITE_NOTES_SCRIPT
+        layout = note.get(CHUNKS_FIELD)
+        user_chunks = self.chunks.setdefault(user_id, {})
+        if not layout:
+            user_chunks.pop(note["id"], None)
+        elif user_chunks.get(note["id"], {}).get(CHUNK_LAYOUT_FIELD) != layout:
+            user_chunks[note["id"]] = {CHUNK_LAYOUT_FIELD: layout, **{str(i): _stored_value(chunk) for i, chunk in enumerate(chunks)}}
+        if old_body and old_body != body:
+            self._release_body(user_id, old_body)
+        # Tag sets follow the tags field, which a write without it removes
+        self._retag(user_id, note["id"], old_tags, note.get(TAGS_FIELD))
+        if terms is not None:
+            self._unindex(user_id, note["id"])
+            self._index(user_id, note["id"], decode_terms(terms))
+        if sort_keys is not None:
+            self._sort(user_id, note["id"], sort_keys)
+        if revision is not None:
+            revisions = self.revisions.setdefault(user_id, {}).setdefault(note["id"], {})
+            revisions.update(_stored(revision[0]))
+            for field in revision[1]:
+                revisions.pop(field, None)
+        self.indexes.setdefault(user_id, MemoryNoteIndex()).add(note["id"], score)
+        self._bump_list(user_id)
+
+    def _index(self, user_id: str, note_id: str, terms: Dict[str, float]) -> None:
+        postings = self.postings.setdefault(user_id, {})
+        for term, weight in terms.items():
+            postings.setdefault(term, {})[note_id] = weight
+        if terms:
+            self.note_terms.setdefault(user_id, {})[note_id] = terms
+
+    def _unindex(self, user_id: str, note_id: str) -> None:
+        postings = self.postings.get(user_id, {})
+        for term in self.note_terms.get(user_id, {}).pop(note_id, {}):
+            postings[term].pop(note_id, None)
+            if not postings[term]:
+                del postings[term]
+
+    def _tagged(self, user_id: str, tags: List[str], any_tag: bool) -> set:
+        """Ids of the notes carrying all (or any) of the tags."""
+        sets = [self.tags.get(user_id, {}).get(tag, set()) for tag in tags]
+        return set.union(*sets) if any_tag else set.intersection(*sets)
+
+    def _retag(self, user_id: str, note_id: str, old_value: Optional[str], new_value: Optional[str]) -> None:
+        old = set(old_value.split(TAG_SEPARATOR)) if old_value else set()
+        new = set(new_value.split(TAG_SEPARATOR)) if new_value else set()
+        tags = self.tags.setdefault(user_id, {})
+        for tag in old - new:
+            tags[tag].discard(note_id)
+            if not tags[tag]:
+                del tags[tag]
+        for tag in new - old:
+            tags.setdefault(tag, set()).add(note_id)
+
+    async def list_tags(self, user_id: str) -> List[Tuple[str, int]]:
+        counts = [(tag, len(note_ids)) for tag, note_ids in self.tags.get(user_id, {}).items()]
+        # Same order as ZRANGE ... REV: count, then tag, both descending
+        return sorted(counts, key=lambda item: (item[1], item[0]), reverse=True)
+
+    def _sort(self, user_id: str, note_id: str, sort_keys: tuple) -> None:
+        indexes = self.sort_indexes.setdefault(user_id, {order: MemoryNoteIndex() for order in SECONDARY_ORDERS})
+        created_at, sensitivity_score, member = sort_keys
+        indexes[CREATED_ORDER].add(note_id, float(created_at))
+        indexes[SENSITIVITY_ORDER].add(note_id, float(sensitivity_score))
+        titles = self.sort_titles.setdefault(user_id, {})
+        if titles.get(note_id) != member:
+            if note_id in titles:
+                indexes[TITLE_ORDER].remove(titles[note_id])
+            indexes[TITLE_ORDER].add(member, 0.0)
+            titles[note_id] = member
+
+    def _unsort(self, user_id: str, note_id: str) -> None:
+        indexes = self.sort_indexes.get(user_id)
+        if indexes is None:
+            return
+        indexes[CREATED_ORDER].remove(note_id)
+        indexes[SENSITIVITY_ORDER].remove(note_id)
+        member = self.sort_titles[user_id].pop(note_id, None)
+        if member is not None:
+            indexes[TITLE_ORDER].remove(member)
+
+    async def search(self, user_id: str, terms: List[str], last_word: Optional[str] = None, limit: int = 20) -> NotePage:
+        postings = self.postings.get(user_id, {})
+        total_notes = len(self.indexes[user_id].entries) if user_id in self.indexes else 0
+        version = self.list_versions.get(user_id, 0)
+        # Same ranking as the Redis implementation
+        weighted = [(postings.get(term, {}), idf(len(postings.get(term, {})), total_notes)) for term in terms]
+        if last_word:
+            last = dict(postings.get(PREFIX_TERM + last_word, {}))
+            for note_id, weight in postings.get(TOKEN_TERM + last_word, {}).items():
+                last[note_id] = max(weight, last.get(note_id, 0.0))
+            last_count = len(postings.get(TOKEN_TERM + last_word, {})) + len(postings.get(PREFIX_TERM + last_word, {}))
+            weighted.append((last, idf(last_count, total_notes)))
+        if not weighted or any(not matches for matches, _ in weighted):
+            return NotePage([], None, 0, version)
+        note_ids = set.intersection(*(set(matches) for matches, _ in weighted))
+        scores = {note_id: sum(matches[note_id] * weight for matches, weight in weighted) for note_id in note_ids}
+        ranked = sorted(scores, key=lambda note_id: (scores[note_id], note_id), reverse=True)[:limit]
+        notes = self.notes.get(user_id, {})
+        return NotePage([self._resolve_body(user_id, dict(notes[note_id])) for note_id in ranked if note_id in notes], None, len(scores), version)
+
+    def _acquire_body(self, user_id: str, digest: str, body_fields: Dict) -> None:
+        body = self.bodies.setdefault(user_id, {}).get(digest)
+        if body is None:
+            self.bodies[user_id][digest] = dict(body_fields, refs=1)
+        else:
+            body["refs"] += 1
+            if BODY_SENSITIVITY_FIELD in body_fields:
+                body.setdefault(BODY_SENSITIVITY_FIELD, body_fields[BODY_SENSITIVITY_FIELD])
+
+    def _release_body(self, user_id: str, digest: str) -> None:
+        body = self.bodies[user_id][digest]
+        body["refs"] -= 1
+        if body["refs"] <= 0:
+            del self.bodies[user_id][digest]
+
+    async def delete(self, user_id: str, note_id: str) -> bool:
+        note = self.notes.get(user_id, {}).pop(note_id, None)
+        deleted = note is not None
+        if deleted and note.get(BODY_FIELD):
+            self._release_body(user_id, note[BODY_FIELD])
+        self._unindex(user_id, note_id)
+        self._unsort(user_id, note_id)
+        if deleted:
+            self._retag(user_id, note_id, note.get(TAGS_FIELD), None)
+        self.revisions.get(user_id, {}).pop(note_id, None)
+        self.chunks.get(user_id, {}).pop(note_id, None)
+        self.access.get(user_id, {}).pop(note_id, None)
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.remove(note_id)
+        self._bump_list(user_id)
+        return deleted
+
+    async def purge_notes(self, user_id: str, limit: int = 500) -> PurgeProgress:
+        index = self.indexes.get(user_id, MemoryNoteIndex())
+        notes = self.notes.get(user_id, {})
+        # Lowest scores first, like ZRANGE
+        for _, note_id in index.entries[:limit]:
+            if notes.pop(note_id, None) is not None:
+                self.purged[user_id] = self.purged.get(user_id, 0) + 1
+            self._unindex(user_id, note_id)
+            self.revisions.get(user_id, {}).pop(note_id, None)
+            self.chunks.get(user_id, {}).pop(note_id, None)
+            index.remove(note_id)
+        deleted = self.purged.get(user_id, 0)
+        remaining = len(index.entries)
+        if not remaining:
+            for store in (self.notes, self.indexes, self.list_versions, self.bodies, self.postings, self.note_terms,
+                          self.sort_indexes, self.sort_titles, self.tags, self.revisions, self.chunks, self.access, self.purged):
+                store.pop(user_id, None)
+        return PurgeProgress(deleted, remaining)
+
+    async def get_purge_progress(self, user_id: str) -> PurgeProgress:
+        index = self.indexes.get(user_id)
+        return PurgeProgress(self.purged.get(user_id, 0), len(index.entries) if index else 0)
+
+class MemoryIdempotencyRepository(IdempotencyRepository):
+    """In-process idempotency key records for tests and benchmarks."""
+
+    def __init__(self):
+        # (user id, key) -> (record, expiry time)
+        self.records: Dict[Tuple[str, str], Tuple[Dict[str, str], float]] = {}
+
+    async def reserve(self, user_id: str, key: str, record: Dict[str, str], ttl: float) -> Optional[Dict[str, str]]:
+        existing = await self.get(user_id, key)
+        if existing is not None:
+            return existing
+        self.records[(user_id, key)] = (dict(record), time.time() + ttl)
+        return None
+
+    async def get(self, user_id: str, key: str) -> Optional[Dict[str, str]]:
+        record, expires_at = self.records.get((user_id, key), (None, 0.0))
+        if record is None or expires_at <= time.time():
+            self.records.pop((user_id, key), None)
+            return None
+        return dict(record)
+
+    async def complete(self, user_id: str, key: str, token: str, response: Dict[str, str], ttl: float) -> bool:
+        record = await self.get(user_id, key)
+        if record is None or record.get("token") != token:
+            return False
+        record.update(response)
+        self.records[(user_id, key)] = (record, time.time() + ttl)
+        return True
+
+    async def release(self, user_id: str, key: str, token: str) -> None:
+        record = await self.get(user_id, key)
+        if record is not None and record.get("token") == token:
+            del self.records[(user_id, key)]
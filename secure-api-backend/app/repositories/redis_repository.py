@@ -0,0 +1,1015 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.core.database import (
+    get_redis_client,
+    record_write,
+    cross_slot_pipeline,
+    write_in_order,
+    user_key,
+    username_key,
+    email_key,
+    note_key,
+    user_notes_key,
+    user_notes_version_key,
+    note_bodies_key,
+    note_terms_prefix,
+    note_term_lists_key,
+    note_search_key,
+    user_notes_sort_key,
+    note_sort_titles_key,
+    note_tags_prefix,
+    user_tags_key,
+    user_purge_key,
+    note_revisions_key,
+    note_chunks_key,
+    note_access_key,
+    idempotency_record_key,
+    DELETED_USERS_KEY,
+)
+from app.models.note import (
+    BODY_FIELD, BODY_SENSITIVITY_FIELD, BODY_STORE_FIELDS, CONTENT_CODEC_FIELD, SEARCH_TERMS_FIELD, SORT_KEYS_FIELD,
+    REVISION_FIELD, CHUNKS_FIELD, CHUNK_DATA_FIELD, COLD_FIELD, UPDATED_ORDER, CREATED_ORDER, SENSITIVITY_ORDER, TITLE_ORDER, SECONDARY_ORDERS, title_member_note_id,
+)
+from app.utils.search import PREFIX_TERM, TOKEN_TERM, idf
+from app.utils.revisions import INDEX_FIELD as REVISION_INDEX_FIELD
+from app.utils.chunks import LAYOUT_FIELD as CHUNK_LAYOUT_FIELD, parse_layout, join_chunks
+from app.utils.segments import get_segment_store
+from app.repositories.base import UserRepository, NoteRepository, IdempotencyRepository, NotePage, PurgeProgress, VersionConflict
+
+# Drop the username or email lookup KEYS[1] if it still points at user ARGV[1]
+DROP_LOOKUP_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class RedisUserRepository(UserRepository):
+    """
+    Users stored as Redis hashes with string lookup keys.
+
+    The username and email lookups are found by name, so they cannot share
+    the user's hash tag: with REDIS_CLUSTER a user's create, update and
+    delete are not atomic. They are written in an order whose every prefix
+    can be recovered (see write_in_order): the user hash is written before
+    its lookups and deleted before them, after the purge of their notes is
+    queued. A lookup left pointing at no user, or at a user holding another
+    name, is dropped when it is next checked (see _lookup_taken), and
+    purge_user_data finishes the delete of a queued user whose hash is
+    still there.
+    """
+
+    async def _lookup_taken(self, redis, key: str, field: str, value: str) -> bool:
+        """Whether a lookup points at a user holding its value; a lookup that does not is dropped."""
+        user_id = await redis.get(key)
+        if not user_id:
+            return False
+        if await redis.hget(user_key(user_id), field) == value:
+            return True
+        drop_lookup = redis.register_script(DROP_LOOKUP_SCRIPT)
+        await drop_lookup(keys=[key], args=[user_id])
+        return False
+
+    async def username_exists(self, username: str) -> bool:
+        async with get_redis_client() as redis:
+            return await self._lookup_taken(redis, username_key(username), "username", username)
+
+    async def email_exists(self, email: str) -> bool:
+        async with get_redis_client() as redis:
+            return await self._lookup_taken(redis, email_key(email), "email", email)
+
+    async def create(self, user: Dict) -> None:
+        async with get_redis_client() as redis:
+            # Store user data, then create indexes for fast lookups
+            await write_in_order(
+                redis,
+                lambda client: client.hset(user_key(user["id"]), mapping=user),
+                lambda client: client.set(username_key(user["username"]), user["id"]),
+                lambda client: client.set(email_key(user["email"]), user["id"]),
+            )
+            await record_write(redis, user["id"], user["username"])
+
+    async def get(self, user_id: str, consistent: bool = False) -> Optional[Dict]:
+        async with get_redis_client(read_only=not consistent, session_id=user_id) as redis:
+            return await redis.hgetall(user_key(user_id)) or None
+
+    async def get_by_username(self, username: str) -> Optional[Dict]:
+        async with get_redis_client(read_only=True, session_id=username) as redis:
+            user_id = await redis.get(username_key(username))
+            if not user_id:
+                return None
+            user = await redis.hgetall(user_key(user_id))
+            # A lookup left behind by a delete that stopped halfway
+            return user if user.get("username") == username else None
+
+    async def update(self, user: Dict, old_email: Optional[str] = None) -> None:
+        async with get_redis_client() as redis:
+            writes = [lambda client: client.hset(user_key(user["id"]), mapping=user)]
+            if old_email is not None:
+                # Move the email index once the user holds the new email
+                writes += [
+                    lambda client: client.delete(email_key(old_email)),
+                    lambda client: client.set(email_key(user["email"]), user["id"]),
+                ]
+            await write_in_order(redis, *writes)
+            await record_write(redis, user["id"], user["username"])
+
+    async def delete(self, user: Dict) -> None:
+        async with get_redis_client() as redis:
+            # Queue their notes for purge, then delete the user and their lookups
+            await write_in_order(
+                redis,
+                lambda client: client.zadd(DELETED_USERS_KEY, {user["id"]: time.time()}, nx=True),
+                lambda client: client.delete(user_key(user["id"])),
+                lambda client: client.delete(username_key(user["username"])),
+                lambda client: client.delete(email_key(user["email"])),
+            )
+            await record_write(redis, user["id"], user["username"])
+
+    async def list_deleted(self, limit: int = 100) -> List[str]:
+        async with get_redis_client() as redis:
+            return await redis.zrange(DELETED_USERS_KEY, 0, limit - 1)
+
+    async def forget_deleted(self, user_id: str) -> None:
+        async with get_redis_client() as redis:
+            await redis.zrem(DELETED_USERS_KEY, user_id)
+
+# Lua prologue of the scripts that build keys from prefixes passed in
+# ARGV[1] to ARGV[SLOT_CHECKED_PREFIXES]: such keys are not declared in KEYS,
+# which Redis Cluster only serves from the slot of the declared ones. Every
+# prefix must carry the hash tag of KEYS[1] ("{<user id>}"), so all the keys
+# built from it hash to the same slot; the script refuses to run otherwise.
+SLOT_CHECK = """
+local function outside_slot(count)
+    local tag = string.match(KEYS[1], '{[^}]*}')
+    for i = 1, count do
+        if tag == nil or tag == '{}' or string.match(ARGV[i], '{[^}]*}') ~= tag then
+            return ARGV[i]
+        end
+    end
+end
+local misplaced = outside_slot(SLOT_CHECKED_PREFIXES)
+if misplaced then
+    return redis.error_reply('Key prefix ' .. misplaced .. ' is outside the slot of ' .. KEYS[1])
+end
+"""
+
+def _with_slot_check(prefixes: int, script: str) -> str:
+    """Prepend SLOT_CHECK, for the prefixes in the first ARGV items, to a script."""
+    return SLOT_CHECK.replace("SLOT_CHECKED_PREFIXES", str(prefixes)) + script
+
+# Compare-and-set writes of one user's notes. KEYS[1] is the user's note
+# index, KEYS[2] their note list version, KEYS[3] their body store, KEYS[4]
+# the search terms of each of their notes, KEYS[5] to KEYS[7] their indexes
+# by creation time, sensitivity and title, KEYS[8] the title index member of
+# each of their notes, KEYS[9] their tag counts, KEYS[10] the time each of
+# their notes was last read and KEYS[i + 10] the key of the i-th note written. ARGV[1] is the prefix of the user's search postings,
+# ARGV[2] the prefix of their tag sets, ARGV[3] the prefix of their notes'
+# revisions, ARGV[4] the prefix of their notes' content chunks, then ARGV
+# holds, per note: id, expected version ("" to skip the check), index
+# score, "1" to delete it, the number of fields to drop and those fields, the
+# number of field/value items to set and those items, the digest of the body
+# it references ("" for none), the number of body items and those items
+# (store field prefix, value), and finally "1" and its encoded search terms
+# to re-index it, or "0" and "" to leave its search postings alone, and
+# "1", its creation time, sensitivity score and title index member to
+# update its secondary indexes, or "0" and three "" to leave them alone, and
+# the number of revision hash items to set and those items, then the
+# number of revision fields to drop and those fields, and last the number of
+# content chunks of the note and those chunks.
+# Every expectation is checked before anything is written.
+#
+# Bodies are reference counted under "r:<digest>" in the body store. A body
+# gains a reference when a note starts pointing at it (its items are stored
+# if it is new; only a missing sensitivity "s" is filled in otherwise) and
+# loses one when the note is deleted or moves to another body; it is removed
+# with its last reference.
+#
+# A note's search postings are ZSETs (note id -> weight) under the posting
+# prefix plus the term, listed per note in KEYS[4] so they can be removed
+# when it is re-indexed or deleted. They share the user's hash tag, so they
+# live in the script's slot (as do the tag sets, revisions and chunks; see
+# SLOT_CHECK).
+#
+# A note's id is in the SET of each tag listed in its "tags" field (prefix +
+# tag), and KEYS[9] counts the notes per tag. Sets follow the field as it is
+# written; a write without the field removes it from the note.
+#
+# A note's revisions (see NOTE_REVISIONS) are a hash under the revision
+# prefix plus its id, written with the update that records one and deleted
+# with the note.
+#
+# A note whose content is stored in chunks has their layout in its "chunks"
+# field; the chunks are a hash under the chunk prefix plus its id, holding
+# the layout under "m" and chunk i under i. They are replaced when a write
+# changes the layout (the layout names the content's digest, so unchanged
+# content is not written again) and deleted by a write without the field
+# and with the note.
+#
+# The title index has score 0 for every member (see title_sort_member), so a
+# note's previous member is kept in KEYS[8] to be removed when it changes.
+#
+# Returns {0, deleted notes} on success, {1, i} if note i is at another
+# version and {2, i} if note i no longer exists.
+WRITE_NOTES_SCRIPT = _with_slot_check(4, """
+local ops = {}
+local pos = 5
+for i = 11, #KEYS do
+    local op = {key = KEYS[i], id = ARGV[pos], expected = ARGV[pos + 1], score = ARGV[pos + 2], delete = ARGV[pos + 3] == '1'}
+    local count = tonumber(ARGV[pos + 4])
+    op.removed = {unpack(ARGV, pos + 5, pos + 4 + count)}
+    pos = pos + 5 + count
+    count = tonumber(ARGV[pos])
+    op.fields = {unpack(ARGV, pos + 1, pos + count)}
+    pos = pos + 1 + count
+    op.body = ARGV[pos]
+    count = tonumber(ARGV[pos + 1])
+    op.body_items = {unpack(ARGV, pos + 2, pos + 1 + count)}
+    pos = pos + 2 + count
+    op.reindex = ARGV[pos] == '1'
+    op.terms = ARGV[pos + 1]
+    op.sort = ARGV[pos + 2] == '1'
+    op.created = ARGV[pos + 3]
+    op.sensitivity = ARGV[pos + 4]
+    op.title = ARGV[pos + 5]
+    pos = pos + 6
+    count = tonumber(ARGV[pos])
+    op.revision = {unpack(ARGV, pos + 1, pos + count)}
+    pos = pos + 1 + count
+    count = tonumber(ARGV[pos])
+    op.dropped_revisions = {unpack(ARGV, pos + 1, pos + count)}
+    pos = pos + 1 + count
+    count = tonumber(ARGV[pos])
+    op.chunks = {unpack(ARGV, pos + 1, pos + count)}
+    pos = pos + 1 + count
+    ops[#ops + 1] = op
+end
+
+for i, op in ipairs(ops) do
+    if op.expected ~= '' then
+        local version = redis.call('HGET', op.key, 'version')
+        if not version then
+            if redis.call('EXISTS', op.key) == 0 then
+                return {2, i}
+            end
+            version = '0'
+        end
+        if version ~= op.expected then
+            return {1, i}
+        end
+    end
+end
+
+local function store_body(digest, items, add_reference)
+    local created = add_reference and redis.call('HINCRBY', KEYS[3], 'r:' .. digest, 1) == 1
+    for j = 1, #items, 2 do
+        if created then
+            redis.call('HSET', KEYS[3], items[j] .. ':' .. digest, items[j + 1])
+        elseif items[j] == 's' then
+            redis.call('HSETNX', KEYS[3], 's:' .. digest, items[j + 1])
+        end
+    end
+end
+
+local function release_body(digest)
+    if redis.call('HINCRBY', KEYS[3], 'r:' .. digest, -1) <= 0 then
+        redis.call('HDEL', KEYS[3], 'r:' .. digest, 'c:' .. digest, 'z:' .. digest, 's:' .. digest)
+    end
+end
+
+local function unindex(id)
+    local terms = redis.call('HGET', KEYS[4], id)
+    if terms then
+        for term in string.gmatch(terms, '%S+') do
+            redis.call('ZREM', ARGV[1] .. term, id)
+        end
+        redis.call('HDEL', KEYS[4], id)
+    end
+end
+
+local function index(id, encoded)
+    local terms = {}
+    local term = nil
+    for item in string.gmatch(encoded, '%S+') do
+        if term then
+            redis.call('ZADD', ARGV[1] .. term, item, id)
+            terms[#terms + 1] = term
+            term = nil
+        else
+            term = item
+        end
+    end
+    if #terms > 0 then
+        redis.call('HSET', KEYS[4], id, table.concat(terms, ' '))
+    end
+end
+
+local function unsort_note(id)
+    redis.call('ZREM', KEYS[5], id)
+    redis.call('ZREM', KEYS[6], id)
+    local member = redis.call('HGET', KEYS[8], id)
+    if member then
+        redis.call('ZREM', KEYS[7], member)
+        redis.call('HDEL', KEYS[8], id)
+    end
+end
+
+local function sort_note(op)
+    redis.call('ZADD', KEYS[5], op.created, op.id)
+    redis.call('ZADD', KEYS[6], op.sensitivity, op.id)
+    local member = redis.call('HGET', KEYS[8], op.id)
+    if member ~= op.title then
+        if member then
+            redis.call('ZREM', KEYS[7], member)
+        end
+        redis.call('ZADD', KEYS[7], 0, op.title)
+        redis.call('HSET', KEYS[8], op.id, op.title)
+    end
+end
+
+local function tag_set(value)
+    local tags = {}
+    if value then
+        for tag in string.gmatch(value, '[^,]+') do
+            tags[tag] = true
+        end
+    end
+    return tags
+end
+
+local function retag(id, old_value, new_value)
+    local old, new = tag_set(old_value), tag_set(new_value)
+    for tag in pairs(old) do
+        if not new[tag] then
+            redis.call('SREM', ARGV[2] .. tag, id)
+            if tonumber(redis.call('ZINCRBY', KEYS[9], -1, tag)) <= 0 then
+                redis.call('ZREM', KEYS[9], tag)
+            end
+        end
+    end
+    for tag in pairs(new) do
+        if not old[tag] then
+            redis.call('SADD', ARGV[2] .. tag, id)
+            redis.call('ZINCRBY', KEYS[9], 1, tag)
+        end
+    end
+end
+
+local function field_value(fields, name)
+    for j = 1, #fields, 2 do
+        if fields[j] == name then
+            return fields[j + 1]
+        end
+    end
+    return nil
+end
+
+local function store_chunks(op)
+    local key = ARGV[4] .. op.id
+    local layout = field_value(op.fields, 'chunks')
+    if not layout then
+        redis.call('DEL', key)
+    elseif redis.call('HGET', key, 'm') ~= layout then
+        redis.call('DEL', key)
+        redis.call('HSET', key, 'm', layout)
+        for j, chunk in ipairs(op.chunks) do
+            redis.call('HSET', key, j - 1, chunk)
+        end
+    end
+end
+
+local deleted = 0
+for _, op in ipairs(ops) do
+    local old_body = redis.call('HGET', op.key, 'body')
+    local old_tags = redis.call('HGET', op.key, 'tags')
+    if op.delete then
+        deleted = deleted + redis.call('DEL', op.key)
+        redis.call('ZREM', KEYS[1], op.id)
+        unindex(op.id)
+        unsort_note(op.id)
+        retag(op.id, old_tags, nil)
+        redis.call('ZREM', KEYS[10], op.id)
+        redis.call('DEL', ARGV[3] .. op.id, ARGV[4] .. op.id)
+    else
+        if op.body ~= '' then
+            store_body(op.body, op.body_items, op.body ~= old_body)
+        end
+        if #op.removed > 0 then
+            redis.call('HDEL', op.key, unpack(op.removed))
+        end
+        redis.call('HSET', op.key, unpack(op.fields))
+        store_chunks(op)
+        local tags = field_value(op.fields, 'tags')
+        if old_tags and not tags then
+            redis.call('HDEL', op.key, 'tags')
+        end
+        if old_tags or tags then
+            retag(op.id, old_tags, tags)
+        end
+        redis.call('ZADD', KEYS[1], op.score, op.id)
+        if op.reindex then
+            unindex(op.id)
+            index(op.id, op.terms)
+        end
+        if op.sort then
+            sort_note(op)
+        end
+        if #op.revision > 0 then
+            redis.call('HSET', ARGV[3] .. op.id, unpack(op.revision))
+        end
+        if #op.dropped_revisions > 0 then
+            redis.call('HDEL', ARGV[3] .. op.id, unpack(op.dropped_revisions))
+        end
+    end
+    if old_body and old_body ~= op.body then
+        release_body(old_body)
+    end
+end
+redis.call('INCR', KEYS[2])
+return {0, deleted}
+""")
+
+# Purge one batch of a deleted user's notes. KEYS[1] is the user's note
+# index, KEYS[2] the search terms of each of their notes, KEYS[3] the purge
+# progress, KEYS[4] their note list version, KEYS[5] their body store,
+# KEYS[6] to KEYS[8] their secondary indexes, KEYS[9] the title index member
+# of each note, KEYS[10] their tag counts and KEYS[11] the time each note was
+# last read. ARGV[1] is the prefix of their note keys, ARGV[2] of their search
+# postings, ARGV[3] of their tag sets, ARGV[4] of their notes' revisions and
+# ARGV[5] of their notes' content chunks (all in the user's slot, see
+# SLOT_CHECK), and ARGV[6] the batch size.
+#
+# The first notes of the index are unlinked with their revisions, their
+# content chunks and the postings of their terms and taken off the index, so
+# a rerun continues with the next ones. Once the index is empty, every other
+# key of the user's notes is unlinked. UNLINK frees the values off the main
+# thread, so large bodies and indexes do not stall the server.
+#
+# Returns {notes deleted so far, notes left in the index}.
+PURGE_NOTES_SCRIPT = _with_slot_check(5, """
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[6]) - 1)
+local deleted = tonumber(redis.call('HGET', KEYS[3], 'deleted') or '0')
+if #ids > 0 then
+    local terms = {}
+    for _, id in ipairs(ids) do
+        deleted = deleted + redis.call('UNLINK', ARGV[1] .. id)
+        redis.call('UNLINK', ARGV[4] .. id, ARGV[5] .. id)
+        local listed = redis.call('HGET', KEYS[2], id)
+        if listed then
+            for term in string.gmatch(listed, '%S+') do
+                terms[term] = true
+            end
+        end
+    end
+    for term in pairs(terms) do
+        redis.call('UNLINK', ARGV[2] .. term)
+    end
+    redis.call('HDEL', KEYS[2], unpack(ids))
+    redis.call('ZREM', KEYS[1], unpack(ids))
+    redis.call('HSET', KEYS[3], 'deleted', deleted)
+end
+local remaining = redis.call('ZCARD', KEYS[1])
+if remaining == 0 then
+    for _, tag in ipairs(redis.call('ZRANGE', KEYS[10], 0, -1)) do
+        redis.call('UNLINK', ARGV[3] .. tag)
+    end
+    redis.call('UNLINK', KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], KEYS[7], KEYS[8], KEYS[9], KEYS[10], KEYS[11])
+end
+return {deleted, remaining}
+""")
+
+# The entries of index KEYS[1] after position (score ARGV[1], note id
+# ARGV[2]), highest score first, at most ARGV[3] of them, as a flat
+# member/score list. Members of equal score are in reverse byte order, so the
+# entries after the position are those of its score with a smaller id, then
+# those of lower scores. If the position's note still has that score its rank
+# is where they start; otherwise (deleted or rescored since) that rank is
+# found by a binary search among the members of the score. Either way a page
+# costs O(log n + count), however long the run of equal scores.
+INDEX_AFTER_SCRIPT = """
+local function bytes_less(a, b)
+    for i = 1, math.min(#a, #b) do
+        local x, y = string.byte(a, i), string.byte(b, i)
+        if x ~= y then
+            return x < y
+        end
+    end
+    return #a < #b
+end
+local first = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[1], '+inf')
+local last = first + redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+local start = redis.call('ZREVRANK', KEYS[1], ARGV[2])
+if start and start >= first and start < last then
+    start = start + 1
+else
+    local lo, hi = first, last
+    while lo < hi do
+        local mid = math.floor((lo + hi) / 2)
+        if bytes_less(redis.call('ZREVRANGE', KEYS[1], mid, mid)[1], ARGV[2]) then
+            hi = mid
+        else
+            lo = mid + 1
+        end
+    end
+    start = lo
+end
+return redis.call('ZREVRANGE', KEYS[1], start, start + tonumber(ARGV[3]) - 1, 'WITHSCORES')
+"""
+
+# Seconds a tag-filtered index is kept for the next pages of its listing
+TAGGED_INDEX_TTL = 30
+
+# Body store field prefixes of the fields a note moves there (see BODY_STORE_FIELDS)
+BODY_STORE_PREFIXES = {"content": "c", CONTENT_CODEC_FIELD: "z", BODY_SENSITIVITY_FIELD: "s"}
+
+def _write_op_args(note_id: str, expected_version: Optional[int], score: float = 0.0, note: Optional[Dict] = None, removed_fields: Iterable[str] = ()) -> List[Union[str, bytes]]:
+    """ARGV items of one note for WRITE_NOTES_SCRIPT; without a note it is deleted."""
+    removed_fields = list(removed_fields)
+    note = dict(note or {})
+    body = note.get(BODY_FIELD, "")
+    body_items = []
+    if body:
+        # The note keeps only the digest; its content lives in the body store
+        for field, prefix in BODY_STORE_PREFIXES.items():
+            if field in note:
+                body_items += [prefix, note.pop(field)]
+        removed_fields += [field for field in BODY_STORE_FIELDS if field not in removed_fields]
+    terms = note.pop(SEARCH_TERMS_FIELD, None)
+    sort_keys = note.pop(SORT_KEYS_FIELD, None)
+    revision_items, dropped_revisions = note.pop(REVISION_FIELD, None) or ({}, [])
+    revision_items = [item for pair in revision_items.items() for item in pair]
+    chunks = note.pop(CHUNK_DATA_FIELD, None) or []
+    # Binary values (packed records, compressed content) are passed through as they are
+    items = [item if isinstance(item, bytes) else str(item) for pair in note.items() for item in pair]
+    return [
+        note_id,
+        "" if expected_version is None else str(expected_version),
+        repr(score),
+        "0" if note else "1",
+        str(len(removed_fields)), *removed_fields,
+        str(len(items)), *items,
+        body,
+        str(len(body_items)), *body_items,
+        "0" if terms is None else "1", terms or "",
+        *(["0", "", "", ""] if sort_keys is None else ["1", repr(float(sort_keys[0])), str(sort_keys[1]), sort_keys[2]]),
+        str(len(revision_items)), *revision_items,
+        str(len(dropped_revisions)), *dropped_revisions,
+        str(len(chunks)), *chunks,
+    ]
+
+class RedisNoteRepository(NoteRepository):
+    """Notes stored as Redis hashes, indexed per user by a sorted set."""
+
+    async def create(self, note: Dict, score: float) -> None:
+        # Store the note, index it and take its body reference in one atomic step
+        await self._write_notes(note["user_id"], [note["id"]], _write_op_args(note["id"], None, score, note))
+
+    async def create_many(self, notes: List[Tuple[Dict, float]]) -> None:
+        by_user: Dict[str, List[Tuple[Dict, float]]] = {}
+        for note, score in notes:
+            by_user.setdefault(note["user_id"], []).append((note, score))
+        # Notes of one user share a slot, so each user's batch stays one script call
+        for user_id, user_notes in by_user.items():
+            args = []
+            for note, score in user_notes:
+                args += _write_op_args(note["id"], None, score, note)
+            await self._write_notes(user_id, [note["id"] for note, _ in user_notes], args)
+
+    async def get(self, user_id: str, note_id: str, consistent: bool = False) -> Optional[Dict]:
+        async with get_redis_client(read_only=not consistent, session_id=user_id) as redis:
+            note_data = await redis.hgetall(note_key(user_id, note_id))
+            if not note_data:
+                return None
+            await self._resolve_bodies(redis, user_id, [note_data])
+            return note_data
+
+    async def get_revisions(self, user_id: str, note_id: str, fields: Iterable[str] = ()) -> Tuple[Optional[Dict], Dict[str, str]]:
+        fields = [REVISION_INDEX_FIELD, *fields]
+        async with get_redis_client() as redis:
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.hgetall(note_key(user_id, note_id))
+                await pipe.hmget(note_revisions_key(user_id, note_id), fields)
+                note_data, values = await pipe.execute()
+            if not note_data:
+                return None, {}
+            await self._resolve_bodies(redis, user_id, [note_data])
+        return note_data, {field: value for field, value in zip(fields, values) if value is not None}
+
+    async def get_many(self, user_id: str, note_ids: List[str]) -> Dict[str, Dict]:
+        if not note_ids:
+            return {}
+        async with get_redis_client() as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                for note_id in note_ids:
+                    await pipe.hgetall(note_key(user_id, note_id))
+                results = await pipe.execute()
+            await self._resolve_bodies(redis, user_id, results)
+        return {note_id: note_data for note_id, note_data in zip(note_ids, results) if note_data}
+
+    async def get_chunks(self, user_id: str, note_id: str, indexes: Iterable[int] = ()) -> Tuple[Optional[str], List[Optional[str]]]:
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            layout, *chunks = await redis.hmget(note_chunks_key(user_id, note_id), [CHUNK_LAYOUT_FIELD, *map(str, indexes)])
+        return layout, chunks
+
+    async def record_access(self, user_id: str, note_id: str) -> None:
+        async with get_redis_client() as redis:
+            await redis.zadd(note_access_key(user_id), {note_id: time.time()})
+
+    async def list_idle(self, user_id: str, before: float) -> List[Tuple[str, float]]:
+        async with get_redis_client() as redis:
+            entries = await redis.zrangebyscore(user_notes_key(user_id), "-inf", f"({before!r}", withscores=True)
+            if not entries:
+                return []
+            note_ids = [note_id for note_id, _ in entries]
+            async with redis.pipeline(transaction=False) as pipe:
+                await pipe.zmscore(note_access_key(user_id), note_ids)
+                for note_id in note_ids:
+                    await pipe.hget(note_key(user_id, note_id), COLD_FIELD)
+                read_times, *locators = await pipe.execute()
+        return [
+            (note_id, score) for (note_id, score), read_at, locator in zip(entries, read_times, locators)
+            if locator is None and (read_at is None or read_at < before)
+        ]
+
+    async def get_cold_locators(self, notes: List[Tuple[str, str]]) -> List[Optional[str]]:
+        if not notes:
+            return []
+        async with get_redis_client() as redis:
+            async with cross_slot_pipeline(redis) as pipe:
+                for user_id, note_id in notes:
+                    await pipe.hget(note_key(user_id, note_id), COLD_FIELD)
+                return await pipe.execute()
+
+    async def _resolve_bodies(self, redis, user_id: str, note_dicts: List[Dict]) -> None:
+        """
+        Put the content of notes stored by reference or in chunks back into their dicts, in a round trip each.
+
+        Cold notes are first replaced by their archived hash, read from
+        disk off the event loop; they stay cold (see tiering_service).
+        """
+        cold = [note_data for note_data in note_dicts if note_data.get(COLD_FIELD)]
+        if cold:
+            archived = await asyncio.to_thread(get_segment_store().read_many, [note_data[COLD_FIELD] for note_data in cold])
+            for note_data, fields in zip(cold, archived):
+                locator = note_data[COLD_FIELD]
+                note_data.clear()
+                note_data.update(fields)
+                note_data[COLD_FIELD] = locator
+        chunked = [note_data for note_data in note_dicts if note_data.get(CHUNKS_FIELD)]
+        if chunked:
+            async with redis.pipeline(transaction=False) as pipe:
+                for note_data in chunked:
+                    await pipe.hgetall(note_chunks_key(user_id, note_data["id"]))
+                stored_chunks = await pipe.execute()
+            for note_data, chunks in zip(chunked, stored_chunks):
+                # Chunks rewritten since the note was read come with their own layout
+                layout = parse_layout(chunks[CHUNK_LAYOUT_FIELD]) if chunks else None
+                note_data["content"] = join_chunks(layout, [chunks[str(i)] for i in range(layout.count)]) if layout else ""
+        digests = list({note_data[BODY_FIELD] for note_data in note_dicts if note_data.get(BODY_FIELD)})
+        if not digests:
+            return
+        values = await redis.hmget(note_bodies_key(user_id), [f"{prefix}:{digest}" for digest in digests for prefix in ("c", "z")])
+        bodies = {digest: (values[2 * i], values[2 * i + 1]) for i, digest in enumerate(digests)}
+        for note_data in note_dicts:
+            if note_data.get(BODY_FIELD):
+                content, codec = bodies[note_data[BODY_FIELD]]
+                note_data["content"] = content or ""
+                if codec:
+                    note_data[CONTENT_CODEC_FIELD] = codec
+
+    async def get_body_sensitivity(self, user_id: str, digest: str) -> Optional[Dict]:
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            stored = await redis.hget(note_bodies_key(user_id), f"s:{digest}")
+        if not stored:
+            return None
+        score, explanation = json.loads(stored)
+        return {"sensitivity_score": score, "explanation": explanation}
+
+    async def get_version(self, user_id: str, note_id: str) -> Optional[int]:
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            # "id" tells a missing note from one written before versioning
+            stored_id, version = await redis.hmget(note_key(user_id, note_id), ["id", "version"])
+        return int(version or 0) if stored_id is not None else None
+
+    async def get_list_version(self, user_id: str) -> int:
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            return int(await redis.get(user_notes_version_key(user_id)) or 0)
+
+    async def list_page(self, user_id: str, skip: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> NotePage:
+        key = user_notes_key(user_id)
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            # Get note IDs from user's notes set, ordered by most recently updated,
+            # with the count and list version, in one round trip
+            async with redis.pipeline(transaction=False) as pipe:
+                await pipe.zrevrange(key, skip, skip + limit - 1)
+                await pipe.zcard(key)
+                await pipe.get(user_notes_version_key(user_id))
+                note_ids, total, version = await pipe.execute()
+            notes = await self._fetch(redis, user_id, note_ids, fields)
+        return NotePage(notes, None, total, int(version or 0))
+
+    async def list_after(self, user_id: str, position: Optional[Tuple[float, str]], limit: int = 100, fields: Optional[List[str]] = None,
+                         order: str = UPDATED_ORDER, min_score: Optional[float] = None,
+                         tags: Optional[List[str]] = None, any_tag: bool = False) -> NotePage:
+        if order == TITLE_ORDER:
+            return await self._list_titles_after(user_id, position, limit, fields)
+        key = user_notes_key(user_id) if order == UPDATED_ORDER else user_notes_sort_key(user_id, order)
+        if tags:
+            # The filtered index is written, so it needs the primary
+            async with get_redis_client() as redis:
+                key = await self._tagged_index(redis, user_id, key, tags, any_tag)
+                return await self._list_index_after(redis, user_id, key, position, limit, fields, min_score)
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            return await self._list_index_after(redis, user_id, key, position, limit, fields, min_score)
+
+    async def _list_index_after(self, redis, user_id: str, key: str, position: Optional[Tuple[float, str]], limit: int,
+                                fields: Optional[List[str]], min_score: Optional[float]) -> NotePage:
+        """list_after on one ZSET of note ids, highest score first, resuming after the position (see INDEX_AFTER_SCRIPT)."""
+        lowest = "-inf" if min_score is None else repr(float(min_score))
+        # The next limit+1 entries, plus the count and the list version, in one round trip
+        async with redis.pipeline(transaction=False) as pipe:
+            if position is None:
+                await pipe.zrange(key, "+inf", lowest, desc=True, byscore=True, offset=0, num=limit + 1, withscores=True)
+            else:
+                index_after = redis.register_script(INDEX_AFTER_SCRIPT)
+                await index_after(keys=[key], args=[repr(position[0]), position[1], limit + 1], client=pipe)
+            if min_score is None:
+                await pipe.zcard(key)
+            else:
+                await pipe.zcount(key, lowest, "+inf")
+            await pipe.get(user_notes_version_key(user_id))
+            entries, total, version = await pipe.execute()
+
+        if position is not None:
+            entries = [(member, float(score)) for member, score in zip(entries[::2], entries[1::2])]
+            if min_score is not None:
+                # The script ranges down to the lowest score of the index
+                entries = [(member, score) for member, score in entries if score >= min_score]
+
+        page = entries[:limit]
+        notes = await self._fetch(redis, user_id, [note_id for note_id, _ in page], fields)
+
+        next_position = None
+        if len(entries) > limit:
+            last_id, last_score = page[-1]
+            next_position = (last_score, last_id)
+        return NotePage(notes, next_position, total, int(version or 0))
+
+    async def _tagged_index(self, redis, user_id: str, key: str, tags: List[str], any_tag: bool) -> str:
+        """
+        Key of the entries of an index whose note has all (or any) of the tags.
+
+        The entries keep their scores (the tag sets are weighted 0). The result
+        is kept for TAGGED_INDEX_TTL seconds under the user's list version, so
+        the following pages reuse it until any note is written.
+        """
+        version = int(await redis.get(user_notes_version_key(user_id)) or 0)
+        query = json.dumps([version, key, sorted(tags), any_tag])
+        result_key = note_search_key(user_id, "tags:" + hashlib.sha1(query.encode()).hexdigest())
+        if await redis.exists(result_key):
+            return result_key
+
+        prefix = note_tags_prefix(user_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            if any_tag and len(tags) > 1:
+                union_key = result_key + ":any"
+                await pipe.zunionstore(union_key, [prefix + tag for tag in tags])
+                await pipe.zinterstore(result_key, {key: 1, union_key: 0}, aggregate="SUM")
+                await pipe.delete(union_key)
+            else:
+                weights = {key: 1}
+                weights.update({prefix + tag: 0 for tag in tags})
+                await pipe.zinterstore(result_key, weights, aggregate="SUM")
+            await pipe.expire(result_key, TAGGED_INDEX_TTL)
+            await pipe.execute()
+        return result_key
+
+    async def list_tags(self, user_id: str) -> List[Tuple[str, int]]:
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            tags = await redis.zrange(user_tags_key(user_id), 0, -1, desc=True, withscores=True)
+        return [(tag, int(count)) for tag, count in tags]
+
+    async def _list_titles_after(self, user_id: str, position: Optional[Tuple[float, str]], limit: int, fields: Optional[List[str]]) -> NotePage:
+        """list_after in title order: members of equal score are ranged lexicographically, after the cursor's member."""
+        key = user_notes_sort_key(user_id, TITLE_ORDER)
+        start = "-" if position is None else "(" + position[1]
+        async with get_redis_client(read_only=True, session_id=user_id) as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                await pipe.zrange(key, start, "+", bylex=True, offset=0, num=limit + 1)
+                await pipe.zcard(key)
+                await pipe.get(user_notes_version_key(user_id))
+                members, total, version = await pipe.execute()
+            page = members[:limit]
+            notes = await self._fetch(redis, user_id, [title_member_note_id(member) for member in page], fields)
+        next_position = (0.0, page[-1]) if len(members) > limit else None
+        return NotePage(notes, next_position, total, int(version or 0))
+
+    async def search(self, user_id: str, terms: List[str], last_word: Optional[str] = None, limit: int = 20) -> NotePage:
+        prefix = note_terms_prefix(user_id)
+        last_keys = [prefix + TOKEN_TERM + last_word, prefix + PREFIX_TERM + last_word] if last_word else []
+        async with get_redis_client() as redis:
+            # Document frequencies, for ranking, in one round trip
+            async with redis.pipeline(transaction=False) as pipe:
+                await pipe.zcard(user_notes_key(user_id))
+                for key in [prefix + term for term in terms] + last_keys:
+                    await pipe.zcard(key)
+                await pipe.get(user_notes_version_key(user_id))
+                counts = await pipe.execute()
+            total_notes, version = counts[0], counts[-1]
+            term_counts, last_counts = counts[1:len(terms) + 1], counts[len(terms) + 1:-1]
+            if not (terms or last_keys) or 0 in term_counts or (last_keys and not any(last_counts)):
+                return NotePage([], None, 0, int(version or 0))
+
+            # Intersect the postings, weighting each term by its rarity, and
+            # read the best matches; temporary sets are dropped in the same
+            # transaction
+            result_key = note_search_key(user_id, uuid.uuid4().hex)
+            last_key = result_key + ":last"
+            async with redis.pipeline(transaction=True) as pipe:
+                weights = {prefix + term: idf(count, total_notes) for term, count in zip(terms, term_counts)}
+                if last_keys:
+                    # The last word matches as a whole word or a title prefix, whichever weighs more
+                    await pipe.zunionstore(last_key, last_keys, aggregate="MAX")
+                    weights[last_key] = idf(sum(last_counts), total_notes)
+                await pipe.zinterstore(result_key, weights, aggregate="SUM")
+                await pipe.zrevrange(result_key, 0, limit - 1)
+                await pipe.delete(result_key, last_key)
+                results = await pipe.execute()
+            total, note_ids = results[-3], results[-2]
+            notes = await self._fetch(redis, user_id, note_ids)
+        return NotePage(notes, None, total, int(version or 0))
+
+    async def _fetch(self, redis, user_id: str, note_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict]:
+        """Fetch note hashes (or just some of their fields) in a single round trip, in the order of note_ids."""
+        if not note_ids:
+            return []
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for note_id in note_ids:
+                if fields:
+                    await pipe.hmget(note_key(user_id, note_id), fields)
+                else:
+                    await pipe.hgetall(note_key(user_id, note_id))
+            results = await pipe.execute()
+
+        if fields:
+            # HMGET answers with None for absent fields; a missing note has no "id"
+            id_position = fields.index("id")
+            note_dicts = []
+            for values in results:
+                if values[id_position] is None:
+                    note_dicts.append({})
+                else:
+                    note_dicts.append({field: value for field, value in zip(fields, values) if value is not None})
+        else:
+            note_dicts = results
+        await self._resolve_bodies(redis, user_id, note_dicts)
+
+        notes = [note_data for note_data in note_dicts if note_data]
+        if len(notes) < len(note_ids):
+            await self._remove_dangling(user_id, [note_id for note_id, note_data in zip(note_ids, note_dicts) if not note_data])
+        return notes
+
+    async def _remove_dangling(self, user_id: str, note_ids: List[str]) -> None:
+        """Drop index entries whose note hash no longer exists."""
+        async with get_redis_client() as redis:
+            title_members = [member for member in await redis.hmget(note_sort_titles_key(user_id), note_ids) if member]
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.zrem(user_notes_key(user_id), *note_ids)
+                await pipe.zrem(user_notes_sort_key(user_id, CREATED_ORDER), *note_ids)
+                await pipe.zrem(user_notes_sort_key(user_id, SENSITIVITY_ORDER), *note_ids)
+                if title_members:
+                    await pipe.zrem(user_notes_sort_key(user_id, TITLE_ORDER), *title_members)
+                    await pipe.hdel(note_sort_titles_key(user_id), *note_ids)
+                await pipe.incr(user_notes_version_key(user_id))
+                await pipe.execute()
+
+    async def update(self, note: Dict, score: float, removed_fields: Iterable[str] = (), expected_version: Optional[int] = None) -> bool:
+        user_id = note["user_id"]
+        try:
+            await self._write_notes(user_id, [note["id"]], _write_op_args(note["id"], expected_version, score, note, removed_fields))
+        except LookupError:
+            return False
+        return True
+
+    async def write_batch(self, user_id: str, saves: List[Tuple[Dict, float, List[str]]], deletes: List[str], expected_versions: Optional[Dict[str, int]] = None) -> None:
+        if not saves and not deletes:
+            return
+        expected_versions = expected_versions or {}
+        note_ids = []
+        args = []
+        for note, score, removed_fields in saves:
+            note_ids.append(note["id"])
+            args += _write_op_args(note["id"], expected_versions.get(note["id"]), score, note, removed_fields)
+        for note_id in deletes:
+            note_ids.append(note_id)
+            args += _write_op_args(note_id, expected_versions.get(note_id))
+        try:
+            await self._write_notes(user_id, note_ids, args)
+        except LookupError as e:
+            # A note the batch expected to find was deleted in the meantime
+            raise VersionConflict(str(e.args[0])) from None
+
+    async def _write_notes(self, user_id: str, note_ids: List[str], args: List[Union[str, bytes]]) -> int:
+        """
+        Run WRITE_NOTES_SCRIPT: checks and writes happen in one atomic round trip.
+
+        Returns the number of notes deleted. Raises VersionConflict, or
+        LookupError(note_id) for a missing note.
+        """
+        keys = [user_notes_key(user_id), user_notes_version_key(user_id), note_bodies_key(user_id), note_term_lists_key(user_id)]
+        keys += [user_notes_sort_key(user_id, order) for order in SECONDARY_ORDERS] + [note_sort_titles_key(user_id), user_tags_key(user_id), note_access_key(user_id)]
+        keys += [note_key(user_id, note_id) for note_id in note_ids]
+        async with get_redis_client() as redis:
+            write_notes = redis.register_script(WRITE_NOTES_SCRIPT)
+            result = await write_notes(keys=keys, args=[note_terms_prefix(user_id), note_tags_prefix(user_id), note_revisions_key(user_id, ""), note_chunks_key(user_id, "")] + args)
+            status = int(result[0])
+            if status == 0:
+                await record_write(redis, user_id)
+                return int(result[1])
+        note_id = note_ids[int(result[1]) - 1]
+        if status == 1:
+            raise VersionConflict(note_id)
+        raise LookupError(note_id)
+
+    async def delete(self, user_id: str, note_id: str) -> bool:
+        # Delete note data, remove it from the user's index and release its body
+        return bool(await self._write_notes(user_id, [note_id], _write_op_args(note_id, None)))
+
+    async def purge_notes(self, user_id: str, limit: int = 500) -> PurgeProgress:
+        keys = [user_notes_key(user_id), note_term_lists_key(user_id), user_purge_key(user_id), user_notes_version_key(user_id), note_bodies_key(user_id)]
+        keys += [user_notes_sort_key(user_id, order) for order in SECONDARY_ORDERS] + [note_sort_titles_key(user_id), user_tags_key(user_id), note_access_key(user_id)]
+        async with get_redis_client() as redis:
+            purge_notes = redis.register_script(PURGE_NOTES_SCRIPT)
+            deleted, remaining = await purge_notes(keys=keys, args=[note_key(user_id, ""), note_terms_prefix(user_id), note_tags_prefix(user_id), note_revisions_key(user_id, ""), note_chunks_key(user_id, ""), limit])
+        return PurgeProgress(int(deleted), int(remaining))
+
+    async def get_purge_progress(self, user_id: str) -> PurgeProgress:
+        async with get_redis_client() as redis:
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.hget(user_purge_key(user_id), "deleted")
+                await pipe.zcard(user_notes_key(user_id))
+                deleted, remaining = await pipe.execute()
+        return PurgeProgress(int(deleted or 0), remaining)
+
+# Reserve an idempotency key: KEYS[1] is its record, ARGV[1] its TTL in
+# milliseconds and the rest the record's field/value items. Returns the
+# existing record (HGETALL), or nothing once the new one is stored.
+RESERVE_IDEMPOTENCY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HGETALL', KEYS[1])
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return false
+"""
+
+# Finish (ARGV[2] = TTL in milliseconds, then the response's items) or,
+# without ARGV[2], release the idempotency key record KEYS[1], if the
+# attempt with token ARGV[1] still owns it. Returns 1 if it did.
+SETTLE_IDEMPOTENCY_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == nil then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+def _record_args(record: Dict[str, str]) -> List[str]:
+    """Field/value ARGV items of an idempotency key record."""
+    return [item for field_value in record.items() for item in field_value]
+
+class RedisIdempotencyRepository(IdempotencyRepository):
+    """Idempotency key records stored as expiring Redis hashes in their user's slot."""
+
+    async def reserve(self, user_id: str, key: str, record: Dict[str, str], ttl: float) -> Optional[Dict[str, str]]:
+        async with get_redis_client() as redis:
+            reserve = redis.register_script(RESERVE_IDEMPOTENCY_SCRIPT)
+            existing = await reserve(keys=[idempotency_record_key(user_id, key)], args=[int(ttl * 1000)] + _record_args(record))
+        if not existing:
+            return None
+        return dict(zip(existing[::2], existing[1::2]))
+
+    async def get(self, user_id: str, key: str) -> Optional[Dict[str, str]]:
+        async with get_redis_client() as redis:
+            return await redis.hgetall(idempotency_record_key(user_id, key)) or None
+
+    async def complete(self, user_id: str, key: str, token: str, response: Dict[str, str], ttl: float) -> bool:
+        async with get_redis_client() as redis:
+            settle = redis.register_script(SETTLE_IDEMPOTENCY_SCRIPT)
+            return bool(await settle(keys=[idempotency_record_key(user_id, key)], args=[token, int(ttl * 1000)] + _record_args(response)))
+
+    async def release(self, user_id: str, key: str, token: str) -> None:
+        async with get_redis_client() as redis:
+            settle = redis.register_script(SETTLE_IDEMPOTENCY_SCRIPT)
+            await settle(keys=[idempotency_record_key(user_id, key)], args=[token])
@@ -1,21 +1,32 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional
+
+# A note tag: no commas or control characters, no surrounding whitespace
+Tag = Annotated[str, Field(min_length=1, max_length=50, pattern=r"^[^,\s\x00-\x1f](?:[^,\x00-\x1f]*[^,\s\x00-\x1f])?$")]
+MAX_TAGS = 20
+
+# A blind index token: hex HMAC-SHA256 of a word, truncated (see app.utils.search.blind_tokens)
+BlindToken = Annotated[str, Field(pattern=r"^[0-9a-f]{32}$")]
 
 class NoteBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=100)
     content: str = Field(..., min_length=1)
     is_encrypted: bool = False
+    tags: List[Tag] = Field(default_factory=list, max_length=MAX_TAGS)
 
 class NoteCreate(NoteBase):
     encryption_password: Optional[str] = None
     salt: Optional[str] = None  # For storing the salt for encrypted notes
+    search_tokens: Optional[List[BlindToken]] = Field(None, max_length=1000)  # Client-computed blind index of encrypted content
 
 class NoteUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=1, max_length=100)
     content: Optional[str] = Field(None, min_length=1)
     is_encrypted: Optional[bool] = None
+    tags: Optional[List[Tag]] = Field(None, max_length=MAX_TAGS)  # Replaces the note's tags
     encryption_password: Optional[str] = None
     old_encryption_password: Optional[str] = None  # Added for password changes on encrypted notes
+    search_tokens: Optional[List[BlindToken]] = Field(None, max_length=1000)  # Client-computed blind index of encrypted content
 
 class NoteSensitivity(BaseModel):
     sensitivity_score: int = Field(0, ge=0, le=100)
@@ -27,4 +38,75 @@ class Note(NoteBase):
     created_at: float
     updated_at: float
     salt: Optional[str] = None  # For encrypted notes, to store salt
-    sensitivity: Optional[NoteSensitivity] = None 
\ No newline at end of file
+    sensitivity: Optional[NoteSensitivity] = None 
+    version: int = 0  # Bumped on every write; sent as the note's ETag
+
+class NoteSummary(BaseModel):
+    """Lightweight note listing entry (no content)."""
+    id: str
+    title: str
+    is_encrypted: bool
+    created_at: float
+    updated_at: float
+    sensitivity_score: int = 0
+
+class NoteTag(BaseModel):
+    tag: str
+    count: int
+
+class NoteRevision(BaseModel):
+    """An earlier title and content of a note (see NOTE_REVISIONS), without the content."""
+    version: int
+    title: str
+    updated_at: float
+    size: int  # Bytes stored for this revision
+    snapshot: bool  # Stored in full rather than as a diff
+
+class NoteRevisionContent(NoteRevision):
+    content: str
+
+class NoteEncryptedSearch(BaseModel):
+    """Search of encrypted notes: words and the password they were encrypted with, or client-computed tokens."""
+    q: Optional[str] = Field(None, min_length=1, max_length=200)
+    encryption_password: Optional[str] = None
+    search_tokens: Optional[List[BlindToken]] = Field(None, min_length=1, max_length=20)
+    limit: int = Field(20, ge=1, le=100)
+
+class NoteImport(NoteBase):
+    """One line of an NDJSON note import (the format written by the export)."""
+    salt: Optional[str] = None
+    created_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    sensitivity: Optional[NoteSensitivity] = None
+
+class NoteImportError(BaseModel):
+    line: int
+    error: str
+
+class NoteImportResult(BaseModel):
+    imported: int = 0
+    failed: List[NoteImportError] = []
+    pending_analysis: int = 0
+
+class NoteBatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None  # Required for update and delete
+    data: Optional[Dict[str, Any]] = None  # NoteCreate fields for create, NoteUpdate fields for update
+
+class NoteBatchRequest(BaseModel):
+    operations: List[NoteBatchOperation] = Field(..., min_length=1, max_length=100)
+
+class NoteBatchResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[str] = None
+    status: int
+    note: Optional[Note] = None
+    error: Optional[str] = None
+
+class NoteEvent(BaseModel):
+    """A change to one of a user's notes, as streamed by GET /notes/events."""
+    type: Literal["created", "updated", "deleted", "analyzed"]  # analyzed: deferred sensitivity analysis done
+    id: str
+    version: Optional[int] = None  # The note's new version; none for deletions
+    sensitivity_score: Optional[int] = None
@@ -0,0 +1,187 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import orjson
+
+from app.core.config import settings
+from app.core.database import get_redis_client, get_pubsub, note_events_channel, NOTE_EVENTS_PREFIX
+from app.repositories import get_note_repository
+from app.schemas.note import NoteEvent
+from app.utils.etag import list_etag
+
+# Messages a stream may fall behind by before its events are dropped for a resync
+MAX_PENDING_MESSAGES = 100
+
+# Milliseconds a client waits before reconnecting a dropped stream
+RECONNECT_MILLISECONDS = 5000
+
+# Seconds between attempts to read again from a broken pub/sub connection
+READ_RETRY_SECONDS = 1.0
+
+def _frame(event: str, data: bytes) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+class NoteEventSubscription:
+    """The queue of SSE frames of one open stream."""
+
+    def __init__(self):
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(MAX_PENDING_MESSAGES)
+        # Set when frames were dropped, so the client must refetch its notes
+        self.lost = False
+
+    def deliver(self, frames: bytes) -> None:
+        try:
+            self.queue.put_nowait(frames)
+        except asyncio.QueueFull:
+            self.lost = True
+
+    def drop(self) -> None:
+        """Drop the frames that can no longer be delivered in full, waking the stream."""
+        self.lost = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+class NoteEventHub:
+    """
+    The note event streams open in one worker (one event loop).
+
+    A single pub/sub connection carries the events of every user with a
+    stream here: their channel is subscribed while they have at least one,
+    and each message is rendered to SSE frames once for all their streams.
+    An idle stream costs its coroutine and an empty queue, nothing in Redis.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._subscriptions: Dict[str, Set[NoteEventSubscription]] = {}
+        self._lock = asyncio.Lock()
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def subscribe(self, user_id: str) -> NoteEventSubscription:
+        subscription = NoteEventSubscription()
+        async with self._lock:
+            subscriptions = self._subscriptions.setdefault(user_id, set())
+            subscriptions.add(subscription)
+            if len(subscriptions) == 1 and settings.STORAGE_BACKEND == "redis":
+                if self._pubsub is None:
+                    self._pubsub = await get_pubsub()
+                await self._pubsub.subscribe(note_events_channel(user_id))
+                if self._reader is None:
+                    self._reader = asyncio.create_task(self._read())
+        return subscription
+
+    async def unsubscribe(self, user_id: str, subscription: NoteEventSubscription) -> None:
+        async with self._lock:
+            subscriptions = self._subscriptions.get(user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(user_id, None)
+                if self._pubsub is not None:
+                    await self._pubsub.unsubscribe(note_events_channel(user_id))
+
+    def dispatch(self, user_id: str, message: bytes) -> None:
+        """Deliver a published message (a JSON array of events) to the user's streams here."""
+        subscriptions = self._subscriptions.get(user_id)
+        if not subscriptions:
+            return
+        frames = b"".join(_frame("note", orjson.dumps(event)) for event in orjson.loads(message))
+        for subscription in subscriptions:
+            subscription.deliver(frames)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The client reconnects and resubscribes on the next read, but
+                # whatever was published meanwhile is lost
+                for subscriptions in self._subscriptions.values():
+                    for subscription in subscriptions:
+                        subscription.drop()
+                await asyncio.sleep(READ_RETRY_SECONDS)
+                continue
+            if message and message["type"] == "message":
+                self.dispatch(message["channel"][len(NOTE_EVENTS_PREFIX) + 1:-1], message["data"])
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+_hub: Optional[NoteEventHub] = None
+
+def get_note_event_hub() -> NoteEventHub:
+    """The event hub of the running event loop, created on first use."""
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub.loop is not loop:
+        _hub = NoteEventHub(loop)
+    return _hub
+
+async def close_note_events() -> None:
+    """Close the pub/sub connection of the event hub at application shutdown."""
+    global _hub
+    if _hub is not None:
+        await _hub.close()
+        _hub = None
+
+async def publish_note_events(user_id: str, events: List[NoteEvent]) -> None:
+    """
+    Publish events of a user's notes to their open streams, if NOTE_EVENTS is on.
+
+    Called once the writes are stored. Delivery is best effort: a failure
+    to publish leaves the write in place, and streams tell their client to
+    refetch when they may have missed events.
+    """
+    if not settings.NOTE_EVENTS or not events:
+        return
+    message = orjson.dumps([event.model_dump(exclude_none=True) for event in events])
+    if settings.STORAGE_BACKEND != "redis":
+        get_note_event_hub().dispatch(user_id, message)
+        return
+    try:
+        async with get_redis_client() as redis:
+            await redis.publish(note_events_channel(user_id), message)
+    except Exception:
+        pass
+
+async def stream_note_events(user_id: str) -> AsyncIterator[bytes]:
+    """
+    Stream a user's note events as SSE frames, until the client disconnects.
+
+    The stream opens with a "ready" event holding the ETag of the user's
+    note list, taken once subscribed, so a client whose list has another
+    ETag refetches it and misses nothing. Then each "note" event is a
+    NoteEvent; "resync" means events were dropped and the list must be
+    refetched. Idle streams get a comment line every
+    NOTE_EVENTS_HEARTBEAT_SECONDS.
+    """
+    hub = get_note_event_hub()
+    subscription = await hub.subscribe(user_id)
+    try:
+        etag = list_etag(user_id, await get_note_repository().get_list_version(user_id))
+        yield f"retry: {RECONNECT_MILLISECONDS}\n".encode() + _frame("ready", orjson.dumps({"etag": etag}))
+        while True:
+            try:
+                frames = await asyncio.wait_for(subscription.queue.get(), settings.NOTE_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if subscription.lost:
+                # Whatever is still queued is stale once the client refetches
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.lost = False
+                yield _frame("resync", b"{}")
+            elif frames is not None:
+                yield frames
+    finally:
+        await hub.unsubscribe(user_id, subscription)
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import hmac
+import re
+import time
+import uuid
+from typing import Awaitable, Callable, Dict
+
+import orjson
+from fastapi import Response
+
+from app.core.config import settings
+from app.repositories import get_idempotency_repository
+
+# Idempotency keys are 1-255 visible ASCII characters (a UUID in practice)
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"[\x21-\x7e]{1,255}")
+
+# Response header marking a response replayed for an Idempotency-Key
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Seconds between looks at a key whose first request is still running,
+# doubling from the first to the last
+WAIT_FIRST_SECONDS = 0.05
+WAIT_MAX_SECONDS = 1.0
+
+# Response headers not stored with a response, as the replay sets them again
+UNSTORED_HEADERS = {"content-length", "content-type"}
+
+class IdempotencyKeyReused(Exception):
+    """An Idempotency-Key was used before for a different request."""
+
+class IdempotencyInProgress(Exception):
+    """The first request made with an Idempotency-Key is still running."""
+
+def validate_idempotency_key(key: str) -> str:
+    if not IDEMPOTENCY_KEY_PATTERN.fullmatch(key):
+        raise ValueError("Idempotency-Key must be 1 to 255 visible ASCII characters")
+    return key
+
+def request_fingerprint(*parts) -> str:
+    """
+    Fingerprint of a request: its operation, parameters and body.
+
+    Keyed with SECRET_KEY, since bodies hold note contents and passwords
+    and the fingerprint is stored with the key for a day.
+    """
+    data = orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)
+    return hmac.new(settings.SECRET_KEY.encode(), data, hashlib.sha256).hexdigest()
+
+def _replay(record: Dict[str, str]) -> Response:
+    headers = orjson.loads(record["headers"])
+    headers[REPLAYED_HEADER] = "true"
+    return Response(record["body"], status_code=int(record["status"]), headers=headers, media_type="application/json")
+
+async def run_idempotent(user_id: str, key: str, fingerprint: str, operation: Callable[[], Awaitable[Response]]) -> Response:
+    """
+    Run operation once per user and Idempotency-Key, replaying its response on retries.
+
+    The first request reserves the key for IDEMPOTENCY_LOCK_SECONDS and
+    stores its response for IDEMPOTENCY_TTL_SECONDS once it succeeds; a
+    request failing frees the key, so errors are never replayed. A retry
+    arriving meanwhile waits for the first one's response, and takes over
+    the key if the first one fails. Raises IdempotencyKeyReused if the key
+    was used for a request with another fingerprint and
+    IdempotencyInProgress if the first request outlasts the wait.
+    """
+    repository = get_idempotency_repository()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_SECONDS
+    delay = WAIT_FIRST_SECONDS
+    while True:
+        record = await repository.reserve(user_id, key, {"fingerprint": fingerprint, "token": token}, settings.IDEMPOTENCY_LOCK_SECONDS)
+        if record is None:
+            break
+        if not hmac.compare_digest(record.get("fingerprint", ""), fingerprint):
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+        # Wait until the first request has finished, or freed the key on failure
+        while record is not None and "status" not in record:
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress("A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WAIT_MAX_SECONDS)
+            record = await repository.get(user_id, key)
+        if record is not None:
+            return _replay(record)
+
+    try:
+        response = await operation()
+    except BaseException:
+        await repository.release(user_id, key, token)
+        raise
+    headers = {name: value for name, value in response.headers.items() if name not in UNSTORED_HEADERS}
+    stored = {"status": str(response.status_code), "headers": orjson.dumps(headers).decode(), "body": response.body.decode()}
+    await repository.complete(user_id, key, token, stored, settings.IDEMPOTENCY_TTL_SECONDS)
+    return response
@@ -1,338 +1,722 @@
-from typing import Dict, Optional, List
+from typing import AsyncIterable, AsyncIterator, Dict, NamedTuple, Optional, List, Tuple, Union
 import json
 import time
 import base64
 import uuid
 
-from app.core.database import get_redis_client, NOTE_PREFIX, USER_NOTES_PREFIX
-from app.models.note import create_note_dict, update_note_dict, note_dict_to_schema
-from app.schemas.note import NoteCreate, Note, NoteUpdate, NoteSensitivity
-from app.utils.encryption import encrypt_text, decrypt_text
+from app.repositories import get_note_repository, VersionConflict
+from app.models.note import (
+    NoteRecord, note_version, stale_fields, content_digest, note_dict_to_projection, projection_hash_fields,
+    normalize_tags, BODY_SENSITIVITY_FIELD, REVISION_FIELD, COLD_FIELD, UPDATED_ORDER, SENSITIVITY_ORDER, TITLE_ORDER,
+)
+from app.schemas.note import (
+    NoteCreate, Note, NoteUpdate, NoteImport, NoteImportError, NoteImportResult,
+    NoteBatchOperation, NoteBatchResult, NoteEncryptedSearch, NoteTag, NoteRevision, NoteRevisionContent, NoteEvent
+)
+from app.utils.encryption import encrypt_text, decrypt_text, derive_blind_index_key
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.etag import version_etag, list_etag, content_etag
+from app.utils.search import parse_query, blind_tokens, blind_terms
+from app.utils.revisions import INDEX_FIELD as REVISION_INDEX_FIELD, parse_index, record_revision, revision_chain, rebuild_content
+from app.utils.chunks import ChunkLayout, parse_layout, format_layout, decode_chunk
+from app.utils.serialization import dumps
+from app.core.config import settings
+from app.utils.ndjson import iter_ndjson_lines, LineTooLong
 from app.services.sensitivity_service import analyze_note_sensitivity
+from app.services.event_service import publish_note_events
+
+# Notes read or written per pipelined batch by export and import
+BULK_BATCH_SIZE = 200
+
+# Index score between consecutive notes saved by one batch (seconds, above
+# the resolution of a double at current timestamps)
+BATCH_SCORE_STEP = 1e-6
+
+class NoteListing(NamedTuple):
+    """A page of a user's note listing, ready for the response."""
+    notes: List[Union[Note, Dict]]
+    # Cursor for the next page, None on the last page or with skip paging
+    next_cursor: Optional[str]
+    # Number of notes the user has
+    total: int
+    # ETag of the user's note list at the time the page was read
+    etag: str
+
+class NoteContent(NamedTuple):
+    """The stored content of a note, as served by GET /notes/{id}/content."""
+    # Bytes of content (UTF-8)
+    length: int
+    # Strong ETag of those bytes
+    etag: str
+    # Layout of content stored in chunks, which is read chunk by chunk...
+    layout: Optional[ChunkLayout]
+    # ...or the content itself
+    data: Optional[bytes]
+
+# Attempts of an unconditional update that keeps losing the race to concurrent writers
+UPDATE_ATTEMPTS = 3
 
 async def create_note(note_create: NoteCreate, user_id: str) -> Note:
     """Create a new note in Redis."""
-    # Check if is_encrypted is None and set a default
-    if note_create.is_encrypted is None:
-        note_create_dict = note_create.model_dump()
-        note_create_dict["is_encrypted"] = False
-        note_create = NoteCreate(**note_create_dict)
+    record = await prepare_new_note(note_create, user_id)
+    
+    await get_note_repository().create(record.to_hash(), time.time())
+    await publish_note_events(user_id, [_note_event("created", record)])
     
-    # Store original content for sensitivity analysis
-    original_content = note_create.content
+    return record.to_schema()
+
+async def prepare_new_note(note_create: NoteCreate, user_id: str) -> NoteRecord:
+    """Build the record of a new note: encrypt it if requested and analyze its sensitivity."""
+    content = note_create.content
+    salt = note_create.salt
     
-    # Handle encryption if requested
+    # Handle encryption if requested (the password itself is never stored)
     if note_create.is_encrypted and note_create.encryption_password:
-        encrypted_content, salt = encrypt_text(note_create.content, note_create.encryption_password)
-        # Store the encrypted content and salt
-        note_create_dict = note_create.model_dump()
-        note_create_dict["content"] = encrypted_content
-        salt_b64 = base64.b64encode(salt).decode()
-        note_create_dict["salt"] = salt_b64
-        # Remove the password from what gets stored
-        note_create_dict.pop("encryption_password", None)
-        note_create = NoteCreate(**note_create_dict)
-    
-    # Create the note dict
-    note_dict = create_note_dict(note_create, user_id)
+        content, salt_bytes = encrypt_text(note_create.content, note_create.encryption_password)
+        salt = base64.b64encode(salt_bytes).decode()
+    
+    record = NoteRecord.new(user_id, note_create.title, content, bool(note_create.is_encrypted), salt, note_create.tags)
+    if record.is_encrypted:
+        record.blind_index = _blind_index(user_id, note_create.content, note_create.encryption_password, note_create.search_tokens)
     
     # Analyze content sensitivity (use original unencrypted content)
-    sensitivity_data = await analyze_note_sensitivity(original_content)
+    sensitivity_data = await analyze_content(user_id, note_create.content, record.is_encrypted)
+    record.sensitivity_score = sensitivity_data["sensitivity_score"]
+    record.sensitivity_explanation = sensitivity_data["explanation"]
     
-    # Add sensitivity data to note_dict
-    note_dict["sensitivity_score"] = str(sensitivity_data["sensitivity_score"])
-    note_dict["sensitivity_explanation"] = sensitivity_data["explanation"]
+    return record
+
+async def analyze_content(user_id: str, content: str, is_encrypted: bool) -> Dict:
+    """
+    Analyze the sensitivity of a note's plaintext content.
     
-    async with get_redis_client() as redis:
-        try:
-            # Create a pipeline for atomic operations
-            async with redis.pipeline() as pipe:
-                # Store note data
-                note_key = f"{NOTE_PREFIX}{note_dict['id']}"
-                await pipe.hset(note_key, mapping=note_dict)
-                
-                # Add note ID to user's notes set
-                user_notes_key = f"{USER_NOTES_PREFIX}{user_id}"
-                await pipe.zadd(user_notes_key, {note_dict["id"]: time.time()})
-                
-                # Execute pipeline
-                await pipe.execute()
-        except Exception as e:
-            raise
+    With CONTENT_DEDUP, the analysis stored with an identical body of the
+    user's is reused instead. Content that is stored encrypted is always
+    analyzed, so no trace of its plaintext is kept.
+    """
+    if settings.CONTENT_DEDUP and not is_encrypted:
+        known = await get_note_repository().get_body_sensitivity(user_id, content_digest(content))
+        if known is not None:
+            return known
+    return await analyze_note_sensitivity(content)
+
+def _blind_index(user_id: str, plaintext: str, password: Optional[str], search_tokens: Optional[List[str]]) -> Optional[str]:
+    """
+    Blind index of newly encrypted content.
     
-    return note_dict_to_schema(note_dict)
+    The client's search_tokens are kept as given. Otherwise, when the server
+    encrypts (so it has the password) and SEARCH_INDEX is on, the tokens of
+    the plaintext's words are derived from the password.
+    """
+    if search_tokens is not None:
+        tokens = list(dict.fromkeys(search_tokens))
+    elif password and settings.SEARCH_INDEX:
+        tokens = blind_tokens(derive_blind_index_key(password, user_id), plaintext)
+    else:
+        tokens = []
+    return " ".join(tokens) or None
+
+def _decode_salt(salt_str: str) -> bytes:
+    """Decode a stored base64 salt, tolerating missing padding."""
+    try:
+        return base64.b64decode(salt_str)
+    except Exception:
+        padded_salt_str = salt_str + "=" * (-len(salt_str) % 4)
+        return base64.b64decode(padded_salt_str)
 
 async def get_note_by_id(note_id: str, user_id: str, decrypt_password: Optional[str] = None) -> Optional[Note]:
     """Get a note by ID, ensuring it belongs to the user."""
-    async with get_redis_client() as redis:
-        note_key = f"{NOTE_PREFIX}{note_id}"
-        note_data = await redis.hgetall(note_key)
+    repository = get_note_repository()
+    note_data = await repository.get(user_id, note_id)
+    
+    if not note_data:
+        return None
+    
+    record = NoteRecord.from_hash(note_data)
+    
+    # Verify that the note belongs to the user
+    if record.user_id != user_id:
+        return None
+    
+    if settings.COLD_TIERING:
+        await repository.record_access(user_id, note_id)
+    if COLD_FIELD in note_data:
+        await _rehydrate(record, note_data)
+    
+    # Decrypt content if note is encrypted and password is provided
+    if record.is_encrypted and decrypt_password:
+        if record.salt is None:
+            # Create a more specific error message
+            record.content = "[Encrypted content - Missing encryption salt]"
+            return record.to_schema()
+        
+        try:
+            salt = _decode_salt(record.salt)
+            
+            try:
+                # Decrypt and update the content
+                record.content = decrypt_text(record.content, decrypt_password, salt)
+            except ValueError as e:
+                # Return a more specific error message in the note content
+                record.content = f"[Encrypted content - {str(e)}]"
+        except Exception as e:
+            record.content = f"[Encrypted content - Decryption failed: {str(e)}]"
+    elif record.is_encrypted:
+        # Provide a helpful message in the content
+        record.content = "[Encrypted content - Password required to view]"
+    
+    return record.to_schema()
+
+async def _rehydrate(record: NoteRecord, note_data: Dict) -> None:
+    """Move a note read from a cold segment back into Redis (see COLD_TIERING)."""
+    note_hash = record.to_hash()
+    try:
+        # Its index score stays its last update time
+        await get_note_repository().update(
+            note_hash, record.updated_at, stale_fields(note_data, note_hash), record.version
+        )
+    except VersionConflict:
+        # Written in the meantime, which moved it back already
+        pass
+
+async def get_note_etag(note_id: str, user_id: str) -> Optional[str]:
+    """Get the current ETag of a note without loading it, None if it does not exist."""
+    version = await get_note_repository().get_version(user_id, note_id)
+    return version_etag(version) if version is not None else None
+
+async def get_note_content(note_id: str, user_id: str) -> Optional[NoteContent]:
+    """
+    Get the stored content of a note (the ciphertext of an encrypted one), None if the note does not exist.
+    
+    Of content stored in chunks only the layout is read: iter_note_content
+    then reads the chunks of the range it serves.
+    """
+    repository = get_note_repository()
+    layout, _ = await repository.get_chunks(user_id, note_id)
+    if layout is not None:
+        if settings.COLD_TIERING:
+            await repository.record_access(user_id, note_id)
+        layout = parse_layout(layout)
+        return NoteContent(layout.length, content_etag(layout.digest), layout, None)
+    
+    # A cold note is served from its segment, where it stays
+    note_data = await repository.get(user_id, note_id)
+    if not note_data or note_data.get("user_id") != user_id:
+        return None
+    if settings.COLD_TIERING:
+        await repository.record_access(user_id, note_id)
+    content = NoteRecord.from_hash(note_data).content
+    data = content.encode()
+    return NoteContent(len(data), content_etag(content_digest(content)), None, data)
+
+async def iter_note_content(note_id: str, user_id: str, content: NoteContent, start: int, end: int) -> AsyncIterator[bytes]:
+    """
+    Stream bytes start to end (inclusive) of a note's content got from get_note_content.
+    
+    Chunks are read one at a time, each with the layout, so a single chunk
+    is held at once. Raises VersionConflict if the content is replaced while
+    it is streamed (the response then stops short of its Content-Length).
+    """
+    if content.layout is None:
+        yield content.data[start:end + 1]
+        return
+    
+    layout = content.layout
+    expected_layout = format_layout(layout)
+    repository = get_note_repository()
+    for index in layout.span(start, end):
+        stored_layout, (chunk,) = await repository.get_chunks(user_id, note_id, [index])
+        if stored_layout != expected_layout or chunk is None:
+            raise VersionConflict(note_id)
+        offset = index * layout.size
+        yield decode_chunk(layout, chunk)[max(start - offset, 0):end + 1 - offset]
+
+async def get_user_notes_etag(user_id: str) -> str:
+    """Get the current ETag of a user's note list without loading any note."""
+    return list_etag(user_id, await get_note_repository().get_list_version(user_id))
+
+async def get_user_notes(user_id: str, skip: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> NoteListing:
+    """
+    Get all notes for a user with pagination.
+    
+    With fields, only those note fields are read and each note is returned
+    as a plain dict holding just them.
+    """
+    # Notes come back ordered by most recently updated
+    hash_fields = projection_hash_fields(fields) if fields else None
+    page = await get_note_repository().list_page(user_id, skip, limit, hash_fields)
+    return NoteListing(_to_listing(page.notes, fields), None, page.total, list_etag(user_id, page.version))
+
+async def get_user_notes_page(user_id: str, cursor: Optional[str] = None, limit: int = 100, fields: Optional[List[str]] = None,
+                              sort: str = UPDATED_ORDER, min_sensitivity: Optional[int] = None,
+                              tags: Optional[List[str]] = None, any_tag: bool = False) -> NoteListing:
+    """
+    Get a page of a user's notes by keyset pagination.
+    
+    The notes are projected as in get_user_notes; next_cursor is None on
+    the last page. With SORT_INDEXES, sort picks another order than last
+    update (created, sensitivity or title) and min_sensitivity keeps only
+    notes scoring at least that much, in sensitivity order: every page
+    costs the same whatever its depth.
+    
+    With tags, only notes carrying all of them (any of them with any_tag)
+    are listed, in any order but title.
+    """
+    if sort != UPDATED_ORDER or min_sensitivity is not None:
+        if not settings.SORT_INDEXES:
+            raise ValueError("Sorting and filtering notes is not enabled")
+        if min_sensitivity is not None and sort != SENSITIVITY_ORDER:
+            raise ValueError("min_sensitivity can only be combined with sort=sensitivity")
+    if tags:
+        if sort == TITLE_ORDER:
+            raise ValueError("tags cannot be combined with sort=title")
+        tags = normalize_tags(tags)
+    # Cursors of the main index keep their original format
+    order = None if sort == UPDATED_ORDER else sort
+    position = decode_cursor(cursor, order) if cursor else None
+    hash_fields = projection_hash_fields(fields) if fields else None
+    page = await get_note_repository().list_after(user_id, position, limit, hash_fields, sort, min_sensitivity, tags, any_tag)
+    next_cursor = encode_cursor(page.next_position, order) if page.next_position else None
+    return NoteListing(_to_listing(page.notes, fields), next_cursor, page.total, list_etag(user_id, page.version))
+
+async def list_user_tags(user_id: str) -> List[NoteTag]:
+    """Get a user's tags with their note counts, most used first."""
+    return [NoteTag(tag=tag, count=count) for tag, count in await get_note_repository().list_tags(user_id)]
+
+async def search_user_notes(user_id: str, query: str, limit: int = 20) -> NoteListing:
+    """
+    Search a user's plaintext notes by title and content, best match first.
+    
+    Every word of the query must match; the last one also matches the start
+    of a title word. Encrypted notes are never indexed, so never found.
+    """
+    terms, last_word = parse_query(query)
+    page = await get_note_repository().search(user_id, terms, last_word, limit)
+    return NoteListing(_to_listing(page.notes, None), None, page.total, list_etag(user_id, page.version))
+
+async def search_encrypted_notes(user_id: str, search: NoteEncryptedSearch) -> NoteListing:
+    """
+    Search a user's encrypted notes by their blind index, best match first.
+    
+    The words of the query are turned into blind index tokens with the key
+    derived from the password the notes were encrypted with, or the client
+    sends the tokens itself. Nothing is decrypted: matching notes are
+    returned as stored, ciphertext included.
+    """
+    if search.search_tokens:
+        tokens = search.search_tokens
+    elif search.q and search.encryption_password:
+        tokens = blind_tokens(derive_blind_index_key(search.encryption_password, user_id), search.q)
+        if not tokens:
+            raise ValueError("The search query has no words to look for")
+    else:
+        raise ValueError("Provide the words to look for (q) with the notes' encryption_password, or search_tokens")
+    page = await get_note_repository().search(user_id, list(blind_terms(tokens)), None, search.limit)
+    return NoteListing(_to_listing(page.notes, None), None, page.total, list_etag(user_id, page.version))
+
+def _to_listing(note_dicts: List[Dict], fields: Optional[List[str]]) -> List[Union[Note, Dict]]:
+    """
+    Convert listed note dicts to schemas, or to projections when fields are selected.
+    
+    With FAST_JSON_RESPONSES, full notes are converted straight to JSON-ready dicts.
+    """
+    if fields:
+        return [note_dict_to_projection(note_data, fields) for note_data in note_dicts]
+    if settings.FAST_JSON_RESPONSES:
+        return [NoteRecord.from_hash(note_data).to_json() for note_data in note_dicts]
+    return [NoteRecord.from_hash(note_data).to_schema() for note_data in note_dicts]
+
+async def update_note(note_id: str, user_id: str, note_update: NoteUpdate, expected_version: Optional[int] = None) -> Optional[Note]:
+    """
+    Update a note in Redis.
+    
+    The note is written with a compare-and-set against the version it was
+    read at, so concurrent editors cannot silently overwrite each other.
+    With expected_version (from If-Match) a mismatch raises VersionConflict;
+    without it the update is re-applied on top of the newer version.
+    """
+    repository = get_note_repository()
+    for _ in range(UPDATE_ATTEMPTS):
+        revisions = {}
+        if settings.NOTE_REVISIONS:
+            note_data, revisions = await repository.get_revisions(user_id, note_id)
+        else:
+            note_data = await repository.get(user_id, note_id, consistent=True)
         
         if not note_data:
             return None
         
+        record = NoteRecord.from_hash(note_data)
+        
         # Verify that the note belongs to the user
-        if note_data["user_id"] != user_id:
+        if record.user_id != user_id:
             return None
         
-        # Make a proper boolean check for is_encrypted
-        is_encrypted = note_data.get("is_encrypted", "False").lower() == "true"
+        if expected_version is not None and record.version != expected_version:
+            raise VersionConflict(note_id)
         
-        # Decrypt content if note is encrypted and password is provided
-        if is_encrypted and decrypt_password:
-            
-            if "salt" not in note_data:
-                # Create a more specific error message
-                error_note = note_data.copy()
-                error_note["content"] = "[Encrypted content - Missing encryption salt]"
-                return note_dict_to_schema(error_note)
-            
-            try:
-                # Correctly convert from string to binary
-                salt_str = note_data["salt"]
-                
-                try:
-                    # Try to decode the salt - handle potential encoding issues
-                    salt = base64.b64decode(salt_str)
-                except Exception:
-                    # Try alternative encoding or ensure padding
-                    padded_salt_str = salt_str + "=" * (-len(salt_str) % 4)
-                    salt = base64.b64decode(padded_salt_str)
-                
-                # Get the encrypted content
-                encrypted_content = note_data["content"]
-                
-                try:
-                    # Decrypt and update the content
-                    decrypted_content = decrypt_text(encrypted_content, decrypt_password, salt)
-                    
-                    # Create a new dictionary with decrypted content
-                    decrypted_note_data = note_data.copy()
-                    decrypted_note_data["content"] = decrypted_content
-                    
-                    # Return the schema with decrypted content
-                    return note_dict_to_schema(decrypted_note_data)
-                except ValueError as e:
-                    # Return a more specific error message in the note content
-                    error_note = note_data.copy()
-                    error_note["content"] = f"[Encrypted content - {str(e)}]"
-                    return note_dict_to_schema(error_note)
-            except Exception as e:
-                error_note = note_data.copy()
-                error_note["content"] = f"[Encrypted content - Decryption failed: {str(e)}]"
-                return note_dict_to_schema(error_note)
-        elif is_encrypted:
-            # Provide a helpful message in the content
-            encrypted_note = note_data.copy()
-            encrypted_note["content"] = "[Encrypted content - Password required to view]"
-            return note_dict_to_schema(encrypted_note)
+        updated = await prepare_note_update(record, note_update)
+        note_hash = updated.to_hash()
+        if _records_revision(record, updated):
+            _add_revision(note_hash, record, updated, revisions.get(REVISION_INDEX_FIELD))
         
-        return note_dict_to_schema(note_data)
-
-async def get_user_notes(user_id: str, skip: int = 0, limit: int = 100) -> List[Note]:
-    """Get all notes for a user with pagination."""
-    async with get_redis_client() as redis:
-        # Get note IDs from user's notes set, ordered by most recently updated
-        user_notes_key = f"{USER_NOTES_PREFIX}{user_id}"
-        note_ids = await redis.zrevrange(user_notes_key, skip, skip + limit - 1)
+        # Store the note and update its timestamp in the user's index in one go
+        try:
+            if not await repository.update(note_hash, time.time(), stale_fields(note_data, note_hash), record.version):
+                return None
+        except VersionConflict:
+            if expected_version is not None:
+                raise
+            continue
         
-        if not note_ids:
-            return []
+        await publish_note_events(user_id, [_note_event("updated", updated)])
+        return updated.to_schema()
+    
+    raise VersionConflict(note_id)
+
+async def prepare_note_update(record: NoteRecord, note_update: NoteUpdate) -> NoteRecord:
+    """
+    Apply an update to a note record, handling encryption transitions
+    and sensitivity re-analysis.
+    
+    Returns the updated record; the given one is left as is.
+    """
+    record = record.copy()
+    was_encrypted = record.is_encrypted
+    
+    # Determine if the note should be encrypted after the update
+    new_is_encrypted = note_update.is_encrypted if note_update.is_encrypted is not None else was_encrypted
+    
+    # New plaintext content, if any, and the plaintext to analyze for sensitivity
+    content = note_update.content
+    original_content = None
+    
+    if was_encrypted and new_is_encrypted and note_update.old_encryption_password:
+        # Password change scenario for encrypted note - need to decrypt with old password first
+        if record.salt is None:
+            raise ValueError("Missing encryption salt. Cannot change password.")
+        try:
+            salt = _decode_salt(record.salt)
+            try:
+                decrypted_content = decrypt_text(record.content, note_update.old_encryption_password, salt)
+            except ValueError:
+                raise ValueError("Failed to decrypt with old password. Please make sure it is correct.")
+        except Exception as e:
+            raise ValueError(f"Error during password change: {str(e)}")
         
-        # Get all notes data
-        notes = []
-        for note_id in note_ids:
-            note_key = f"{NOTE_PREFIX}{note_id}"
-            note_data = await redis.hgetall(note_key)
-            
-            if note_data:
-                notes.append(note_dict_to_schema(note_data))
+        # If we're changing password but not content, re-encrypt the decrypted content
+        if content is None:
+            content = decrypted_content
+        original_content = content
+    elif content is not None:
+        original_content = content
+    
+    # Handle encryption state transitions
+    if new_is_encrypted and (not was_encrypted or content is not None):
+        # Encrypting a note, or storing new (or re-keyed) content of an
+        # encrypted note: encrypt with the new password and a fresh salt
+        if not note_update.encryption_password:
+            raise ValueError("Password is required to encrypt a note")
         
-        return notes
+        plaintext = content if content is not None else record.content
+        original_content = plaintext
+        encrypted_content, salt_bytes = encrypt_text(plaintext, note_update.encryption_password)
+        record.content = encrypted_content
+        record.salt = base64.b64encode(salt_bytes).decode()
+        record.blind_index = _blind_index(record.user_id, plaintext, note_update.encryption_password, note_update.search_tokens)
+    else:
+        if was_encrypted and not new_is_encrypted:
+            # Encrypted to unencrypted transition: drop the salt and blind index from the stored note
+            record.salt = None
+            record.blind_index = None
+        elif new_is_encrypted and note_update.search_tokens is not None:
+            # Unchanged encrypted content, re-indexed by the client
+            record.blind_index = _blind_index(record.user_id, record.content, None, note_update.search_tokens)
+        if content is not None:
+            record.content = content
+    
+    if note_update.title is not None:
+        record.title = note_update.title
+    if note_update.tags is not None:
+        record.tags = normalize_tags(note_update.tags)
+    record.is_encrypted = new_is_encrypted
+    record.touch()
+    
+    # Re-analyze sensitivity if content was updated
+    if original_content is not None:
+        sensitivity_data = await analyze_content(record.user_id, original_content, record.is_encrypted)
+        record.sensitivity_score = sensitivity_data["sensitivity_score"]
+        record.sensitivity_explanation = sensitivity_data["explanation"]
+    
+    return record
 
-async def update_note(note_id: str, user_id: str, note_update: NoteUpdate) -> Optional[Note]:
-    """Update a note in Redis."""
-    async with get_redis_client() as redis:
-        note_key = f"{NOTE_PREFIX}{note_id}"
-        note_data = await redis.hgetall(note_key)
-        
-        if not note_data:
+async def delete_note(note_id: str, user_id: str) -> bool:
+    """Delete a note from Redis."""
+    repository = get_note_repository()
+    note_data = await repository.get(user_id, note_id, consistent=True)
+    
+    if not note_data:
+        return False
+    
+    # Verify that the note belongs to the user
+    if note_data["user_id"] != user_id:
+        return False
+    
+    # Delete note data and remove from user's notes set
+    if not await repository.delete(user_id, note_id):
+        return False
+    await publish_note_events(user_id, [NoteEvent(type="deleted", id=note_id)])
+    return True
+
+def _note_event(event_type: str, record: NoteRecord) -> NoteEvent:
+    return NoteEvent(type=event_type, id=record.id, version=record.version, sensitivity_score=record.sensitivity_score)
+
+def _records_revision(old: NoteRecord, new: NoteRecord) -> bool:
+    """Whether writing new over old records old as a revision (see NOTE_REVISIONS)."""
+    if not settings.NOTE_REVISIONS or old.is_encrypted:
+        return False
+    return new.is_encrypted or new.title != old.title or new.content != old.content
+
+def _add_revision(note_hash: Dict, old: NoteRecord, new: NoteRecord, stored_index: Optional[str]) -> None:
+    """Make the write of note_hash record old as the note's newest revision."""
+    next_content = None if new.is_encrypted else new.content
+    note_hash[REVISION_FIELD] = record_revision(stored_index, old.version, old.updated_at, old.title, old.content, next_content)
+
+async def list_note_revisions(note_id: str, user_id: str) -> Optional[List[NoteRevision]]:
+    """Get the recorded revisions of a note, newest first; None if the note does not exist."""
+    note_data, stored = await get_note_repository().get_revisions(user_id, note_id)
+    if not note_data or note_data.get("user_id") != user_id:
+        return None
+    return [
+        NoteRevision(version=entry.version, title=entry.title, updated_at=entry.updated_at, size=entry.size, snapshot=entry.full)
+        for entry in parse_index(stored.get(REVISION_INDEX_FIELD)).entries
+    ]
+
+async def get_note_revision(note_id: str, user_id: str, version: int) -> Optional[NoteRevisionContent]:
+    """
+    Rebuild a revision of a note; None if the note or revision does not exist.
+    
+    The revision is read with the index in the same read, which is all it
+    takes when it is stored in full or diffs against the current note.
+    Otherwise the rest of its chain is read next, and the two reads are
+    retried if the note was written in between. Raises ValueError if the
+    revision can no longer be rebuilt.
+    """
+    repository = get_note_repository()
+    for _ in range(UPDATE_ATTEMPTS):
+        note_data, stored = await repository.get_revisions(user_id, note_id, [str(version)])
+        if not note_data or note_data.get("user_id") != user_id:
             return None
-        
-        # Verify that the note belongs to the user
-        if note_data["user_id"] != user_id:
+        index = parse_index(stored.get(REVISION_INDEX_FIELD))
+        chain = revision_chain(index.entries, version)
+        if chain is None:
             return None
+        if len(chain) > 1:
+            stored_index = stored.get(REVISION_INDEX_FIELD)
+            note_data, stored = await repository.get_revisions(user_id, note_id, [str(chain_version) for chain_version in chain])
+            if not note_data:
+                return None
+            if stored.get(REVISION_INDEX_FIELD) != stored_index:
+                continue
         
-        # Check if the note was originally encrypted
-        was_encrypted = note_data.get("is_encrypted", "False").lower() == "true"
-        
-        # Determine if the note should be encrypted after the update
-        new_is_encrypted = note_update.is_encrypted if note_update.is_encrypted is not None else was_encrypted
-        
-        # Store original content for sensitivity analysis
-        original_content = None
-        
-        # Handle different encryption scenarios
-        if was_encrypted and new_is_encrypted and note_update.old_encryption_password:
-            # Password change scenario for encrypted note - need to decrypt with old password first
-            if "salt" in note_data:
-                try:
-                    salt_str = note_data["salt"]
-                    try:
-                        salt = base64.b64decode(salt_str)
-                    except Exception as salt_error:
-                        padded_salt_str = salt_str + "=" * (-len(salt_str) % 4)
-                        salt = base64.b64decode(padded_salt_str)
-                    
-                    # Try to decrypt the content with old password
-                    encrypted_content = note_data["content"]
-                    try:
-                        # Decrypt the existing content with the old password
-                        decrypted_content = decrypt_text(encrypted_content, note_update.old_encryption_password, salt)
-                        
-                        # If we're changing password but not content, use the decrypted content
-                        if note_update.content is None:
-                            # Set the original decrypted content to be re-encrypted with new password
-                            note_update_dict = note_update.model_dump(exclude_unset=True)
-                            note_update_dict["content"] = decrypted_content
-                            note_update = NoteUpdate(**note_update_dict)
-                        
-                        # Store for sensitivity analysis
-                        original_content = note_update.content
-                        
-                        # Now we'll re-encrypt below with the new password
-                    except ValueError as e:
-                        raise ValueError("Failed to decrypt with old password. Please make sure it is correct.")
-                except Exception as e:
-                    raise ValueError(f"Error during password change: {str(e)}")
+        record = NoteRecord.from_hash(note_data)
+        # Revisions are binary, handed back surrogate-escaped like packed records
+        chain_data = [stored[str(chain_version)].encode("utf-8", "surrogateescape") for chain_version in chain]
+        content = rebuild_content(chain_data, index.head, None if record.is_encrypted else record.content)
+        entry = next(entry for entry in index.entries if entry.version == version)
+        return NoteRevisionContent(
+            version=entry.version, title=entry.title, updated_at=entry.updated_at, size=entry.size, snapshot=entry.full, content=content,
+        )
+    raise VersionConflict(note_id)
+
+async def apply_note_batch(user_id: str, operations: List[NoteBatchOperation]) -> List[NoteBatchResult]:
+    """
+    Apply a list of create/update/delete operations to a user's notes.
+    
+    Every note the batch refers to is read in one round trip, operations are
+    applied in order to that working copy (so later operations see earlier
+    ones), and the final state is written in a single transaction. Failed
+    operations are reported per item and do not stop the others. If a note
+    the batch changes was modified concurrently, nothing is written and
+    VersionConflict is raised.
+    """
+    repository = get_note_repository()
+    referenced_ids = list(dict.fromkeys(operation.id for operation in operations if operation.id))
+    original = await repository.get_many(user_id, referenced_ids)
+    
+    # Working copy: note id -> current record (None once deleted)
+    current: Dict[str, Optional[NoteRecord]] = {
+        note_id: NoteRecord.from_hash(note_data) for note_id, note_data in original.items() if note_data.get("user_id") == user_id
+    }
+    results = []
+    
+    for index, operation in enumerate(operations):
+        result = NoteBatchResult(index=index, op=operation.op, id=operation.id, status=200)
+        try:
+            if operation.op == "create":
+                record = await prepare_new_note(NoteCreate.model_validate(operation.data or {}), user_id)
+                current[record.id] = record
+                result.id = record.id
+                result.status = 201
+                result.note = record.to_schema()
+            elif current.get(operation.id) is None:
+                result.status = 404
+                result.error = "Note not found"
+            elif operation.op == "update":
+                note_update = NoteUpdate.model_validate(operation.data or {})
+                updated = await prepare_note_update(current[operation.id], note_update)
+                current[operation.id] = updated
+                result.note = updated.to_schema()
             else:
-                raise ValueError("Missing encryption salt. Cannot change password.")
-        elif note_update.content is not None:
-            original_content = note_update.content
-        
-        # Create a modified note_update to apply
-        modified_note_update = note_update
-        
-        # Handle encryption state transitions
-        if new_is_encrypted and not was_encrypted:
-            # Unencrypted to encrypted transition
-            if not note_update.encryption_password:
-                raise ValueError("Password is required to encrypt a note")
-                
-            content_to_encrypt = note_update.content or note_data.get("content", "")
-            original_content = content_to_encrypt
-            
-            # Encrypt with new password and salt
-            encrypted_content, salt = encrypt_text(content_to_encrypt, note_update.encryption_password)
-            salt_b64 = base64.b64encode(salt).decode()
-            
-            # Create updated note data
-            update_dict = note_update.model_dump(exclude_unset=True)
-            update_dict["content"] = encrypted_content
-            update_dict["salt"] = salt_b64
-            
-            # Remove sensitive data
-            update_dict.pop("encryption_password", None)
-            update_dict.pop("old_encryption_password", None)
-            
-            modified_note_update = NoteUpdate(**update_dict)
-            
-            # Explicitly ensure the salt gets stored in Redis
+                current[operation.id] = None
+                result.status = 204
+        except ValueError as e:
+            result.status = 400
+            result.error = str(e)
+        results.append(result)
+    
+    # Collapse the working copy into the writes that reach the final state
+    now = time.time()
+    # In the order the batch first touched them, each saved note gets its own
+    # index score, so the batch lists in that order (latest first) instead of
+    # as one run of equal scores
+    touched = list(dict.fromkeys(result.id for result in results if result.status in (200, 201, 204)))
+    saves = []
+    deletes = []
+    expected_versions = {}
+    events = []
+    for position, note_id in enumerate(touched):
+        if note_id in original:
+            expected_versions[note_id] = note_version(original[note_id])
+        record = current.get(note_id)
+        if record is None:
+            if note_id in original:
+                deletes.append(note_id)
+                events.append(NoteEvent(type="deleted", id=note_id))
+        else:
+            events.append(_note_event("updated" if note_id in original else "created", record))
+            note_hash = record.to_hash()
+            if note_id in original:
+                # One revision per note for the batch: the state it started from
+                original_record = NoteRecord.from_hash(original[note_id])
+                if _records_revision(original_record, record):
+                    _, revisions = await repository.get_revisions(user_id, note_id)
+                    _add_revision(note_hash, original_record, record, revisions.get(REVISION_INDEX_FIELD))
+            saves.append((note_hash, now + position * BATCH_SCORE_STEP, stale_fields(original.get(note_id, {}), note_hash)))
+    
+    await repository.write_batch(user_id, saves, deletes, expected_versions)
+    await publish_note_events(user_id, events)
+    return results
+
+async def export_user_notes(user_id: str) -> AsyncIterator[Union[str, bytes]]:
+    """
+    Stream all of a user's notes as NDJSON lines, most recently updated first.
+    
+    Notes are exported in their stored form (encrypted notes keep their
+    ciphertext and salt) and read in batches, so memory stays constant.
+    """
+    repository = get_note_repository()
+    position = None
+    while True:
+        page = await repository.list_after(user_id, position, BULK_BATCH_SIZE)
+        for note_data in page.notes:
+            record = NoteRecord.from_hash(note_data)
+            if settings.FAST_JSON_RESPONSES:
+                yield dumps(record.to_json()) + b"\n"
+            else:
+                yield record.to_schema().model_dump_json() + "\n"
+        if page.next_position is None:
+            break
+        position = page.next_position
+
+async def import_user_notes(user_id: str, chunks: AsyncIterable[bytes]) -> Tuple[NoteImportResult, List[str]]:
+    """
+    Import notes from a streamed NDJSON body, one note per line.
+    
+    Notes are written in batches without sensitivity analysis. Returns the
+    import result and the ids of plaintext notes whose analysis is deferred
+    (see analyze_imported_notes); invalid lines are reported and skipped.
+    A line over IMPORT_MAX_LINE_BYTES is reported and ends the import.
+    """
+    repository = get_note_repository()
+    result = NoteImportResult()
+    pending_analysis = []
+    batch = []
+    events = []
+    
+    try:
+        async for line_number, line in iter_ndjson_lines(chunks, settings.IMPORT_MAX_LINE_BYTES):
             try:
-                # Set the salt field directly to ensure it's stored
-                await redis.hset(note_key, "salt", salt_b64)
-                
-                # Verify the salt was stored
-                stored_salt = await redis.hget(note_key, "salt")
-                if not stored_salt:
-                    raise ValueError("Failed to store encryption salt in database")
-            except Exception as e:
-                # Continue with the update even if verification fails
-                pass
-        elif was_encrypted and not new_is_encrypted:
-            # Encrypted to unencrypted transition
-            
-            # Create a completely new note dict without the salt
-            clean_note_dict = {}
-            for key, value in note_data.items():
-                if key != "salt":
-                    clean_note_dict[key] = value
+                note_import = NoteImport.model_validate_json(line)
+                if note_import.is_encrypted and not note_import.salt:
+                    raise ValueError("Encrypted notes must include their salt")
+            except ValueError as e:
+                result.failed.append(NoteImportError(line=line_number, error=str(e)))
+                continue
             
-            # Use a more direct approach - delete and recreate the hash without the salt
-            try:
-                async with redis.pipeline() as pipe:
-                    # Delete the entire note hash
-                    await pipe.delete(note_key)
-                    
-                    # Recreate without the salt
-                    if clean_note_dict:
-                        await pipe.hset(note_key, mapping=clean_note_dict)
-                    
-                    # Execute pipeline
-                    await pipe.execute()
-                
-                # Verify salt was removed
-                note_data = await redis.hgetall(note_key)
-                if "salt" in note_data:
-                    raise ValueError("Failed to remove encryption salt")
-            except Exception as e:
-                # Continue with the update even if salt removal fails
-                pass
+            record = NoteRecord.from_import(note_import, user_id)
+            note_hash = record.to_hash()
             
-            # Also ensure salt is not in the update data
-            if hasattr(modified_note_update, "salt"):
-                update_dict = modified_note_update.model_dump(exclude_unset=True)
-                update_dict.pop("salt", None)
-                modified_note_update = NoteUpdate(**update_dict)
-        
-        # Update note data
-        updated_note = update_note_dict(note_data, modified_note_update)
-        
-        # Re-analyze sensitivity if content was updated
-        if original_content is not None:
-            # Analyze content sensitivity
-            sensitivity_data = await analyze_note_sensitivity(original_content)
+            # Only plaintext notes without a score can be analyzed later
+            if note_import.sensitivity is None and not note_import.is_encrypted:
+                pending_analysis.append(record.id)
+                # Their body has no analysis yet to share
+                note_hash.pop(BODY_SENSITIVITY_FIELD, None)
+            batch.append((note_hash, record.updated_at))
+            events.append(_note_event("created", record))
             
-            # Add sensitivity data to updated_note
-            updated_note["sensitivity_score"] = str(sensitivity_data["sensitivity_score"])
-            updated_note["sensitivity_explanation"] = sensitivity_data["explanation"]
-        
-        # Create a pipeline for atomic operations
-        async with redis.pipeline() as pipe:
-            # Store updated note data
-            await pipe.hset(note_key, mapping=updated_note)
-            
-            # Update timestamp in user's notes set for sorting
-            user_notes_key = f"{USER_NOTES_PREFIX}{user_id}"
-            await pipe.zadd(user_notes_key, {note_id: time.time()})
-            
-            # Execute pipeline
-            await pipe.execute()
-        
-        return note_dict_to_schema(updated_note)
+            if len(batch) >= BULK_BATCH_SIZE:
+                await repository.create_many(batch)
+                await publish_note_events(user_id, events)
+                result.imported += len(batch)
+                batch = []
+                events = []
+    except LineTooLong as e:
+        # The lines after it cannot be found without reading it whole, so
+        # the import stops there
+        result.failed.append(NoteImportError(line=e.line_number, error=str(e)))
+    
+    if batch:
+        await repository.create_many(batch)
+        await publish_note_events(user_id, events)
+        result.imported += len(batch)
+    
+    result.pending_analysis = len(pending_analysis)
+    return result, pending_analysis
 
-async def delete_note(note_id: str, user_id: str) -> bool:
-    """Delete a note from Redis."""
-    async with get_redis_client() as redis:
-        note_key = f"{NOTE_PREFIX}{note_id}"
-        note_data = await redis.hgetall(note_key)
-        
-        if not note_data:
-            return False
-        
-        # Verify that the note belongs to the user
-        if note_data["user_id"] != user_id:
-            return False
-        
-        # Delete note data and remove from user's notes set
-        async with redis.pipeline() as pipe:
-            await pipe.delete(note_key)
+async def analyze_imported_notes(user_id: str, note_ids: List[str]) -> None:
+    """
+    Run the deferred sensitivity analysis for imported notes.
+    
+    Results are written with a compare-and-set, so an edit made meanwhile is
+    never overwritten; the note is re-read (and re-analyzed only if its
+    content changed) until the write goes through.
+    """
+    repository = get_note_repository()
+    for note_id in note_ids:
+        analyzed_content = None
+        for _ in range(UPDATE_ATTEMPTS):
+            note_data = await repository.get(user_id, note_id, consistent=True)
+            if not note_data:
+                break
             
-            # Remove note ID from user's notes set
-            user_notes_key = f"{USER_NOTES_PREFIX}{user_id}"
-            await pipe.zrem(user_notes_key, note_id)
+            record = NoteRecord.from_hash(note_data)
+            if record.is_encrypted:
+                break
+            if record.content != analyzed_content:
+                sensitivity_data = await analyze_content(user_id, record.content, False)
+                analyzed_content = record.content
             
-            # Execute pipeline
-            await pipe.execute()
-        
-        return True 
\ No newline at end of file
+            expected_version = record.version
+            record.sensitivity_score = sensitivity_data["sensitivity_score"]
+            record.sensitivity_explanation = sensitivity_data["explanation"]
+            record.version += 1
+            note_hash = record.to_hash()
+            try:
+                # The note keeps its place in the index
+                if not await repository.update(note_hash, record.updated_at, stale_fields(note_data, note_hash), expected_version):
+                    break
+            except VersionConflict:
+                continue
+            await publish_note_events(user_id, [_note_event("analyzed", record)])
+            break
@@ -0,0 +1,114 @@
+"""
+Cold tiering of idle notes (see COLD_TIERING).
+
+Only opening a note (GET /notes/{id}) or writing it moves it back to Redis
+and counts as an access. Listings, search, export and /content read cold
+notes from their segment in place and leave them cold: a page lists up to
+a hundred notes, so moving back every note a listing touches would undo
+the tiering for anyone paging through their notes, and a listing would
+turn into a write per cold note. The price is that a cold note that keeps
+being listed is read from disk and decompressed on every such request; the
+segment reads go through mmap and the page cache keeps busy segments in
+memory (see benchmarks/bench_tiering.py for the cost of a cold read).
+"""
+import time
+from typing import Dict, Iterable, Optional
+
+from app.core.config import settings
+from app.models.note import NoteRecord, COLD_FIELD, stale_fields
+from app.repositories import get_note_repository, VersionConflict
+from app.utils.segments import SegmentWriter, get_segment_store
+
+# Notes moved out per atomic write
+TIER_BATCH_SIZE = 200
+
+# A segment written to in the last hour may still be getting its first
+# stubs (from a tiering run in progress), so it is never removed
+SEGMENT_GRACE_SECONDS = 3600
+
+async def tier_user_notes(user_id: str, writer: SegmentWriter, before: float) -> Dict[str, int]:
+    """
+    Move a user's notes neither written nor read since before out to cold segments.
+
+    Each batch of notes is appended to the writer's segments and synced to
+    disk before their stubs replace them in Redis, with a compare-and-set on
+    each note's version: a note written in between stays in Redis (its
+    record is left behind for collect_segments).
+    """
+    repository = get_note_repository()
+    counts = {"moved": 0, "changed": 0}
+    idle = await repository.list_idle(user_id, before)
+    for start in range(0, len(idle), TIER_BATCH_SIZE):
+        batch = idle[start:start + TIER_BATCH_SIZE]
+        notes = await repository.get_many(user_id, [note_id for note_id, _ in batch])
+
+        saves = []
+        expected_versions = {}
+        for note_id, score in batch:
+            note_data = notes.get(note_id)
+            # Deleted, or moved out by another run, since it was listed
+            if not note_data or COLD_FIELD in note_data:
+                continue
+            record = NoteRecord.from_hash(note_data)
+            stub = record.to_cold_stub(writer.append(user_id, note_id, record.to_archive()))
+            saves.append((stub, score, stale_fields(note_data, stub)))
+            expected_versions[note_id] = record.version
+        writer.sync()
+
+        try:
+            await repository.write_batch(user_id, saves, [], expected_versions)
+            counts["moved"] += len(saves)
+        except VersionConflict:
+            # Fall back to one compare-and-set per note for this batch
+            for stub, score, removed_fields in saves:
+                try:
+                    if await repository.update(stub, score, removed_fields, expected_versions[stub["id"]]):
+                        counts["moved"] += 1
+                except VersionConflict:
+                    counts["changed"] += 1
+    return counts
+
+async def tier_cold_notes(user_ids: Iterable[str], before: Optional[float] = None) -> Dict[str, int]:
+    """
+    Move the notes of users idle for COLD_AFTER_DAYS days (or since before) out to new cold segments.
+
+    Returns counts, with the bytes of segments written.
+    """
+    if before is None:
+        before = time.time() - settings.COLD_AFTER_DAYS * 86400
+    store = get_segment_store()
+    totals = {"users": 0, "moved": 0, "changed": 0, "segment_bytes": 0}
+    with store.writer() as writer:
+        for user_id in user_ids:
+            counts = await tier_user_notes(user_id, writer, before)
+            totals["users"] += 1
+            totals["moved"] += counts["moved"]
+            totals["changed"] += counts["changed"]
+    totals["segment_bytes"] = sum(store.size(name) for name in writer.names)
+    return totals
+
+async def collect_segments(idle_for: float = SEGMENT_GRACE_SECONDS) -> Dict[str, int]:
+    """
+    Remove the cold segments none of whose records a stub points to any more.
+
+    Records die when their note is moved back to Redis, moved out again or
+    deleted; a segment goes once all of its records are dead.
+    """
+    repository = get_note_repository()
+    store = get_segment_store()
+    counts = {"segments": 0, "removed": 0, "freed_bytes": 0}
+    for name in store.segments(idle_for):
+        counts["segments"] += 1
+        entries = list(store.entries(name))
+        live = False
+        for start in range(0, len(entries), TIER_BATCH_SIZE):
+            batch = entries[start:start + TIER_BATCH_SIZE]
+            locators = await repository.get_cold_locators([(user_id, note_id) for user_id, note_id, _ in batch])
+            if any(current == locator for current, (_, _, locator) in zip(locators, batch)):
+                live = True
+                break
+        if not live:
+            counts["freed_bytes"] += store.size(name)
+            store.remove(name)
+            counts["removed"] += 1
+    return counts
@@ -1,13 +1,16 @@
 from typing import Dict, Optional, List
 import json
 
-from app.core.database import get_redis_client, USER_PREFIX
+from app.repositories import get_user_repository, get_note_repository, PurgeProgress
 from app.models.user import create_user_dict, update_user_dict, user_dict_to_schema, user_dict_to_db_schema
 from app.schemas.user import UserCreate, User, UserUpdate, UserInDB
 from app.utils.recaptcha import verify_recaptcha
 from app.core.config import settings
 from fastapi import HTTPException, status
 
+# Notes deleted per atomic purge step of a deleted user
+PURGE_BATCH_SIZE = 500
+
 async def create_user(user_create: UserCreate) -> User:
     """Create a new user in Redis."""
     
@@ -27,110 +30,107 @@ async def create_user(user_create: UserCreate) -> User:
             )
     
     user_dict = create_user_dict(user_create)
+    repository = get_user_repository()
+    
+    # Check if username already exists
+    if await repository.username_exists(user_create.username):
+        raise ValueError(f"Username {user_create.username} already exists")
+    
+    # Check if email already exists
+    if await repository.email_exists(user_create.email):
+        raise ValueError(f"Email {user_create.email} already exists")
     
-    async with get_redis_client() as redis:
-        # Check if username already exists
-        username_key = f"{USER_PREFIX}username:{user_create.username}"
-        if await redis.exists(username_key):
-            raise ValueError(f"Username {user_create.username} already exists")
-        
-        # Check if email already exists
-        email_key = f"{USER_PREFIX}email:{user_create.email}"
-        if await redis.exists(email_key):
-            raise ValueError(f"Email {user_create.email} already exists")
-        
-        # Create a pipeline for atomic operations
-        async with redis.pipeline() as pipe:
-            # Store user data
-            user_key = f"{USER_PREFIX}{user_dict['id']}"
-            await pipe.hset(user_key, mapping=user_dict)
-            
-            # Create indexes for fast lookups
-            await pipe.set(username_key, user_dict["id"])
-            await pipe.set(email_key, user_dict["id"])
-            
-            # Execute pipeline
-            await pipe.execute()
+    # Store user data and create indexes for fast lookups
+    await repository.create(user_dict)
     
     return user_dict_to_schema(user_dict)
 
 async def get_user_by_id(user_id: str) -> Optional[User]:
     """Get a user by ID."""
-    async with get_redis_client() as redis:
-        user_key = f"{USER_PREFIX}{user_id}"
-        user_data = await redis.hgetall(user_key)
-        
-        if not user_data:
-            return None
-        
-        return user_dict_to_schema(user_data)
+    user_data = await get_user_repository().get(user_id)
+    
+    if not user_data:
+        return None
+    
+    return user_dict_to_schema(user_data)
 
 async def get_user_by_username(username: str) -> Optional[UserInDB]:
     """Get a user by username including password."""
-    async with get_redis_client() as redis:
-        # Get user ID from username index
-        username_key = f"{USER_PREFIX}username:{username}"
-        user_id = await redis.get(username_key)
-        
-        if not user_id:
-            return None
-        
-        # Get user data
-        user_key = f"{USER_PREFIX}{user_id}"
-        user_data = await redis.hgetall(user_key)
-        
-        if not user_data:
-            return None
-        
-        return user_dict_to_db_schema(user_data)
+    user_data = await get_user_repository().get_by_username(username)
+    
+    if not user_data:
+        return None
+    
+    return user_dict_to_db_schema(user_data)
 
 async def update_user(user_id: str, user_update: UserUpdate) -> Optional[User]:
     """Update a user in Redis."""
-    async with get_redis_client() as redis:
-        user_key = f"{USER_PREFIX}{user_id}"
-        user_data = await redis.hgetall(user_key)
-        
-        if not user_data:
-            return None
-        
-        # If email is being updated, check if new email already exists
-        if user_update.email is not None and user_update.email != user_data["email"]:
-            old_email_key = f"{USER_PREFIX}email:{user_data['email']}"
-            new_email_key = f"{USER_PREFIX}email:{user_update.email}"
-            
-            if await redis.exists(new_email_key):
-                raise ValueError(f"Email {user_update.email} already exists")
-            
-            # Update email index in transaction
-            async with redis.pipeline() as pipe:
-                await pipe.delete(old_email_key)
-                await pipe.set(new_email_key, user_id)
-                await pipe.execute()
-        
-        # Update user data
-        updated_user = update_user_dict(user_data, user_update)
-        await redis.hset(user_key, mapping=updated_user)
-        
-        return user_dict_to_schema(updated_user)
+    repository = get_user_repository()
+    user_data = await repository.get(user_id, consistent=True)
+    
+    if not user_data:
+        return None
+    
+    # If email is being updated, check if new email already exists
+    old_email = None
+    if user_update.email is not None and user_update.email != user_data["email"]:
+        if await repository.email_exists(user_update.email):
+            raise ValueError(f"Email {user_update.email} already exists")
+        old_email = user_data["email"]
+    
+    # Update user data (and the email index if it changed)
+    updated_user = update_user_dict(user_data, user_update)
+    await repository.update(updated_user, old_email)
+    
+    return user_dict_to_schema(updated_user)
 
 async def delete_user(user_id: str) -> bool:
-    """Delete a user from Redis."""
-    async with get_redis_client() as redis:
-        user_key = f"{USER_PREFIX}{user_id}"
-        user_data = await redis.hgetall(user_key)
-        
-        if not user_data:
-            return False
-        
-        # Delete all user data and indexes
-        async with redis.pipeline() as pipe:
-            username_key = f"{USER_PREFIX}username:{user_data['username']}"
-            email_key = f"{USER_PREFIX}email:{user_data['email']}"
-            
-            await pipe.delete(username_key)
-            await pipe.delete(email_key)
-            await pipe.delete(user_key)
-            
-            await pipe.execute()
-        
-        return True 
\ No newline at end of file
+    """
+    Delete a user from Redis.
+    
+    The user record and lookups go at once, whatever the size of the account;
+    their notes are queued for purge_user_data, which the caller should run
+    in the background.
+    """
+    repository = get_user_repository()
+    user_data = await repository.get(user_id, consistent=True)
+    
+    if not user_data:
+        return False
+    
+    # Delete the user and their lookups, and queue their notes for purge
+    await repository.delete(user_data)
+    
+    return True
+
+async def purge_user_data(user_id: str) -> PurgeProgress:
+    """
+    Delete all the notes of a deleted user, batch by batch.
+    
+    Every batch is atomic and the queue entry is only dropped at the end, so
+    an interrupted purge is resumed by running it again (see
+    purge_deleted_users). A queued user still stored is the remains of a
+    delete that stopped halfway (it is not atomic with REDIS_CLUSTER), which
+    is finished first.
+    """
+    users = get_user_repository()
+    user_data = await users.get(user_id, consistent=True)
+    if user_data:
+        await users.delete(user_data)
+    notes = get_note_repository()
+    progress = await notes.purge_notes(user_id, PURGE_BATCH_SIZE)
+    while progress.remaining:
+        progress = await notes.purge_notes(user_id, PURGE_BATCH_SIZE)
+    await users.forget_deleted(user_id)
+    return progress
+
+async def purge_deleted_users() -> Dict[str, int]:
+    """Finish the purge of every deleted user still queued; returns notes deleted per user."""
+    repository = get_user_repository()
+    purged = {}
+    user_ids = await repository.list_deleted()
+    while user_ids:
+        for user_id in user_ids:
+            purged[user_id] = (await purge_user_data(user_id)).deleted
+        user_ids = await repository.list_deleted()
+    return purged
@@ -0,0 +1,77 @@
+"""
+Chunked storage of large note contents (see CONTENT_CHUNK_THRESHOLD).
+
+Stored content (plaintext, or the ciphertext of an encrypted note) of at
+least CONTENT_CHUNK_THRESHOLD bytes is cut into CONTENT_CHUNK_SIZE-byte
+chunks, kept in a hash of their own next to the note: chunk i under str(i)
+and the layout of the content under LAYOUT_FIELD. Plaintext chunks are
+each compressed on their own with CONTENT_COMPRESSION, so any byte range of
+the content can be served by reading and decoding only the chunks it spans.
+
+The note hash holds the same layout, which names the content's digest: a
+reader going through the chunks one at a time reads the layout with each
+chunk and notices when the content was replaced under it.
+"""
+import hashlib
+from typing import List, NamedTuple, Tuple, Union
+
+from app.core.config import settings
+from app.utils.compression import compress, decompress
+
+LAYOUT_FIELD = "m"
+
+class ChunkLayout(NamedTuple):
+    """How a note's content is cut into chunks."""
+    # Codec of every chunk, "" when they are stored as they are
+    codec: str
+    # Bytes of content per chunk (the last one may be shorter)
+    size: int
+    # Bytes of content in all
+    length: int
+    # SHA-256 of the content
+    digest: str
+
+    @property
+    def count(self) -> int:
+        return -(-self.length // self.size)
+
+    def span(self, start: int, end: int) -> range:
+        """Chunks holding the content bytes start to end, inclusive."""
+        return range(start // self.size, end // self.size + 1)
+
+def parse_layout(value: str) -> ChunkLayout:
+    """Parse a stored chunk layout."""
+    codec, size, length, digest = value.split(":")
+    return ChunkLayout(codec, int(size), int(length), digest)
+
+def format_layout(layout: ChunkLayout) -> str:
+    """Encode a chunk layout for storage."""
+    return f"{layout.codec}:{layout.size}:{layout.length}:{layout.digest}"
+
+def needs_chunks(content: str) -> bool:
+    """Whether content is stored in chunks as configured (a cheap check on its length first)."""
+    threshold = settings.CONTENT_CHUNK_THRESHOLD
+    # A character is 1 to 4 bytes in UTF-8
+    return threshold > 0 and len(content) * 4 >= threshold and len(content.encode()) >= threshold
+
+def split_content(content: str, compressible: bool) -> Tuple[ChunkLayout, List[bytes]]:
+    """Cut content into its stored chunks; only compressible (plaintext) content is compressed."""
+    data = content.encode()
+    codec = settings.CONTENT_COMPRESSION if compressible and settings.CONTENT_COMPRESSION != "none" else ""
+    size = settings.CONTENT_CHUNK_SIZE
+    layout = ChunkLayout(codec, size, len(data), hashlib.sha256(data).hexdigest())
+    chunks = [data[offset:offset + size] for offset in range(0, len(data), size)]
+    if codec:
+        chunks = [compress(codec, chunk, settings.CONTENT_COMPRESSION_LEVEL) for chunk in chunks]
+    return layout, chunks
+
+def decode_chunk(layout: ChunkLayout, stored: Union[str, bytes]) -> bytes:
+    """Content bytes of a stored chunk."""
+    # Redis hands binary values back as surrogate-escaped str
+    if isinstance(stored, str):
+        stored = stored.encode("utf-8", "surrogateescape")
+    return decompress(layout.codec, stored) if layout.codec else stored
+
+def join_chunks(layout: ChunkLayout, chunks: List[Union[str, bytes]]) -> str:
+    """Content of a note from all its stored chunks, in order."""
+    return b"".join(decode_chunk(layout, chunk) for chunk in chunks).decode()
@@ -0,0 +1,60 @@
+import zlib
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for the "zstd" codec
+    zstandard = None
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+# Ids of the codecs inside packed records (msgpack ext type codes)
+CODEC_IDS = {ZLIB: 1, ZSTD: 2}
+CODEC_NAMES = {code: name for name, code in CODEC_IDS.items()}
+
+def _zstandard():
+    if zstandard is None:
+        raise RuntimeError("The zstd codec needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+def compress(codec: str, data: bytes, level: int) -> bytes:
+    """Compress data with the named codec."""
+    if codec == ZLIB:
+        return zlib.compress(data, level)
+    if codec == ZSTD:
+        return _zstandard().ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Decompress data written by compress()."""
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        return _zstandard().ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+def compress_text(text: str) -> Optional[Tuple[str, bytes]]:
+    """
+    Compress text as configured by CONTENT_COMPRESSION.
+
+    Returns (codec, compressed bytes), or None when the text is left as is:
+    compression is off, the text is below CONTENT_COMPRESSION_THRESHOLD bytes,
+    or it would not get smaller.
+    """
+    codec = settings.CONTENT_COMPRESSION
+    if codec == "none":
+        return None
+    data = text.encode()
+    if len(data) < settings.CONTENT_COMPRESSION_THRESHOLD:
+        return None
+    compressed = compress(codec, data, settings.CONTENT_COMPRESSION_LEVEL)
+    if len(compressed) >= len(data):
+        return None
+    return codec, compressed
+
+def decompress_text(codec: str, data: bytes) -> str:
+    """Inverse of compress_text."""
+    return decompress(codec, data).decode()
@@ -5,6 +5,9 @@ import base64
 import os
 from typing import Tuple
 
+# Salt of a user's blind index key, followed by the user id
+BLIND_INDEX_SALT_PREFIX = b"note-blind-index:"
+
 def generate_key_from_password(password: str, salt: bytes = None) -> Tuple[bytes, bytes]:
     """Generate a Fernet key from a password and salt."""
     if not salt:
@@ -42,6 +45,23 @@ def generate_key_from_password(password: str, salt: bytes = None) -> Tuple[bytes
     except Exception as e:
         raise ValueError(f"Failed to generate encryption key: {str(e)}")
 
+def derive_blind_index_key(password: str, user_id: str) -> bytes:
+    """
+    Derive the key of a user's blind index (see app.utils.search.blind_tokens) from a password.
+    
+    Unlike the encryption key, the salt is fixed per user, so all notes a user
+    encrypts with the same password get the same tokens for the same words.
+    """
+    if not password:
+        raise ValueError("Password cannot be empty")
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=BLIND_INDEX_SALT_PREFIX + user_id.encode('utf-8'),
+        iterations=100000,
+    )
+    return kdf.derive(password.encode('utf-8'))
+
 def encrypt_text(text: str, password: str) -> Tuple[str, bytes]:
     """Encrypt text using a password."""
     try:
@@ -0,0 +1,53 @@
+from typing import Optional
+
+# Version that no stored note has, for If-Match values that can never match
+UNMATCHABLE_VERSION = -1
+
+def version_etag(version: int) -> str:
+    """Strong ETag of a note version."""
+    return f'"{version}"'
+
+def content_etag(digest: str) -> str:
+    """Strong ETag of a note's content bytes, from their SHA-256 digest."""
+    return f'"{digest}"'
+
+def list_etag(user_id: str, version: int) -> str:
+    """
+    Strong ETag of a user's note list version.
+
+    List URLs are the same for every user, so the tag names the user too:
+    a browser shared by two accounts must not revalidate one user's cached
+    list with the other's version number.
+    """
+    return f'"{user_id}.{version}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison, as the header requires)."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+def parse_if_match(header: str) -> Optional[int]:
+    """
+    Note version required by an If-Match header.
+
+    "*" matches any existing note and gives None. Only the first listed tag
+    is used; weak or malformed tags can never match (If-Match compares
+    strongly) and give UNMATCHABLE_VERSION.
+    """
+    tag = header.split(",")[0].strip()
+    if tag == "*":
+        return None
+    if len(tag) < 2 or not (tag.startswith('"') and tag.endswith('"')):
+        return UNMATCHABLE_VERSION
+    try:
+        return int(tag[1:-1])
+    except ValueError:
+        return UNMATCHABLE_VERSION
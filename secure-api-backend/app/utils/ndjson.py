@@ -0,0 +1,32 @@
+from typing import AsyncIterable, AsyncIterator, Optional, Tuple
+
+class LineTooLong(ValueError):
+    """An NDJSON line is longer than the most a reader buffers."""
+
+    def __init__(self, line_number: int, max_line_bytes: int):
+        super().__init__(f"Line is longer than {max_line_bytes} bytes")
+        self.line_number = line_number
+
+async def iter_ndjson_lines(chunks: AsyncIterable[bytes], max_line_bytes: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Split a streamed NDJSON body into (line number, line) pairs, skipping blank lines.
+    
+    With max_line_bytes, at most that much of a line (plus one chunk) is
+    buffered: a longer line raises LineTooLong, as the lines after it
+    cannot be read without holding it whole.
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if max_line_bytes and len(line) > max_line_bytes:
+                raise LineTooLong(line_number, max_line_bytes)
+            if line.strip():
+                yield line_number, line.decode("utf-8", errors="replace")
+        if max_line_bytes and len(buffer) > max_line_bytes:
+            raise LineTooLong(line_number + 1, max_line_bytes)
+    if buffer.strip():
+        yield line_number + 1, buffer.decode("utf-8", errors="replace")
@@ -0,0 +1,27 @@
+import base64
+import json
+from typing import Optional, Tuple
+
+def encode_cursor(position: Tuple[float, str], order: Optional[str] = None) -> str:
+    """
+    Encode an index position (score, note id) as an opaque URL-safe cursor.
+
+    Positions in a secondary index (see SORT_INDEXES) carry its order, so a
+    cursor cannot be continued in another one.
+    """
+    score, note_id = position
+    items = [repr(score), note_id] + ([order] if order else [])
+    raw = json.dumps(items, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, order: Optional[str] = None) -> Tuple[float, str]:
+    """Decode a cursor produced by encode_cursor for the same order."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, note_id, *cursor_order = json.loads(raw)
+        position = float(score), str(note_id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if (cursor_order[0] if cursor_order else None) != order:
+        raise ValueError("Pagination cursor belongs to another sort order")
+    return position
@@ -0,0 +1,30 @@
+import re
+from typing import Optional, Tuple
+
+# A single byte range: first-last, first- or -suffix
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)", re.ASCII | re.IGNORECASE)
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte (inclusive) a Range header asks for, out of length bytes.
+
+    Returns None when the header is to be ignored and the whole content
+    served: it is malformed, names another unit, or asks for several ranges
+    (which would need a multipart answer). Raises ValueError when the range
+    holds no byte of the content (416 Range Not Satisfiable).
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if not match or not (match[1] or match[2]):
+        return None
+    first, last = match[1], match[2]
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or length == 0:
+            raise ValueError("Range not satisfiable")
+        return max(length - suffix, 0), length - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= length:
+        raise ValueError("Range not satisfiable")
+    return start, min(int(last), length - 1) if last else length - 1
@@ -0,0 +1,230 @@
+"""
+Note revision history (see NOTE_REVISIONS).
+
+A revision is the title and plaintext content a note had at one version,
+recorded when an update replaces them. Revisions are stored newest first as
+reverse deltas: the content of a revision is a binary diff against the
+content of the next newer revision, or of the note itself for the newest
+one. Every NOTE_REVISIONS_SNAPSHOT_INTERVAL-th revision (and any revision
+whose diff would not be smaller) is stored in full instead, so rebuilding a
+revision applies fewer deltas than that interval. Since revisions only
+depend on newer ones, the oldest can always be dropped to stay within
+NOTE_REVISIONS_MAX and NOTE_REVISIONS_MAX_BYTES.
+
+A note's revisions live in one hash: INDEX_FIELD holds the JSON index
+(version, update time, title, full or delta, stored size per revision,
+newest first) and each revision is stored under its version. The index also
+keeps the digest of the content the newest deltas apply to, so deltas left
+behind by a content change that was not recorded (with NOTE_REVISIONS off)
+are detected and dropped rather than applied to the wrong base.
+"""
+import hashlib
+import json
+import zlib
+from difflib import SequenceMatcher
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import msgpack
+
+from app.core.config import settings
+
+INDEX_FIELD = "index"
+
+# First byte of a stored revision
+SNAPSHOT = b"s"
+COMPRESSED_SNAPSHOT = b"z"
+DELTA = b"d"
+
+class RevisionEntry(NamedTuple):
+    """A revision as listed in a note's revision index."""
+    version: int
+    updated_at: float
+    title: str
+    full: bool
+    size: int
+
+class RevisionIndex(NamedTuple):
+    """A note's revision index."""
+    # Digest of the content the newest deltas apply to, None if none do
+    head: Optional[str]
+    # Revisions, newest first
+    entries: List[RevisionEntry]
+
+def parse_index(value: Optional[str]) -> RevisionIndex:
+    """Parse a stored revision index (empty when there is none)."""
+    if not value:
+        return RevisionIndex(None, [])
+    data = json.loads(value)
+    entries = [RevisionEntry(version, updated_at, title, bool(full), size) for version, updated_at, title, full, size in data["revisions"]]
+    return RevisionIndex(data["head"], entries)
+
+def format_index(index: RevisionIndex) -> str:
+    """Encode a revision index for storage."""
+    revisions = [[entry.version, entry.updated_at, entry.title, int(entry.full), entry.size] for entry in index.entries]
+    return json.dumps({"head": index.head, "revisions": revisions}, separators=(",", ":"))
+
+def content_head(content: str) -> str:
+    """Digest identifying the content deltas are based on."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _lines(data: bytes) -> List[bytes]:
+    return data.splitlines(keepends=True)
+
+def diff(base: bytes, target: bytes) -> bytes:
+    """
+    Encode target as a delta against base.
+
+    The delta is a msgpack list of [offset, length] ranges copied from base
+    and byte strings inserted as they are. Lines are matched, after the
+    common leading and trailing lines are taken out, so a local edit of a
+    long note diffs in time proportional to the edited part.
+    """
+    base_lines, target_lines = _lines(base), _lines(target)
+    head = 0
+    while head < min(len(base_lines), len(target_lines)) and base_lines[head] == target_lines[head]:
+        head += 1
+    tail = 0
+    while (tail < min(len(base_lines), len(target_lines)) - head
+           and base_lines[-1 - tail] == target_lines[-1 - tail]):
+        tail += 1
+
+    offsets = [0]
+    for line in base_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    ops: List[Union[List[int], bytes]] = []
+
+    def copy(start: int, stop: int) -> None:
+        if start == stop:
+            return
+        if ops and isinstance(ops[-1], list) and ops[-1][0] + ops[-1][1] == offsets[start]:
+            ops[-1][1] += offsets[stop] - offsets[start]
+        else:
+            ops.append([offsets[start], offsets[stop] - offsets[start]])
+
+    def insert(data: bytes) -> None:
+        if not data:
+            return
+        if ops and isinstance(ops[-1], bytes):
+            ops[-1] += data
+        else:
+            ops.append(data)
+
+    copy(0, head)
+    base_middle = base_lines[head:len(base_lines) - tail]
+    target_middle = target_lines[head:len(target_lines) - tail]
+    matcher = SequenceMatcher(None, base_middle, target_middle, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            copy(head + i1, head + i2)
+        else:
+            insert(b"".join(target_middle[j1:j2]))
+    copy(len(base_lines) - tail, len(base_lines))
+    return msgpack.packb(ops)
+
+def patch(base: bytes, delta: bytes) -> bytes:
+    """Apply a delta written by diff to its base."""
+    return b"".join(
+        base[op[0]:op[0] + op[1]] if isinstance(op, list) else op
+        for op in msgpack.unpackb(delta)
+    )
+
+def encode_snapshot(content: bytes) -> bytes:
+    """Store a revision in full, compressed when that makes it smaller."""
+    compressed = zlib.compress(content)
+    if len(compressed) < len(content):
+        return COMPRESSED_SNAPSHOT + compressed
+    return SNAPSHOT + content
+
+def record_revision(stored_index: Optional[str], version: int, updated_at: float, title: str,
+                    content: str, next_content: Optional[str]) -> Tuple[Dict[str, Union[str, bytes]], List[str]]:
+    """
+    Record the state a note is leaving as its newest revision.
+
+    The revision holds the note's title and plaintext content at version;
+    next_content is the plaintext it is being replaced with, or None when
+    the note becomes encrypted (then the revision is stored in full). Returns
+    the revision hash fields to set (the revision and the new index) and the
+    fields of the revisions dropped to stay within the limits.
+    """
+    index = parse_index(stored_index)
+    entries = index.entries
+    data = content.encode()
+    deltas_on_top = 0
+    for entry in entries:
+        if entry.full:
+            break
+        deltas_on_top += 1
+    if deltas_on_top and index.head != content_head(content):
+        # The content changed since those deltas were written: they cannot be rebuilt
+        entries, orphaned = entries[deltas_on_top:], entries[:deltas_on_top]
+        deltas_on_top = 0
+    else:
+        orphaned = []
+
+    stored = None
+    if next_content is not None and deltas_on_top < settings.NOTE_REVISIONS_SNAPSHOT_INTERVAL - 1:
+        stored = DELTA + diff(next_content.encode(), data)
+    snapshot = encode_snapshot(data) if stored is None or len(stored) >= len(data) else None
+    if snapshot is not None and (stored is None or len(snapshot) < len(stored)):
+        stored = snapshot
+    entry = RevisionEntry(version, updated_at, title, stored[:1] != DELTA, len(stored))
+
+    # Keep the newest revisions that fit the limits
+    kept: List[RevisionEntry] = []
+    total = 0
+    for candidate in [entry] + entries:
+        total += candidate.size
+        if len(kept) >= settings.NOTE_REVISIONS_MAX or total > settings.NOTE_REVISIONS_MAX_BYTES:
+            break
+        kept.append(candidate)
+    dropped = [str(candidate.version) for candidate in orphaned + ([entry] + entries)[len(kept):]]
+
+    head = content_head(next_content) if next_content is not None else None
+    items: Dict[str, Union[str, bytes]] = {INDEX_FIELD: format_index(RevisionIndex(head, kept))}
+    if kept and kept[0] is entry:
+        items[str(version)] = stored
+    return items, [field for field in dropped if field != str(version)]
+
+def revision_chain(entries: List[RevisionEntry], version: int) -> Optional[List[int]]:
+    """
+    Versions of the stored revisions needed to rebuild a revision, oldest first.
+
+    The chain runs from the revision up to the first one stored in full; it
+    ends with a delta when the note's current content is its base. None if
+    the version has no revision.
+    """
+    chain: List[int] = []
+    # The index is newest first: walk from the revision towards newer ones
+    for entry in reversed(entries):
+        if entry.version == version or chain:
+            chain.append(entry.version)
+            if entry.full:
+                return chain
+    return chain or None
+
+def rebuild_content(chain: List[bytes], head: Optional[str], current_content: Optional[str]) -> str:
+    """
+    Rebuild a revision's content from the stored revisions of its chain.
+
+    The chain is given oldest first, as listed by revision_chain; when it
+    ends with a delta, current_content (the note's plaintext, None if it is
+    encrypted) is its base and must still match the index head.
+    """
+    if chain[-1][:1] == DELTA:
+        if current_content is None or content_head(current_content) != head:
+            raise ValueError("The note changed without recording this revision's successor; it can no longer be rebuilt")
+        data = current_content.encode()
+    else:
+        data = b""
+    for stored in reversed(chain):
+        kind, payload = stored[:1], stored[1:]
+        if kind == SNAPSHOT:
+            data = payload
+        elif kind == COMPRESSED_SNAPSHOT:
+            data = zlib.decompress(payload)
+        elif kind == DELTA:
+            data = patch(data, payload)
+        else:
+            raise ValueError(f"Unknown revision format: {kind!r}")
+    return data.decode()
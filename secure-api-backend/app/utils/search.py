@@ -0,0 +1,94 @@
+import hashlib
+import hmac
+import math
+import re
+import unicodedata
+from typing import Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 32
+# Title tokens are also indexed by their prefixes of these lengths
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 10
+# Words of the title count this much more than one occurrence in the content
+TITLE_WEIGHT = 3.0
+# Upper bound on the terms indexed per note (the heaviest are kept)
+MAX_TERMS_PER_NOTE = 1000
+
+# Term kinds, prefixed to the term in posting keys
+TOKEN_TERM = "t:"
+PREFIX_TERM = "p:"
+# Blind index tokens of encrypted notes (see blind_tokens)
+BLIND_TERM = "b:"
+
+# Hex digits of a blind index token (a truncated HMAC-SHA256)
+BLIND_TOKEN_LENGTH = 32
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase, accent-free word tokens."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_RE.findall(text) if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH]
+
+def index_terms(title: str, content: str) -> Dict[str, float]:
+    """
+    Weighted search terms of a note.
+
+    Content tokens weigh 1 + log(occurrences), title tokens TITLE_WEIGHT on
+    top of that, and title token prefixes 1 (so an exact word outranks a
+    prefix match).
+    """
+    counts: Dict[str, int] = {}
+    for token in tokenize(content):
+        counts[token] = counts.get(token, 0) + 1
+    terms = {TOKEN_TERM + token: 1 + math.log(count) for token, count in counts.items()}
+    for token in set(tokenize(title)):
+        terms[TOKEN_TERM + token] = terms.get(TOKEN_TERM + token, 0.0) + TITLE_WEIGHT
+        for length in range(MIN_PREFIX_LENGTH, min(len(token), MAX_PREFIX_LENGTH + 1)):
+            terms.setdefault(PREFIX_TERM + token[:length], 1.0)
+    if len(terms) > MAX_TERMS_PER_NOTE:
+        terms = dict(sorted(terms.items(), key=lambda item: -item[1])[:MAX_TERMS_PER_NOTE])
+    return terms
+
+def encode_terms(terms: Dict[str, float]) -> str:
+    """Space-separated "term weight" pairs, as read by WRITE_NOTES_SCRIPT."""
+    return " ".join(f"{term} {weight:.3f}" for term, weight in terms.items())
+
+def decode_terms(encoded: str) -> Dict[str, float]:
+    """Inverse of encode_terms."""
+    items = encoded.split()
+    return {items[i]: float(items[i + 1]) for i in range(0, len(items) - 1, 2)}
+
+def parse_query(query: str) -> Tuple[List[str], str]:
+    """
+    Split a query into the terms every match must contain.
+
+    Returns the token terms of all words but the last, and the last word,
+    which also matches as a title prefix (search as you type).
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        raise ValueError("The search query has no words to look for")
+    return [TOKEN_TERM + token for token in tokens[:-1]], tokens[-1]
+
+def blind_tokens(key: bytes, text: str) -> List[str]:
+    """
+    Blind index tokens of the words of a text: the hex HMAC-SHA256 of each
+    token (as split by tokenize) under the key, truncated to BLIND_TOKEN_LENGTH.
+
+    Equal words give equal tokens under one key, but the tokens do not
+    reveal the words without the key.
+    """
+    tokens = dict.fromkeys(
+        hmac.new(key, token.encode(), hashlib.sha256).hexdigest()[:BLIND_TOKEN_LENGTH] for token in tokenize(text)
+    )
+    return list(tokens)[:MAX_TERMS_PER_NOTE]
+
+def blind_terms(tokens: List[str]) -> Dict[str, float]:
+    """Search terms of a blind index; every token weighs 1."""
+    return {BLIND_TERM + token: 1.0 for token in tokens}
+
+def idf(matching: int, total: int) -> float:
+    """Inverse document frequency of a term found in matching of total notes."""
+    return math.log(1 + total / max(matching, 1))
@@ -0,0 +1,170 @@
+"""
+Cold note segments (see COLD_TIERING).
+
+Notes moved out of Redis are appended to segment files in
+COLD_SEGMENT_DIR, each note one zlib-compressed msgpack record of its
+archived hash (see NoteRecord.to_archive). The note's stub in Redis keeps
+the locator of its record, "<segment>:<offset>:<length>", which is the index
+of the segments: records are read back through mmap by locator, without
+searching. Each segment has a sidecar ".idx" file listing the user id, note
+id and locator of its records, one per line, so segments whose records are
+no longer referenced by any stub can be found and removed.
+
+Segments are append-only: a note moved back to Redis, or moved out again,
+leaves its old record behind until the whole segment is dead. Every run of
+the tiering job writes its own segments, rolled over at
+COLD_SEGMENT_MAX_BYTES, and syncs them to disk before the stubs pointing
+into them are written.
+"""
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import msgpack
+
+from app.core.config import settings
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+# Segments kept mapped by a reader, least recently used unmapped first
+MAX_MAPPED_SEGMENTS = 64
+
+def parse_locator(locator: str) -> Tuple[str, int, int]:
+    """Segment name, offset and length of a record locator."""
+    name, offset, length = locator.rsplit(":", 2)
+    return name, int(offset), int(length)
+
+class SegmentWriter:
+    """Appends records to new segments of a store; use it as a context manager."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Names of the segments written so far
+        self.names: List[str] = []
+        self._segment = None
+        self._index = None
+        self._size = 0
+
+    def _roll(self) -> None:
+        self.close()
+        name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        self._segment = open(os.path.join(self.directory, name + SEGMENT_SUFFIX), "ab")
+        self._index = open(os.path.join(self.directory, name + INDEX_SUFFIX), "a")
+        self._size = 0
+        self.names.append(name)
+
+    def append(self, user_id: str, note_id: str, record: Dict[str, str]) -> str:
+        """Append a note's archived hash and return its locator (durable only after sync())."""
+        if self._segment is None or self._size >= self.max_bytes:
+            self._roll()
+        payload = zlib.compress(msgpack.packb(record))
+        offset = self._size
+        self._segment.write(payload)
+        self._size += len(payload)
+        locator = f"{self.names[-1]}:{offset}:{len(payload)}"
+        self._index.write(f"{user_id}\t{note_id}\t{locator}\n")
+        return locator
+
+    def sync(self) -> None:
+        """Flush the records appended so far to disk."""
+        for handle in (self._segment, self._index):
+            if handle is not None:
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        for handle in (self._segment, self._index):
+            if handle is not None:
+                handle.close()
+        self._segment = self._index = None
+
+    def __enter__(self) -> "SegmentWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class SegmentStore:
+    """The segments of a directory, read through mmap."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._maps: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def writer(self) -> SegmentWriter:
+        os.makedirs(self.directory, exist_ok=True)
+        return SegmentWriter(self.directory, settings.COLD_SEGMENT_MAX_BYTES)
+
+    def _mapped(self, name: str, end: int) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(name)
+            # A segment still being written may have grown since it was mapped
+            if mapped is None or len(mapped) < end:
+                with open(os.path.join(self.directory, name + SEGMENT_SUFFIX), "rb") as handle:
+                    mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[name] = mapped
+                while len(self._maps) > MAX_MAPPED_SEGMENTS:
+                    # Unmapped once no reader holds it any more
+                    self._maps.popitem(last=False)
+            self._maps.move_to_end(name)
+            return mapped
+
+    def read(self, locator: str) -> Dict[str, str]:
+        """The archived hash stored at a locator."""
+        name, offset, length = parse_locator(locator)
+        mapped = self._mapped(name, offset + length)
+        return msgpack.unpackb(zlib.decompress(mapped[offset:offset + length]))
+
+    def read_many(self, locators: List[str]) -> List[Dict[str, str]]:
+        return [self.read(locator) for locator in locators]
+
+    def segments(self, idle_for: float = 0.0) -> List[str]:
+        """Names of the segments, oldest first, leaving out those written in the last idle_for seconds."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = []
+        now = time.time()
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.endswith(INDEX_SUFFIX):
+                path = os.path.join(self.directory, file_name)
+                if now - os.path.getmtime(path) >= idle_for:
+                    names.append(file_name[:-len(INDEX_SUFFIX)])
+        return names
+
+    def entries(self, name: str) -> Iterator[Tuple[str, str, str]]:
+        """(user id, note id, locator) of each record of a segment."""
+        with open(os.path.join(self.directory, name + INDEX_SUFFIX)) as index:
+            for line in index:
+                user_id, note_id, locator = line.rstrip("\n").split("\t")
+                yield user_id, note_id, locator
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(os.path.join(self.directory, name + SEGMENT_SUFFIX))
+
+    def remove(self, name: str) -> None:
+        """Delete a segment with its index."""
+        with self._lock:
+            self._maps.pop(name, None)
+        for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+            try:
+                os.remove(os.path.join(self.directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+_store: Optional[SegmentStore] = None
+
+def get_segment_store() -> SegmentStore:
+    """The segment store in COLD_SEGMENT_DIR, opened on first use."""
+    global _store
+    if _store is None or _store.directory != settings.COLD_SEGMENT_DIR:
+        _store = SegmentStore(settings.COLD_SEGMENT_DIR)
+    return _store
@@ -0,0 +1,21 @@
+from typing import Any
+
+import orjson
+from starlette.responses import Response
+
+def dumps(content: Any) -> bytes:
+    """Encode JSON-ready content (dicts, lists, str, numbers, bools, None) as compact UTF-8 JSON."""
+    return orjson.dumps(content)
+
+class FastJSONResponse(Response):
+    """
+    JSON response for content that is already JSON-ready, encoded with orjson.
+    
+    Returning it from a route skips response_model validation and
+    serialization, while the route's OpenAPI schema still comes from its
+    response_model.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,126 @@
+"""
+Benchmark plaintext note compression: ratio and throughput per codec/level.
+
+    python -m benchmarks.bench_compression [--notes 500] [--threshold 1024]
+
+Four generated corpora stand in for typical notes: short notes, meeting
+notes (markdown lists, names, dates), logs and snippets (timestamps, hex ids,
+paths) and long documents. For each codec and level the report gives the
+share of notes at or above the threshold that got compressed, stored bytes
+over raw bytes for the whole corpus (notes below the threshold count
+uncompressed), and compression/decompression throughput in MB/s of raw text.
+zstd rows are skipped when the zstandard package is not installed.
+"""
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from app.core.config import settings
+from app.utils import compression
+from app.utils.compression import compress_text, decompress_text, ZLIB, ZSTD
+
+WORDS = (
+    "the of and to a in is that for it as with on be this by are from at or have an not "
+    "we will can our all new more team project meeting review plan budget release customer "
+    "feature issue update design data report week quarter goal status action owner deadline "
+    "follow-up draft api backend frontend deploy test fix bug priority risk cost hiring "
+    "roadmap launch metrics user feedback sprint demo notes agenda decision next steps café "
+    "résumé approval contract vendor migration security incident retro onboarding offsite"
+).split()
+NAMES = ["Alice", "Bob", "Chandra", "Dmitri", "Eun-ji", "Fatima", "Goran", "Hiro", "Inés", "Jamal"]
+
+def _zipf_words(rng: random.Random, count: int) -> List[str]:
+    return rng.choices(WORDS, weights=[1 / rank for rank in range(1, len(WORDS) + 1)], k=count)
+
+def _sentence(rng: random.Random) -> str:
+    words = _zipf_words(rng, rng.randint(6, 18))
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), str(rng.randint(2, 9999)))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+def short_note(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(1, 30)))
+
+def meeting_note(rng: random.Random) -> str:
+    lines = [f"# {_sentence(rng)[:-1]}", f"Date: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             "Attendees: " + ", ".join(rng.sample(NAMES, rng.randint(2, 6))), ""]
+    for _ in range(rng.randint(3, 8)):
+        lines.append(f"## {' '.join(_zipf_words(rng, 3)).title()}")
+        lines += [f"- {_sentence(rng)}" for _ in range(rng.randint(2, 8))]
+        lines.append(f"- [ ] {rng.choice(NAMES)}: {_sentence(rng)}")
+    return "\n".join(lines)
+
+def log_note(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(20, 200)):
+        lines.append(
+            f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z "
+            f"{rng.choice(['INFO', 'INFO', 'INFO', 'WARN', 'ERROR'])} "
+            f"[{rng.choice(['api', 'worker', 'scheduler'])}] req={rng.getrandbits(64):016x} "
+            f"/srv/app/{rng.choice(['notes', 'users', 'auth'])}/{rng.choice(['handler', 'service', 'store'])}.py:{rng.randint(1, 400)} "
+            f"{' '.join(_zipf_words(rng, rng.randint(3, 9)))}"
+        )
+    return "\n".join(lines)
+
+def long_document(rng: random.Random) -> str:
+    sections = []
+    for _ in range(rng.randint(10, 60)):
+        paragraphs = [" ".join(_sentence(rng) for _ in range(rng.randint(3, 9))) for _ in range(rng.randint(1, 5))]
+        sections.append(f"## {' '.join(_zipf_words(rng, 4)).title()}\n\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(sections)
+
+CORPORA: Dict[str, Callable[[random.Random], str]] = {
+    "short notes": short_note,
+    "meeting notes": meeting_note,
+    "logs/snippets": log_note,
+    "long documents": long_document,
+}
+
+CODECS = [(ZLIB, 1), (ZLIB, 6), (ZLIB, 9), (ZSTD, 1), (ZSTD, 3), (ZSTD, 9)]
+
+def run(texts: List[str], codec: str, level: int, threshold: int):
+    settings.CONTENT_COMPRESSION = codec
+    settings.CONTENT_COMPRESSION_LEVEL = level
+    settings.CONTENT_COMPRESSION_THRESHOLD = threshold
+
+    start = time.perf_counter()
+    results = [compress_text(text) for text in texts]
+    compress_time = time.perf_counter() - start
+
+    compressed = [(text, result) for text, result in zip(texts, results) if result]
+    start = time.perf_counter()
+    for _, (name, data) in compressed:
+        decompress_text(name, data)
+    decompress_time = time.perf_counter() - start
+
+    raw_sizes = [len(text.encode()) for text in texts]
+    stored = sum(len(result[1]) if result else size for result, size in zip(results, raw_sizes))
+    eligible = sum(size >= threshold for size in raw_sizes)
+    compressed_raw = sum(len(text.encode()) for text, _ in compressed)
+    return (
+        len(compressed) / eligible if eligible else 0.0,
+        stored / sum(raw_sizes),
+        sum(raw_sizes) / compress_time / 1e6,
+        compressed_raw / decompress_time / 1e6 if compressed else 0.0,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500, help="Notes per corpus")
+    parser.add_argument("--threshold", type=int, default=settings.CONTENT_COMPRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    print(f"{'corpus':>15} {'mean B':>8} {'codec':>8} {'compressed':>11} {'stored/raw':>11} {'comp MB/s':>10} {'decomp MB/s':>12}")
+    for name, generate in CORPORA.items():
+        texts = [generate(rng) for _ in range(args.notes)]
+        mean_size = sum(len(text.encode()) for text in texts) / len(texts)
+        for codec, level in CODECS:
+            if codec == ZSTD and compression.zstandard is None:
+                continue
+            share, ratio, compress_speed, decompress_speed = run(texts, codec, level, args.threshold)
+            print(f"{name:>15} {mean_size:>8.0f} {f'{codec}-{level}':>8} {share:>10.0%} {ratio:>11.3f} {compress_speed:>10.1f} {decompress_speed:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark note list page latency: one HGETALL per note vs. a pipelined page.
+
+    python -m benchmarks.bench_note_list [--rtts 0,0.0005,0.002] [--sizes 10,50,100]
+
+Redis is simulated in-process with a fixed round-trip time, so the numbers
+show how page latency scales with page size and network distance.
+"""
+import argparse
+import asyncio
+import time
+from unittest import mock
+
+from app.core.database import note_key, user_notes_key
+from app.repositories import redis_repository
+from app.repositories.redis_repository import RedisNoteRepository
+from benchmarks.simulated_redis import SimulatedRedis
+
+USER_ID = "bench-user"
+
+def seed(redis: SimulatedRedis, count: int) -> None:
+    for i in range(count):
+        note_id = f"note-{i}"
+        redis._hset(note_key(USER_ID, note_id), {
+            "id": note_id, "user_id": USER_ID, "title": f"Note {i}", "content": "x" * 500,
+            "is_encrypted": "False", "created_at": str(i), "updated_at": str(i),
+            "sensitivity_score": "10", "sensitivity_explanation": "benchmark",
+        })
+        redis._zadd(user_notes_key(USER_ID), {note_id: float(i)})
+
+async def list_sequential(redis: SimulatedRedis, limit: int):
+    """The previous implementation: one HGETALL round trip per note."""
+    note_ids = await redis.zrevrange(user_notes_key(USER_ID), 0, limit - 1)
+    notes = []
+    for note_id in note_ids:
+        note_data = await redis.hgetall(note_key(USER_ID, note_id))
+        if note_data:
+            notes.append(note_data)
+    return notes
+
+async def measure(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+async def run(rtts, sizes, repeat: int) -> None:
+    repository = RedisNoteRepository()
+    print(f"{'rtt ms':>7} {'page':>5} {'sequential ms':>14} {'pipelined ms':>13} {'round trips':>12} {'speedup':>8}")
+    for rtt in rtts:
+        redis = SimulatedRedis(rtt=rtt)
+        seed(redis, max(sizes))
+        with mock.patch.object(redis_repository, "get_redis_client", redis.client):
+            for size in sizes:
+                sequential = await measure(lambda: list_sequential(redis, size), repeat)
+                pipelined = await measure(lambda: repository.list_page(USER_ID, 0, size), repeat)
+
+                redis.round_trips = 0
+                await repository.list_page(USER_ID, 0, size)
+                trips = f"{size + 1} -> {redis.round_trips}"
+                print(f"{rtt * 1000:>7.2f} {size:>5} {sequential:>14.2f} {pipelined:>13.2f} {trips:>12} {sequential / pipelined:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtts", default="0,0.0005,0.002", help="Comma-separated simulated round-trip times in seconds")
+    parser.add_argument("--sizes", default="10,50,100", help="Comma-separated page sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(
+        [float(rtt) for rtt in args.rtts.split(",")],
+        [int(size) for size in args.sizes.split(",")],
+        args.repeat,
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark per-request note handling: string dicts + Pydantic round trips
+(the previous models/note.py) vs. the slotted NoteRecord.
+
+    python -m benchmarks.bench_note_record [--repeat 20000]
+
+Each case runs the CPU work one request does around storage, without
+encryption or sensitivity analysis: create (request model -> stored hash
+-> response model), read (stored hash -> response model) and update
+(stored hash + NoteUpdate -> stored hash -> response model). Time is the
+mean per operation; memory is the peak traced by tracemalloc while one
+operation runs, temporaries included.
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+from typing import Dict
+
+from app.models.note import NoteRecord
+from app.schemas.note import Note, NoteCreate, NoteSensitivity, NoteUpdate
+
+USER_ID = "bench-user"
+
+# The previous implementation, kept here for comparison
+
+def legacy_create_note_dict(note_create: NoteCreate, user_id: str) -> Dict:
+    now = time.time()
+    note_dict = {
+        "id": str(uuid.uuid4()),
+        "user_id": str(user_id),
+        "title": note_create.title or "",
+        "content": note_create.content or "",
+        "is_encrypted": str(bool(note_create.is_encrypted)),
+        "created_at": str(now),
+        "updated_at": str(now),
+        "sensitivity_score": "0",
+        "sensitivity_explanation": "",
+        "version": "1",
+    }
+    if hasattr(note_create, "salt") and note_create.salt is not None:
+        note_dict["salt"] = str(note_create.salt)
+    elif isinstance(note_create.model_dump(), dict) and "salt" in note_create.model_dump() and note_create.model_dump().get("salt") is not None:
+        note_dict["salt"] = str(note_create.model_dump().get("salt"))
+    for key, value in list(note_dict.items()):
+        if value is None:
+            note_dict[key] = ""
+        elif not isinstance(value, str):
+            note_dict[key] = str(value)
+    return note_dict
+
+def legacy_update_note_dict(note_dict: Dict, note_update: NoteUpdate) -> Dict:
+    updated_dict = note_dict.copy()
+    updated_dict["updated_at"] = str(time.time())
+    updated_dict["version"] = str(int(note_dict.get("version") or 0) + 1)
+    if note_update.title is not None:
+        updated_dict["title"] = note_update.title or ""
+    if note_update.content is not None:
+        updated_dict["content"] = note_update.content or ""
+    if note_update.is_encrypted is not None:
+        updated_dict["is_encrypted"] = str(bool(note_update.is_encrypted))
+    if hasattr(note_update, "salt") and note_update.salt is not None:
+        updated_dict["salt"] = str(note_update.salt)
+    elif isinstance(note_update.model_dump(exclude_unset=True), dict) and "salt" in note_update.model_dump(exclude_unset=True):
+        updated_dict["salt"] = str(note_update.model_dump(exclude_unset=True).get("salt") or "")
+    for key, value in list(updated_dict.items()):
+        if value is None:
+            updated_dict[key] = ""
+        elif not isinstance(value, str):
+            updated_dict[key] = str(value)
+    return updated_dict
+
+def legacy_note_dict_to_schema(note_dict: Dict) -> Note:
+    is_encrypted = note_dict.get("is_encrypted", "False").lower() == "true"
+    note_data = {
+        "id": note_dict.get("id", str(uuid.uuid4())),
+        "user_id": note_dict.get("user_id", ""),
+        "title": note_dict.get("title", ""),
+        "content": note_dict.get("content", ""),
+        "is_encrypted": is_encrypted,
+        "created_at": float(note_dict.get("created_at", time.time())),
+        "updated_at": float(note_dict.get("updated_at", time.time())),
+        "sensitivity": NoteSensitivity(
+            sensitivity_score=int(note_dict.get("sensitivity_score", 0)),
+            explanation=note_dict.get("sensitivity_explanation", ""),
+        ),
+        "version": int(note_dict.get("version") or 0),
+    }
+    if is_encrypted and note_dict.get("salt") is not None:
+        note_data["salt"] = note_dict["salt"]
+    return Note(**note_data)
+
+def legacy_create(note_create: NoteCreate):
+    # create_note rebuilt the request model before building the dict
+    note_create = NoteCreate(**note_create.model_dump())
+    note_dict = legacy_create_note_dict(note_create, USER_ID)
+    note_dict["sensitivity_score"] = "12"
+    note_dict["sensitivity_explanation"] = "benchmark"
+    return note_dict, legacy_note_dict_to_schema(note_dict)
+
+def record_create(note_create: NoteCreate):
+    record = NoteRecord.new(USER_ID, note_create.title, note_create.content, note_create.is_encrypted, note_create.salt)
+    record.sensitivity_score = 12
+    record.sensitivity_explanation = "benchmark"
+    return record.to_hash(), record.to_schema()
+
+def legacy_update(stored: Dict, note_update: NoteUpdate):
+    updated = legacy_update_note_dict(stored, note_update)
+    return updated, legacy_note_dict_to_schema(updated)
+
+def record_update(stored: Dict, note_update: NoteUpdate):
+    record = NoteRecord.from_hash(stored)
+    if note_update.title is not None:
+        record.title = note_update.title
+    if note_update.content is not None:
+        record.content = note_update.content
+    record.touch()
+    return record.to_hash(), record.to_schema()
+
+def measure(func, repeat: int):
+    """Mean microseconds per call and peak bytes allocated during one call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat * 1e6
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(100):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        del result
+    tracemalloc.stop()
+    return elapsed, sorted(peaks)[len(peaks) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    note_create = NoteCreate(title="Quarterly planning", content="Budget review and hiring plan. " * 10)
+    stored = record_create(note_create)[0]
+    note_update = NoteUpdate(title="Quarterly planning (v2)")
+
+    cases = [
+        ("create", lambda: legacy_create(note_create), lambda: record_create(note_create)),
+        ("read", lambda: legacy_note_dict_to_schema(stored), lambda: NoteRecord.from_hash(stored).to_schema()),
+        ("update", lambda: legacy_update(stored, note_update), lambda: record_update(stored, note_update)),
+    ]
+    print(f"{'case':>7} {'dict us':>8} {'record us':>10} {'speedup':>8} {'dict peak B':>12} {'record peak B':>14}")
+    for name, legacy, record in cases:
+        legacy_time, legacy_peak = measure(legacy, args.repeat)
+        record_time, record_peak = measure(record, args.repeat)
+        print(f"{name:>7} {legacy_time:>8.2f} {record_time:>10.2f} {legacy_time / record_time:>7.2f}x {legacy_peak:>12} {record_peak:>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Report the stored size of notes per record codec ("hash" vs "packed").
+
+    python -m benchmarks.bench_record_memory [--notes 2000] [--redis]
+
+The corpus mixes short, medium and long plaintext notes with encrypted
+notes (a third), non-ASCII text and realistic timestamps/scores. For each
+codec the report gives the hash fields per note, the encoded payload (field
+names + values) per note, and the decode time of a full record and of the
+lazily decoded id/user_id/version.
+
+With --redis the corpus is also written to the configured Redis under a
+throwaway user and MEMORY USAGE is averaged per note, which includes Redis'
+per-field overhead and depends on hash-max-listpack-value; the keys are
+deleted afterwards.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import time
+import uuid
+from typing import Dict, List
+
+from app.models.note import NoteRecord, HASH_CODEC, PACKED_CODEC
+
+CODECS = [HASH_CODEC, PACKED_CODEC]
+WORDS = "budget review meeting agenda café résumé hiring plan roadmap ✓ follow-up quarterly notes draft".split()
+
+def build_corpus(count: int, seed: int = 7) -> List[NoteRecord]:
+    """Notes sized like real ones: mostly short, some long, a third encrypted."""
+    rng = random.Random(seed)
+    now = time.time()
+    records = []
+    for i in range(count):
+        length = int(min(rng.lognormvariate(5.5, 1.2), 20000))
+        text = " ".join(rng.choice(WORDS) for _ in range(max(1, length // 7)))[:length]
+        created_at = now - rng.uniform(0, 365 * 86400)
+        record = NoteRecord(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            user_id="bench-memory-user",
+            title=" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6))).capitalize(),
+            content=text,
+            created_at=created_at,
+            updated_at=created_at + rng.uniform(0, 86400),
+            sensitivity_score=rng.randint(0, 100),
+            sensitivity_explanation=rng.choice(["", "Mentions budget figures", "Contains personal contact details"]),
+            version=rng.randint(1, 12),
+        )
+        if i % 3 == 0:
+            # Fernet tokens are url-safe base64, about 4/3 of the plaintext plus ~60 bytes
+            record.is_encrypted = True
+            record.content = base64.urlsafe_b64encode(os.urandom(len(text.encode()) + 57)).decode()
+            record.salt = base64.b64encode(os.urandom(16)).decode()
+        records.append(record)
+    return records
+
+def payload_size(note_hash: Dict) -> int:
+    """Bytes of field names and values as sent to Redis."""
+    return sum(
+        len(field.encode()) + len(value if isinstance(value, bytes) else str(value).encode())
+        for field, value in note_hash.items()
+    )
+
+def stored_form(note_hash: Dict) -> Dict[str, str]:
+    """The hash as a decode_responses Redis client returns it."""
+    return {
+        field: value.decode("utf-8", "surrogateescape") if isinstance(value, bytes) else str(value)
+        for field, value in note_hash.items()
+    }
+
+def mean_us(func, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+async def redis_usage(hashes: List[Dict]) -> float:
+    """Mean MEMORY USAGE per note of the hashes written to Redis."""
+    from app.core.database import get_redis_client, close_redis, note_key
+
+    user_id = f"bench-memory-{uuid.uuid4()}"
+    keys = [note_key(user_id, note_hash["id"]) for note_hash in hashes]
+    try:
+        async with get_redis_client() as redis:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, note_hash in zip(keys, hashes):
+                    await pipe.hset(key, mapping=note_hash)
+                await pipe.execute()
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        await pipe.memory_usage(key, samples=0)
+                    usages = await pipe.execute()
+            finally:
+                await redis.delete(*keys)
+    finally:
+        await close_redis()
+    return sum(usages) / len(usages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--redis", action="store_true", help="Also measure MEMORY USAGE on the configured Redis")
+    args = parser.parse_args()
+
+    records = build_corpus(args.notes)
+    content_bytes = sum(len(record.content.encode()) for record in records) / len(records)
+    print(f"{args.notes} notes, mean content {content_bytes:.0f} B, {sum(r.is_encrypted for r in records)} encrypted")
+    header = f"{'codec':>7} {'fields':>7} {'payload B/note':>15} {'full decode us':>15} {'lazy decode us':>15}"
+    if args.redis:
+        header += f" {'redis B/note':>13}"
+    print(header)
+
+    baseline = None
+    for codec in CODECS:
+        hashes = [record.to_hash(codec) for record in records]
+        stored = [stored_form(note_hash) for note_hash in hashes]
+        fields = sum(len(note_hash) for note_hash in hashes) / len(hashes)
+        payload = sum(payload_size(note_hash) for note_hash in hashes) / len(hashes)
+        full = mean_us(lambda data: NoteRecord.from_hash(data).to_json(), stored)
+        lazy = mean_us(lambda data: NoteRecord.from_hash(data).version, stored)
+        line = f"{codec:>7} {fields:>7.1f} {payload:>15.1f} {full:>15.2f} {lazy:>15.2f}"
+        if args.redis:
+            usage = asyncio.run(redis_usage(hashes))
+            baseline = baseline or usage
+            line += f" {usage:>13.1f} ({usage / baseline:.0%})"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark note revision history: storage per edit and rebuild latency.
+
+    python -m benchmarks.bench_revisions [--notes 50] [--edits 40] [--interval 10]
+
+Notes come from the bench_compression corpora and are edited repeatedly:
+each edit rewrites, inserts or deletes one line, or appends a sentence. Every
+edit records the previous state as a revision, as an update does with
+NOTE_REVISIONS (the revision hash is kept in a dict, so only the stored
+format and its CPU cost are measured). Revisions are capped by count and
+bytes as configured, and the snapshot interval can be overridden.
+
+Per corpus the report gives the mean note size, bytes stored per edit
+(revisions plus index) next to what a full copy per edit would cost, the
+time to record a revision, and the mean and p95 time to rebuild a revision
+picked at random among those kept.
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from app.core.config import settings
+from app.utils.revisions import INDEX_FIELD, parse_index, record_revision, revision_chain, rebuild_content
+from benchmarks.bench_compression import CORPORA, _sentence
+
+def edit(rng: random.Random, content: str) -> str:
+    """One typical edit: rewrite, insert or delete a line, or append a sentence."""
+    lines = content.split("\n")
+    kind = rng.random()
+    position = rng.randrange(len(lines))
+    if kind < 0.4:
+        lines[position] = _sentence(rng)
+    elif kind < 0.6:
+        lines.insert(position, _sentence(rng))
+    elif kind < 0.7 and len(lines) > 1:
+        del lines[position]
+    else:
+        lines[-1] += " " + _sentence(rng)
+    return "\n".join(lines)
+
+def stored_size(revisions: Dict[str, object]) -> int:
+    return sum(len(value) if isinstance(value, bytes) else len(value.encode()) for value in revisions.values())
+
+def run(generator, notes: int, edits: int, rebuilds: int, seed: int = 11):
+    rng = random.Random(seed)
+    content_bytes = 0
+    stored_bytes = 0
+    record_times: List[float] = []
+    rebuild_times: List[float] = []
+    for _ in range(notes):
+        content = generator(rng)
+        revisions: Dict[str, object] = {}
+        for version in range(1, edits + 1):
+            next_content = edit(rng, content)
+            start = time.perf_counter()
+            items, dropped = record_revision(revisions.get(INDEX_FIELD), version, float(version), "title", content, next_content)
+            record_times.append((time.perf_counter() - start) * 1000)
+            revisions.update(items)
+            for field in dropped:
+                del revisions[field]
+            content_bytes += len(content.encode())
+            content = next_content
+        stored_bytes += stored_size(revisions)
+
+        index = parse_index(revisions[INDEX_FIELD])
+        for _ in range(rebuilds):
+            entry = rng.choice(index.entries)
+            start = time.perf_counter()
+            chain = revision_chain(index.entries, entry.version)
+            rebuild_content([revisions[str(version)] for version in chain], index.head, content)
+            rebuild_times.append((time.perf_counter() - start) * 1000)
+
+    rebuild_times.sort()
+    return {
+        "note": content_bytes / (notes * edits),
+        "per_edit": stored_bytes / (notes * edits),
+        "record_ms": sum(record_times) / len(record_times),
+        "rebuild_ms": sum(rebuild_times) / len(rebuild_times),
+        "rebuild_p95_ms": rebuild_times[int(len(rebuild_times) * 0.95) - 1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=50, help="Notes edited per corpus")
+    parser.add_argument("--edits", type=int, default=40, help="Edits per note")
+    parser.add_argument("--rebuilds", type=int, default=20, help="Revisions rebuilt per note")
+    parser.add_argument("--interval", type=int, default=settings.NOTE_REVISIONS_SNAPSHOT_INTERVAL, help="Full snapshot every N revisions")
+    args = parser.parse_args()
+    settings.NOTE_REVISIONS_SNAPSHOT_INTERVAL = args.interval
+
+    print(f"snapshot interval {args.interval}, at most {settings.NOTE_REVISIONS_MAX} revisions / {settings.NOTE_REVISIONS_MAX_BYTES} bytes per note")
+    print(f"{'corpus':>14} {'note B':>8} {'B/edit':>8} {'full B/edit':>11} {'ratio':>6} {'record ms':>9} {'rebuild ms':>10} {'p95 ms':>7}")
+    for name, generator in CORPORA.items():
+        result = run(generator, args.notes, args.edits, args.rebuilds)
+        print(f"{name:>14} {result['note']:>8.0f} {result['per_edit']:>8.0f} {result['note']:>11.0f} "
+              f"{result['per_edit'] / result['note']:>6.2f} {result['record_ms']:>9.3f} "
+              f"{result['rebuild_ms']:>10.3f} {result['rebuild_p95_ms']:>7.3f}")
+
+if __name__ == "__main__":
+    main()
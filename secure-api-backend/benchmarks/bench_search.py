@@ -0,0 +1,113 @@
+"""
+Benchmark note search latency against the number of notes of a user.
+
+    python -m benchmarks.bench_search [--sizes 100,1000,10000] [--redis]
+
+Notes come from the bench_compression corpora (short notes, meeting notes,
+logs and long documents, mixed). For each corpus size the report gives the
+mean and p95 latency of four query shapes: one common word, one rare word,
+two words, and a title prefix being typed.
+
+By default the in-process memory repository is measured, which shows the
+ranking cost alone. With --redis the notes are written to the configured
+Redis under a throwaway user (SEARCH_INDEX is turned on for the run) and
+its keys are deleted afterwards.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, List
+
+from app.core.config import settings
+from app.models.note import NoteRecord
+from app.repositories.memory_repository import MemoryNoteRepository
+from app.utils.search import parse_query
+from benchmarks.bench_compression import CORPORA, NAMES, _zipf_words
+
+QUERIES: Dict[str, str] = {
+    "common word": "the",
+    "rare word": "4242",
+    "two words": "budget review",
+    "title prefix": "roadm",
+}
+
+def build_notes(user_id: str, count: int, seed: int = 5) -> List[NoteRecord]:
+    rng = random.Random(seed)
+    generators = list(CORPORA.values())
+    now = time.time()
+    records = []
+    for i in range(count):
+        words = _zipf_words(rng, rng.randint(2, 6)) + [rng.choice(NAMES)]
+        records.append(NoteRecord(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            user_id=user_id,
+            title=" ".join(words).capitalize(),
+            content=generators[i % len(generators)](rng),
+            created_at=now - i,
+            updated_at=now - i,
+            sensitivity_score=rng.randint(0, 100),
+            sensitivity_explanation="",
+            version=1,
+        ))
+    return records
+
+async def seed(repository, records: List[NoteRecord]) -> None:
+    for start in range(0, len(records), 200):
+        await repository.create_many([(record.to_hash(), record.created_at) for record in records[start:start + 200]])
+
+async def measure(repository, user_id: str, query: str, repeat: int):
+    terms, last_word = parse_query(query)
+    timings = []
+    total = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        page = await repository.search(user_id, terms, last_word)
+        timings.append((time.perf_counter() - start) * 1000)
+        total = page.total
+    timings.sort()
+    return sum(timings) / len(timings), timings[int(len(timings) * 0.95) - 1], total
+
+async def delete_user_keys(user_id: str) -> None:
+    from app.core.database import get_redis_client
+
+    async with get_redis_client() as redis:
+        keys = [key async for key in redis.scan_iter(match=f"*{{{user_id}}}*", count=1000)]
+        for start in range(0, len(keys), 500):
+            await redis.delete(*keys[start:start + 500])
+
+async def run(sizes: List[int], repeat: int, use_redis: bool) -> None:
+    settings.SEARCH_INDEX = True
+    if use_redis:
+        from app.core.database import close_redis
+        from app.repositories.redis_repository import RedisNoteRepository
+
+    print(f"{'notes':>7} {'query':>13} {'matches':>8} {'mean ms':>8} {'p95 ms':>8}")
+    for size in sizes:
+        user_id = f"bench-search-{uuid.uuid4()}"
+        if use_redis:
+            repository = RedisNoteRepository()
+        else:
+            repository = MemoryNoteRepository()
+        try:
+            await seed(repository, build_notes(user_id, size))
+            for name, query in QUERIES.items():
+                mean, p95, total = await measure(repository, user_id, query, repeat)
+                print(f"{size:>7} {name:>13} {total:>8} {mean:>8.2f} {p95:>8.2f}")
+        finally:
+            if use_redis:
+                await delete_user_keys(user_id)
+    if use_redis:
+        await close_redis()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated notes per user")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--redis", action="store_true", help="Measure the configured Redis instead of the memory repository")
+    args = parser.parse_args()
+    asyncio.run(run([int(size) for size in args.sizes.split(",")], args.repeat, args.redis))
+
+if __name__ == "__main__":
+    main()
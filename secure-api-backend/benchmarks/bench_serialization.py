@@ -0,0 +1,95 @@
+"""
+Benchmark note list serialization: Note models + response_model vs. the
+FAST_JSON_RESPONSES path (stored record -> JSON-ready dict -> orjson).
+
+    python -m benchmarks.bench_serialization [--notes 100] [--repeat 200]
+
+Requests go through the full app (auth included) on the in-memory storage
+backend, once per mode. The bodies of both modes are compared byte for byte
+and the per-page time difference is the serialization saving.
+"""
+import os
+
+# The benchmark runs without Redis, reCAPTCHA or an OpenAI key
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("RECAPTCHA_ENABLED", "False")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import argparse
+import asyncio
+import base64
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.main import app
+from app.repositories import get_note_repository
+from app.schemas.user import UserCreate
+from app.services.user_service import create_user
+
+USERNAME = "benchuser"
+
+async def seed(count: int) -> str:
+    """Create a user with count notes (a third of them encrypted) and return their token."""
+    user = await create_user(UserCreate(username=USERNAME, email="bench@example.com", password="benchpassword"))
+    repository = get_note_repository()
+    now = time.time()
+    for i in range(count):
+        encrypted = i % 3 == 0
+        note = {
+            "id": f"note-{i:05d}",
+            "user_id": user.id,
+            "title": f"Meeting notes {i} – café",
+            "content": ("gAAAAABl" + "x" * 400) if encrypted else f"Agenda item {i}: résumé review, budget ✓ " * 8,
+            "is_encrypted": str(encrypted),
+            "created_at": str(now - 1000 + i * 0.731),
+            "updated_at": str(now - 500 + i * 1.137),
+            "sensitivity_score": str(i % 101),
+            "sensitivity_explanation": "Mentions budget figures" if i % 2 else "",
+            "version": str(1 + i % 4),
+        }
+        if encrypted:
+            note["salt"] = base64.b64encode(os.urandom(16)).decode()
+        await repository.create(note, float(note["updated_at"]))
+    return create_access_token({"sub": USERNAME})
+
+async def fetch(client: httpx.AsyncClient, url: str, fast: bool, repeat: int):
+    """Return the body and the mean wall/CPU milliseconds of GET url in one mode."""
+    settings.FAST_JSON_RESPONSES = fast
+    response = await client.get(url)
+    response.raise_for_status()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        await client.get(url)
+    wall = (time.perf_counter() - wall_start) / repeat * 1000
+    cpu = (time.process_time() - cpu_start) / repeat * 1000
+    return response.content, wall, cpu
+
+async def run(count: int, repeat: int) -> None:
+    token = await seed(count)
+    transport = httpx.ASGITransport(app=app)
+    prefix = settings.API_V1_PREFIX
+    cases = [
+        ("full page", f"{prefix}/notes/?limit={min(count, 100)}"),
+        ("summary view", f"{prefix}/notes/?limit={min(count, 100)}&view=summary"),
+        ("export", f"{prefix}/notes/export"),
+    ]
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}) as client:
+        print(f"{'case':>13} {'bytes':>8} {'identical':>10} {'model ms':>9} {'fast ms':>8} {'model cpu':>10} {'fast cpu':>9} {'speedup':>8}")
+        for name, url in cases:
+            model_body, model_wall, model_cpu = await fetch(client, url, False, repeat)
+            fast_body, fast_wall, fast_cpu = await fetch(client, url, True, repeat)
+            identical = "yes" if model_body == fast_body else "NO"
+            print(f"{name:>13} {len(model_body):>8} {identical:>10} {model_wall:>9.3f} {fast_wall:>8.3f} {model_cpu:>10.3f} {fast_cpu:>9.3f} {model_wall / fast_wall:>7.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100, help="Notes seeded for the user (list pages hold up to 100)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.notes, args.repeat))
+
+if __name__ == "__main__":
+    main()
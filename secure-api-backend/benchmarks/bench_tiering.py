@@ -0,0 +1,74 @@
+"""
+Report the Redis memory saved by cold tiering against the cost of a cold read.
+
+    python -m benchmarks.bench_tiering [--notes 2000] [--codec hash] [--redis]
+
+The corpus is the one of bench_record_memory. Every note is archived to
+segments in a temporary directory, as the tiering job does, and the report
+gives per note: the payload (field names + values) of the full record and
+of its cold stub, the segment bytes on disk, and the time to get a full
+record (NoteRecord.from_hash plus to_json) from the Redis hash and from its
+segment through the mmap reader, mean and 95th percentile. Segments are
+read from the page cache, as a recently written or busy segment would be;
+a read that has to go to the disk adds its latency on top.
+
+With --redis the full records and the stubs are also written to the
+configured Redis under a throwaway user and MEMORY USAGE is averaged per
+note; the keys are deleted afterwards.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from app.models.note import NoteRecord, HASH_CODEC, PACKED_CODEC
+from app.utils.segments import SegmentStore
+from benchmarks.bench_record_memory import build_corpus, payload_size, stored_form, redis_usage
+
+def timings_us(func: Callable, items) -> Tuple[float, float]:
+    """Mean and 95th percentile of func over items, in microseconds."""
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--codec", choices=[HASH_CODEC, PACKED_CODEC], default=HASH_CODEC, help="Codec of the records kept in Redis")
+    parser.add_argument("--redis", action="store_true", help="Also measure MEMORY USAGE on the configured Redis")
+    args = parser.parse_args()
+
+    records = build_corpus(args.notes)
+    hashes = [record.to_hash(args.codec) for record in records]
+    stored = [stored_form(note_hash) for note_hash in hashes]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SegmentStore(directory)
+        with store.writer() as writer:
+            locators = [writer.append(record.user_id, record.id, record.to_archive()) for record in records]
+        stubs: List[dict] = [record.to_cold_stub(locator) for record, locator in zip(records, locators)]
+        segment_bytes = sum(store.size(name) for name in writer.names) / len(records)
+
+        hot = timings_us(lambda data: NoteRecord.from_hash(data).to_json(), stored)
+        cold = timings_us(lambda locator: NoteRecord.from_hash(store.read(locator)).to_json(), locators)
+
+    full_payload = sum(payload_size(note_hash) for note_hash in hashes) / len(hashes)
+    stub_payload = sum(payload_size(stub) for stub in stubs) / len(stubs)
+    print(f"{args.notes} notes ({args.codec} codec), {segment_bytes:.1f} segment B/note on disk")
+    print(f"{'record':>7} {'payload B/note':>15} {'read mean us':>13} {'read p95 us':>12}")
+    print(f"{'full':>7} {full_payload:>15.1f} {hot[0]:>13.2f} {hot[1]:>12.2f}")
+    print(f"{'stub':>7} {stub_payload:>15.1f} {cold[0]:>13.2f} {cold[1]:>12.2f}")
+
+    if args.redis:
+        full_usage = asyncio.run(redis_usage(hashes))
+        stub_usage = asyncio.run(redis_usage(stubs))
+        print(f"Redis B/note: full {full_usage:.1f}, stub {stub_usage:.1f} ({1 - stub_usage / full_usage:.0%} saved)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+A tiny in-process stand-in for redis.asyncio used by the benchmarks.
+
+Every awaited command, and every pipeline execute(), costs one simulated
+network round trip, so benchmarks can compare access patterns by round-trip
+count without a Redis server.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+class SimulatedRedis:
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.zsets: Dict[str, Dict[str, float]] = {}
+        self.strings: Dict[str, str] = {}
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+    # Commands, applied immediately (used directly and by pipelines)
+
+    def _hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self.hashes.get(key, {}))
+
+    def _hset(self, key: str, mapping: Dict) -> int:
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+        return len(mapping)
+
+    def _zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        self.zsets.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    def _zrevrange(self, key: str, start: int, stop: int) -> List[str]:
+        ordered = sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return [member for member, _ in ordered[start:stop + 1]]
+
+    def _zrem(self, key: str, *members: str) -> int:
+        zset = self.zsets.get(key, {})
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def _zcard(self, key: str) -> int:
+        return len(self.zsets.get(key, {}))
+
+    def _get(self, key: str):
+        return self.strings.get(key)
+
+    async def hgetall(self, key):
+        await self._round_trip()
+        return self._hgetall(key)
+
+    async def hset(self, key, mapping):
+        await self._round_trip()
+        return self._hset(key, mapping)
+
+    async def zadd(self, key, mapping):
+        await self._round_trip()
+        return self._zadd(key, mapping)
+
+    async def zrevrange(self, key, start, stop):
+        await self._round_trip()
+        return self._zrevrange(key, start, stop)
+
+    async def zrem(self, key, *members):
+        await self._round_trip()
+        return self._zrem(key, *members)
+
+    def pipeline(self, transaction: bool = True):
+        return SimulatedPipeline(self)
+
+    @asynccontextmanager
+    async def client(self, *args, **kwargs):
+        """Drop-in replacement for app.core.database.get_redis_client."""
+        yield self
+
+class SimulatedPipeline:
+    def __init__(self, redis: SimulatedRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, f"_{name}")
+
+        async def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        await self.redis._round_trip()
+        results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
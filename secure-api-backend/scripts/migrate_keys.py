@@ -0,0 +1,105 @@
+"""
+Migrate Redis keys from the flat layout to the hash-tagged layout.
+
+    user:<id>        -> user:{<id>}
+    note:<id>        -> note:{<user_id>}:<id>
+    user_notes:<id>  -> user_notes:{<id>}
+
+Run from the backend directory, against the same Redis the API uses:
+
+    python -m scripts.migrate_keys [--dry-run]
+
+Values are copied (not RENAMEd) so the tool also works when the old and new
+keys live on different cluster nodes. Keys already in the new layout are left
+alone, so an interrupted run can simply be started again.
+"""
+import argparse
+import asyncio
+
+from app.core.database import (
+    get_redis_client,
+    close_redis,
+    cross_slot_pipeline,
+    user_key,
+    note_key,
+    user_notes_key,
+    USER_PREFIX,
+    NOTE_PREFIX,
+    USER_NOTES_PREFIX,
+)
+
+LOOKUP_PREFIXES = (f"{USER_PREFIX}username:", f"{USER_PREFIX}email:")
+
+def is_legacy_key(key: str) -> bool:
+    """Keys written before the hash-tagged layout carry no braces."""
+    return "{" not in key and not key.startswith(LOOKUP_PREFIXES)
+
+async def migrate_hash(redis, old_key: str, new_key: str, dry_run: bool) -> bool:
+    """Copy a hash to its new key and drop the old one."""
+    data = await redis.hgetall(old_key)
+    if not data:
+        return False
+    if dry_run:
+        return True
+    async with cross_slot_pipeline(redis) as pipe:
+        if not await redis.exists(new_key):
+            await pipe.hset(new_key, mapping=data)
+        await pipe.delete(old_key)
+        await pipe.execute()
+    return True
+
+async def migrate_zset(redis, old_key: str, new_key: str, dry_run: bool) -> bool:
+    """Merge a sorted set into its new key and drop the old one."""
+    members = await redis.zrange(old_key, 0, -1, withscores=True)
+    if not members:
+        return False
+    if dry_run:
+        return True
+    async with cross_slot_pipeline(redis) as pipe:
+        # NX keeps scores already written by the new code
+        await pipe.zadd(new_key, dict(members), nx=True)
+        await pipe.delete(old_key)
+        await pipe.execute()
+    return True
+
+async def migrate(dry_run: bool = False) -> dict:
+    """Migrate every legacy key and return per-kind counts."""
+    counts = {"users": 0, "notes": 0, "note_indexes": 0}
+
+    async with get_redis_client() as redis:
+        async for key in redis.scan_iter(match=f"{USER_PREFIX}*", count=500):
+            if is_legacy_key(key):
+                user_id = key[len(USER_PREFIX):]
+                if await migrate_hash(redis, key, user_key(user_id), dry_run):
+                    counts["users"] += 1
+
+        async for key in redis.scan_iter(match=f"{NOTE_PREFIX}*", count=500):
+            if is_legacy_key(key):
+                note_id = key[len(NOTE_PREFIX):]
+                user_id = await redis.hget(key, "user_id")
+                if user_id and await migrate_hash(redis, key, note_key(user_id, note_id), dry_run):
+                    counts["notes"] += 1
+
+        async for key in redis.scan_iter(match=f"{USER_NOTES_PREFIX}*", count=500):
+            if is_legacy_key(key):
+                user_id = key[len(USER_NOTES_PREFIX):]
+                if await migrate_zset(redis, key, user_notes_key(user_id), dry_run):
+                    counts["note_indexes"] += 1
+
+    return counts
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the keys that would be migrated")
+    args = parser.parse_args()
+
+    try:
+        counts = await migrate(dry_run=args.dry_run)
+    finally:
+        await close_redis()
+
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {counts['users']} users, {counts['notes']} notes, {counts['note_indexes']} note indexes")
+
+if __name__ == "__main__":
+    asyncio.run(main())
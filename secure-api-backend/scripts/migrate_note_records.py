@@ -0,0 +1,79 @@
+"""
+Re-encode stored notes in another record codec ("hash" or "packed").
+
+Notes in either encoding are always readable, and every write re-encodes a
+note in NOTE_RECORD_CODEC, so this is only needed to convert notes that are
+not written again (or to roll back). Run from the backend directory:
+
+    python -m scripts.migrate_note_records [--to packed] [--dry-run]
+
+Each note is rewritten with a compare-and-set on its version, so a note
+edited while the tool runs is left to the API (which writes it in the
+configured codec). Notes already in the target codec are skipped, so an
+interrupted run can simply be started again; so are notes in cold storage
+(COLD_TIERING), which get the configured codec when they are moved back.
+"""
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.core.database import get_redis_client, close_redis, user_notes_key, NOTE_PREFIX
+from app.models.note import NoteRecord, stale_fields, HASH_CODEC, PACKED_CODEC, PACKED_FIELD, COLD_FIELD
+from app.repositories import VersionConflict
+from app.repositories.redis_repository import RedisNoteRepository
+
+def is_encoded_as(note_data: dict, codec: str) -> bool:
+    return (PACKED_FIELD in note_data) == (codec == PACKED_CODEC)
+
+async def migrate(codec: str, dry_run: bool = False) -> dict:
+    """Re-encode every note not in the target codec and return counts."""
+    counts = {"migrated": 0, "skipped": 0, "conflicts": 0}
+    repository = RedisNoteRepository()
+
+    async with get_redis_client() as redis:
+        async for key in redis.scan_iter(match=f"{NOTE_PREFIX}{{*", count=500):
+            note_data = await redis.hgetall(key)
+            if not note_data or is_encoded_as(note_data, codec) or COLD_FIELD in note_data:
+                counts["skipped"] += 1
+                continue
+            # Read it again with its content, which may be stored by reference or in chunks
+            note_data = await repository.get(note_data.get("user_id", ""), note_data.get("id", ""), consistent=True)
+            if not note_data:
+                counts["skipped"] += 1
+                continue
+            record = NoteRecord.from_hash(note_data)
+            # Keep the note's place in its owner's index; dangling notes are left alone
+            score = await redis.zscore(user_notes_key(record.user_id), record.id)
+            if score is None:
+                counts["skipped"] += 1
+                continue
+            if dry_run:
+                counts["migrated"] += 1
+                continue
+
+            # Same version: the note's content (and ETag) do not change
+            note_hash = record.to_hash(codec)
+            try:
+                if await repository.update(note_hash, score, stale_fields(note_data, note_hash), record.version):
+                    counts["migrated"] += 1
+            except VersionConflict:
+                counts["conflicts"] += 1
+
+    return counts
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", choices=[HASH_CODEC, PACKED_CODEC], default=settings.NOTE_RECORD_CODEC, help="Target codec (default: NOTE_RECORD_CODEC)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the notes that would be re-encoded")
+    args = parser.parse_args()
+
+    try:
+        counts = await migrate(args.to, dry_run=args.dry_run)
+    finally:
+        await close_redis()
+
+    action = "Would re-encode" if args.dry_run else "Re-encoded"
+    print(f"{action} {counts['migrated']} notes as {args.to!r} ({counts['skipped']} skipped, {counts['conflicts']} changed while migrating)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
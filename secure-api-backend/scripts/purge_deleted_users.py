@@ -0,0 +1,45 @@
+"""
+Purge the notes of deleted users.
+
+DELETE /users/me removes the account at once and purges its notes in the
+background. A purge that did not finish (the API stopped or crashed) stays
+queued; run this from the backend directory, with the API's settings, to
+finish every queued purge:
+
+    python -m scripts.purge_deleted_users [--status]
+
+Purges proceed in atomic batches and resume where they stopped, so the
+script can run at any time, even while the API is purging the same users.
+"""
+import argparse
+import asyncio
+
+from app.core.database import close_redis
+from app.repositories import get_user_repository, get_note_repository
+from app.services.user_service import purge_deleted_users
+
+async def status() -> None:
+    """Print the queued purges and how far each has gone."""
+    user_ids = await get_user_repository().list_deleted(limit=1000)
+    for user_id in user_ids:
+        progress = await get_note_repository().get_purge_progress(user_id)
+        print(f"{user_id}: {progress.deleted} notes deleted, {progress.remaining} left")
+    print(f"{len(user_ids)} deleted users queued for purge")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Only report the queued purges")
+    args = parser.parse_args()
+
+    try:
+        if args.status:
+            await status()
+            return
+        purged = await purge_deleted_users()
+    finally:
+        await close_redis()
+
+    print(f"Purged {sum(purged.values())} notes of {len(purged)} deleted users")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Rebuild the search (SEARCH_INDEX) and secondary (SORT_INDEXES) indexes of
+users' notes.
+
+Run it after turning either setting on for existing notes, or to repair an
+index. Run from the backend directory, with the API's settings:
+
+    SEARCH_INDEX=true SORT_INDEXES=true python -m scripts.rebuild_note_indexes [--user USER_ID]
+
+Per user, every note is written again, unchanged (same version), which
+re-indexes it in the enabled indexes. Writes are batched compare-and-sets,
+so a note edited meanwhile keeps its edit (and was indexed by it). Search
+postings are dropped first, so the user's searches return partial results
+while their index is rebuilt; secondary indexes are updated in place.
+Notes in cold storage (COLD_TIERING) are moved back to Redis by this.
+"""
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.core.database import (
+    get_redis_client,
+    close_redis,
+    user_notes_key,
+    note_terms_prefix,
+    note_term_lists_key,
+    USER_NOTES_PREFIX,
+)
+from app.models.note import NoteRecord, stale_fields
+from app.repositories import VersionConflict
+from app.repositories.redis_repository import RedisNoteRepository
+
+BATCH_SIZE = 200
+
+async def rebuild_user(redis, repository: RedisNoteRepository, user_id: str) -> dict:
+    """Re-index one user's notes and return counts."""
+    counts = {"indexed": 0, "changed": 0}
+
+    if settings.SEARCH_INDEX:
+        stale_keys = [key async for key in redis.scan_iter(match=f"{note_terms_prefix(user_id)}*", count=500)]
+        stale_keys.append(note_term_lists_key(user_id))
+        for start in range(0, len(stale_keys), BATCH_SIZE):
+            await redis.delete(*stale_keys[start:start + BATCH_SIZE])
+
+    start = 0
+    while True:
+        entries = await redis.zrange(user_notes_key(user_id), start, start + BATCH_SIZE - 1, withscores=True)
+        if not entries:
+            break
+        start += len(entries)
+        notes = await repository.get_many(user_id, [note_id for note_id, _ in entries])
+
+        saves = []
+        expected_versions = {}
+        for note_id, score in entries:
+            note_data = notes.get(note_id)
+            if not note_data:
+                continue
+            record = NoteRecord.from_hash(note_data)
+            note_hash = record.to_hash()
+            saves.append((note_hash, score, stale_fields(note_data, note_hash)))
+            expected_versions[note_id] = record.version
+
+        try:
+            await repository.write_batch(user_id, saves, [], expected_versions)
+            counts["indexed"] += len(saves)
+        except VersionConflict:
+            # Fall back to one compare-and-set per note for this batch
+            for note_hash, score, removed_fields in saves:
+                try:
+                    if await repository.update(note_hash, score, removed_fields, expected_versions[note_hash["id"]]):
+                        counts["indexed"] += 1
+                except VersionConflict:
+                    counts["changed"] += 1
+
+    return counts
+
+async def rebuild(user_id: str = None) -> dict:
+    """Rebuild the indexes of one user, or of every user with notes."""
+    totals = {"users": 0, "indexed": 0, "changed": 0}
+    repository = RedisNoteRepository()
+
+    async with get_redis_client() as redis:
+        if user_id:
+            user_ids = [user_id]
+        else:
+            user_ids = [key[len(USER_NOTES_PREFIX) + 1:-1] async for key in redis.scan_iter(match=f"{USER_NOTES_PREFIX}{{*}}", count=500)]
+        for current in user_ids:
+            counts = await rebuild_user(redis, repository, current)
+            totals["users"] += 1
+            totals["indexed"] += counts["indexed"]
+            totals["changed"] += counts["changed"]
+
+    return totals
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", help="Only rebuild this user's indexes")
+    args = parser.parse_args()
+
+    if not settings.SEARCH_INDEX and not settings.SORT_INDEXES:
+        parser.error("SEARCH_INDEX and SORT_INDEXES are off: there is no index to rebuild")
+
+    try:
+        totals = await rebuild(args.user)
+    finally:
+        await close_redis()
+
+    print(f"Indexed {totals['indexed']} notes of {totals['users']} users ({totals['changed']} changed while rebuilding)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Move notes idle for COLD_AFTER_DAYS days out of Redis into cold segments.
+
+A note is idle when it was neither written nor read (GET /notes/{id} or its
+/content) for that long. Its record is appended to a segment file in
+COLD_SEGMENT_DIR and only a small stub stays in Redis; the API reads it
+back from the segment, and moves it back to Redis when it is opened or
+written. Run it periodically (e.g. daily) from the backend directory, on
+the host whose disk holds the API's COLD_SEGMENT_DIR, with the API's
+settings:
+
+    COLD_TIERING=true python -m scripts.tier_cold_notes [--user USER_ID] [--days N] [--collect-only]
+
+Each run writes new segments, then removes the segments none of whose
+records is still in use (all their notes moved back, out again or deleted).
+Stubs are compare-and-sets on the note's version, so a note edited while
+the job runs simply stays in Redis.
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import get_redis_client, close_redis, USER_NOTES_PREFIX
+from app.services.tiering_service import tier_cold_notes, collect_segments
+
+async def list_users() -> list:
+    """Ids of every user with notes."""
+    async with get_redis_client() as redis:
+        return [key[len(USER_NOTES_PREFIX) + 1:-1] async for key in redis.scan_iter(match=f"{USER_NOTES_PREFIX}{{*}}", count=500)]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", help="Only move this user's notes")
+    parser.add_argument("--days", type=float, default=settings.COLD_AFTER_DAYS, help="Idle days before a note moves (default: COLD_AFTER_DAYS)")
+    parser.add_argument("--collect-only", action="store_true", help="Only remove unused segments")
+    args = parser.parse_args()
+
+    if not settings.COLD_TIERING:
+        parser.error("COLD_TIERING is off: the API would not record reads or move notes back")
+
+    try:
+        if not args.collect_only:
+            user_ids = [args.user] if args.user else await list_users()
+            totals = await tier_cold_notes(user_ids, before=time.time() - args.days * 86400)
+            print(f"Moved {totals['moved']} notes of {totals['users']} users to {totals['segment_bytes']} bytes of segments "
+                  f"({totals['changed']} changed while moving)")
+        collected = await collect_segments()
+    finally:
+        await close_redis()
+
+    print(f"Removed {collected['removed']} of {collected['segments']} segments, freeing {collected['freed_bytes']} bytes")
+
+if __name__ == "__main__":
+    asyncio.run(main())
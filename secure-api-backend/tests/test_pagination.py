@@ -0,0 +1,83 @@
+"""
+Cursor pagination of note listings over runs of equal index scores.
+
+Runs against the in-memory backend, and against the Redis repository on
+fakeredis when it is installed (pip install fakeredis).
+"""
+import asyncio
+
+import pytest
+
+from app.core import database
+from app.core.config import settings
+from app.models.note import NoteRecord, UPDATED_ORDER, SENSITIVITY_ORDER
+
+USER_ID = "pager"
+
+def _repositories():
+    from app.repositories.memory_repository import MemoryNoteRepository
+    yield "memory", MemoryNoteRepository
+    try:
+        import fakeredis
+    except ImportError:
+        return
+    from app.repositories.redis_repository import RedisNoteRepository
+
+    def redis_repository():
+        server = fakeredis.FakeServer()
+
+        async def fake_pool():
+            return fakeredis.FakeAsyncRedis(server=server, decode_responses=True).connection_pool
+        database.get_redis_pool = fake_pool
+        database.redis_pool = None
+        return RedisNoteRepository()
+    yield "redis", redis_repository
+
+@pytest.fixture(params=list(_repositories()), ids=lambda param: param[0])
+def repository(request, monkeypatch):
+    monkeypatch.setattr(database, "get_redis_pool", database.get_redis_pool)
+    monkeypatch.setattr(database, "redis_pool", None)
+    monkeypatch.setattr(settings, "SORT_INDEXES", True)
+    return request.param[1]()
+
+def _note(i: int, updated_at: float, sensitivity: int) -> NoteRecord:
+    return NoteRecord(id=f"note-{i:03d}", user_id=USER_ID, title=f"Note {i}", content="body",
+                      created_at=1000.0, updated_at=updated_at, sensitivity_score=sensitivity)
+
+async def _page_through(repository, limit: int, **options):
+    listed, position = [], None
+    while True:
+        page = await repository.list_after(USER_ID, position, limit, **options)
+        listed += [note["id"] for note in page.notes]
+        # A cursor that does not advance would page forever
+        assert len(listed) <= 100, "pagination repeats notes"
+        if page.next_position is None:
+            return listed
+        position = page.next_position
+
+def test_tie_run_longer_than_page(repository):
+    async def run():
+        records = [_note(i, 1000.0, 50) for i in range(30)]
+        await repository.create_many([(record.to_hash(), record.updated_at) for record in records])
+        listed = await _page_through(repository, 5, order=UPDATED_ORDER)
+        assert listed == sorted((record.id for record in records), reverse=True)
+    asyncio.run(run())
+
+def test_equal_sensitivities(repository):
+    async def run():
+        records = [_note(i, 1000.0 + i, 10 if i % 3 else 20) for i in range(30)]
+        await repository.create_many([(record.to_hash(), record.updated_at) for record in records])
+        expected = [record.id for record in sorted(records, key=lambda record: (record.sensitivity_score, record.id), reverse=True)]
+        assert await _page_through(repository, 4, order=SENSITIVITY_ORDER) == expected
+        assert await _page_through(repository, 4, order=SENSITIVITY_ORDER, min_score=20) == expected[:10]
+    asyncio.run(run())
+
+def test_cursor_note_deleted(repository):
+    async def run():
+        records = [_note(i, 1000.0, 50) for i in range(12)]
+        await repository.create_many([(record.to_hash(), record.updated_at) for record in records])
+        first = await repository.list_after(USER_ID, None, 5)
+        await repository.delete(USER_ID, first.notes[-1]["id"])
+        rest = await repository.list_after(USER_ID, first.next_position, 100)
+        assert [note["id"] for note in rest.notes] == [f"note-{i:03d}" for i in range(6, -1, -1)]
+    asyncio.run(run())
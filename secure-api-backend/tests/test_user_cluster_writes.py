@@ -0,0 +1,64 @@
+"""
+Recovery from user writes that stopped halfway, as they can with REDIS_CLUSTER.
+
+Runs the Redis repositories on fakeredis (pip install fakeredis), with the
+partial writes laid out by hand.
+"""
+import asyncio
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import app.repositories as repositories
+from app.core import database
+from app.core.database import DELETED_USERS_KEY, email_key, user_key, username_key
+from app.repositories.redis_repository import RedisUserRepository, RedisNoteRepository
+from app.services.user_service import purge_user_data
+
+USER = {"id": "user-1", "username": "alice", "email": "alice@example.com", "hashed_password": "x"}
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = fakeredis.FakeServer()
+
+    async def fake_pool():
+        return fakeredis.FakeAsyncRedis(server=server, decode_responses=True).connection_pool
+    monkeypatch.setattr(database, "get_redis_pool", fake_pool)
+    monkeypatch.setattr(database, "redis_pool", None)
+    monkeypatch.setattr(repositories, "_user_repository", RedisUserRepository())
+    monkeypatch.setattr(repositories, "_note_repository", RedisNoteRepository())
+    return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+def test_lookup_of_missing_user_is_dropped(redis):
+    async def run():
+        users = RedisUserRepository()
+        # A delete that stopped before removing the username lookup
+        await redis.set(username_key("alice"), "gone")
+        assert await users.get_by_username("alice") is None
+        assert not await users.username_exists("alice")
+        assert await redis.get(username_key("alice")) is None
+    asyncio.run(run())
+
+def test_lookup_of_renamed_user_is_dropped(redis):
+    async def run():
+        users = RedisUserRepository()
+        await users.create(USER)
+        # An update that stopped before moving the email lookup
+        await redis.hset(user_key(USER["id"]), "email", "new@example.com")
+        assert not await users.email_exists(USER["email"])
+        assert await redis.get(email_key(USER["email"])) is None
+        assert await users.username_exists("alice")
+    asyncio.run(run())
+
+def test_purge_finishes_delete(redis):
+    async def run():
+        users = RedisUserRepository()
+        await users.create(USER)
+        # A delete that stopped once the user was queued
+        await redis.zadd(DELETED_USERS_KEY, {USER["id"]: time.time()})
+        await purge_user_data(USER["id"])
+        assert not await redis.exists(user_key(USER["id"]), username_key("alice"), email_key(USER["email"]))
+        assert await users.list_deleted() == []
+    asyncio.run(run())
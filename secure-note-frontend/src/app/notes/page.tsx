@@ -1,10 +1,10 @@
 'use client';
 
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import Link from 'next/link';
 import { useRouter } from 'next/navigation';
-import { Note } from '@/types';
-import { noteService } from '@/services/api';
+import { Note, NoteEvent } from '@/types';
+import { noteService, subscribeToNoteEvents } from '@/services/api';
 import { Button } from '@/components/ui/Button';
 import { NoteCard } from '@/components/notes/NoteCard';
 import { useAuth } from '@/lib/auth-context';
@@ -18,6 +18,11 @@ export default function NotesPage() {
   const [error, setError] = useState<string | null>(null);
   const [sortBy, setSortBy] = useState<SortOption>('newest');
   const [searchTerm, setSearchTerm] = useState('');
+  // Latest notes, for the note event handlers
+  const notesRef = useRef<Note[]>([]);
+  // ETag of the last fetched list, and the initial fetch of it while it runs
+  const listEtag = useRef<string | null>(null);
+  const initialLoad = useRef<Promise<void> | null>(null);
   const router = useRouter();
   const { isAuthenticated, isLoading: authLoading } = useAuth();
 
@@ -33,8 +38,9 @@ export default function NotesPage() {
       if (!isAuthenticated) return;
       
       try {
-        const data = await noteService.getNotes();
-        setNotes(data);
+        const { notes: data, etag } = await noteService.getNotesIfChanged();
+        listEtag.current = etag;
+        setNotes(data ?? []);
         setError(null);
       } catch (err: any) {
         setError('Failed to load notes. Please try again later.');
@@ -45,12 +51,72 @@ export default function NotesPage() {
     };
 
     if (isAuthenticated) {
-      fetchNotes();
+      initialLoad.current = fetchNotes();
     } else if (!authLoading) {
       setIsLoading(false);
     }
   }, [isAuthenticated, authLoading]);
 
+  // Keep the list current from the server's note events instead of refetching it
+  useEffect(() => {
+    if (!isAuthenticated) return;
+
+    const refreshNote = async (event: NoteEvent) => {
+      try {
+        const note = await noteService.getNote(event.id);
+        setNotes((prevNotes) => {
+          const others = prevNotes.filter((existing) => existing.id !== note.id);
+          return [note, ...others];
+        });
+      } catch (err) {
+        // Deleted since the event was sent; its own event removes it
+      }
+    };
+
+    return subscribeToNoteEvents({
+      onReady: async (etag) => {
+        // The list fetched on mount is usually already the one the stream starts from
+        await initialLoad.current;
+        if (etag && etag === listEtag.current) return;
+        try {
+          const { notes: data, etag: latest } = await noteService.getNotesIfChanged(listEtag.current);
+          listEtag.current = latest;
+          if (data) setNotes(data);
+        } catch (err) {
+          console.error(err);
+        }
+      },
+      onEvent: (event) => {
+        if (event.type === 'deleted') {
+          setNotes((prevNotes) => prevNotes.filter((note) => note.id !== event.id));
+          return;
+        }
+        // Skip changes the list already has, such as this tab's own edits
+        const known = notesRef.current.find((note) => note.id === event.id);
+        if (known && known.version !== undefined && event.version !== undefined && known.version >= event.version) {
+          return;
+        }
+        // An analysis only changes the score, which the event carries
+        if (known && event.type === 'analyzed' && event.sensitivity_score !== undefined) {
+          const score = event.sensitivity_score;
+          setNotes((prevNotes) => prevNotes.map((note) => note.id === event.id
+            ? {
+                ...note,
+                version: event.version ?? note.version,
+                sensitivity: { sensitivity_score: score, explanation: note.sensitivity?.explanation ?? '' },
+              }
+            : note));
+          return;
+        }
+        refreshNote(event);
+      },
+    });
+  }, [isAuthenticated]);
+
+  useEffect(() => {
+    notesRef.current = notes;
+  }, [notes]);
+
   // Apply filtering and sorting
   useEffect(() => {
     let result = [...notes];
@@ -22,6 +22,11 @@ const noteSchema = z.object({
 
 type NoteFormValues = z.infer<typeof noteSchema>;
 
+const newIdempotencyKey = (): string =>
+  typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function'
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 interface NoteFormProps {
   existingNote?: Note;
   /**
@@ -37,8 +42,19 @@ export const NoteForm = ({ existingNote, onSuccess, initialDecryptionPassword }:
   const [isLoading, setIsLoading] = useState(false);
   const [isClient, setIsClient] = useState(false);
   const isMounted = useRef(false);
+  // Idempotency-Key of the last create/recreate, reused when the same payload
+  // is submitted again so a retry never creates the note twice
+  const submission = useRef<{ payload: string; key: string } | null>(null);
   const router = useRouter();
 
+  const idempotencyKeyFor = (payload: object): string => {
+    const serialized = JSON.stringify(payload);
+    if (submission.current?.payload !== serialized) {
+      submission.current = { payload: serialized, key: newIdempotencyKey() };
+    }
+    return submission.current.key;
+  };
+
   // Store the original encrypted status to detect changes
   const [wasOriginallyEncrypted] = useState(existingNote?.is_encrypted || false);
 
@@ -122,7 +138,8 @@ export const NoteForm = ({ existingNote, onSuccess, initialDecryptionPassword }:
               existingNote.id, 
               recreateData, 
               true,
-              initialDecryptionPassword
+              initialDecryptionPassword,
+              idempotencyKeyFor({ id: existingNote.id, ...recreateData })
             );
             
             // Immediately redirect to the notes page after recreation
@@ -185,7 +202,7 @@ export const NoteForm = ({ existingNote, onSuccess, initialDecryptionPassword }:
         }
         
         try {
-          result = await noteService.createNote(createData);
+          result = await noteService.createNote(createData, idempotencyKeyFor(createData));
           
           // Always redirect to My Notes page after creation
           router.push('/notes');
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { AuthResponse, LoginRequest, Note, NoteRequest, RegisterRequest, UpdateNoteRequest, UpdateUserRequest, User } from '@/types';
+import { AuthResponse, LoginRequest, Note, NoteEvent, NoteRequest, RegisterRequest, UpdateNoteRequest, UpdateUserRequest, User } from '@/types';
 import Cookies from 'js-cookie';
 
 // Make sure we normalize the API_URL to not have a trailing slash
@@ -210,6 +210,17 @@ export const noteService = {
     const response = await api.get<Note[]>(`/notes?skip=${skip}&limit=${limit}`);
     return response.data;
   },
+  // Like getNotes, but notes is null when the list still has the given ETag (304)
+  getNotesIfChanged: async (etag?: string | null, skip = 0, limit = 10): Promise<{ notes: Note[] | null; etag: string | null }> => {
+    const response = await api.get<Note[]>(`/notes?skip=${skip}&limit=${limit}`, {
+      headers: etag ? { 'If-None-Match': etag } : undefined,
+      validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+    });
+    return {
+      notes: response.status === 304 ? null : response.data,
+      etag: response.headers['etag'] ?? etag ?? null,
+    };
+  },
   getNote: async (id: string, decryptPassword?: string): Promise<Note> => {
     try {
       let url = `/notes/${id}`;
@@ -227,7 +238,8 @@ export const noteService = {
       throw error;
     }
   },
-  createNote: async (note: NoteRequest): Promise<Note> => {
+  // A retry with the same idempotencyKey returns the note the first attempt created
+  createNote: async (note: NoteRequest, idempotencyKey?: string): Promise<Note> => {
     try {
       // Properly prepare the note data with all fields
       const createData: Record<string, any> = {
@@ -241,7 +253,9 @@ export const noteService = {
         createData.encryption_password = note.encryption_password;
       }
       
-      const response = await api.post<Note>('/notes', createData);
+      const response = await api.post<Note>('/notes', createData, {
+        headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+      });
       return response.data;
     } catch (error) {
       throw error;
@@ -265,7 +279,8 @@ export const noteService = {
     id: string, 
     note: NoteRequest, 
     deleteOriginal: boolean = true,
-    decryptPassword?: string
+    decryptPassword?: string,
+    idempotencyKey?: string
   ): Promise<Note> => {
     try {
       // Build URL with query parameters
@@ -274,7 +289,9 @@ export const noteService = {
         url += `&decrypt_password=${encodeURIComponent(decryptPassword)}`;
       }
       
-      const response = await api.post<Note>(url, note);
+      const response = await api.post<Note>(url, note, {
+        headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+      });
       return response.data;
     } catch (error) {
       throw error;
@@ -282,4 +299,77 @@ export const noteService = {
   },
 };
 
+// Handlers of the note event stream
+export interface NoteEventHandlers {
+  // The stream is (re)connected, or dropped events: refetch the notes unless
+  // the list still has etag (undefined after dropped events)
+  onReady: (etag?: string) => void;
+  onEvent: (event: NoteEvent) => void;
+}
+
+// Delay before reconnecting a dropped stream, unless the server sets one
+const EVENT_RETRY_MS = 5000;
+
+/**
+ * Subscribe to changes to the current user's notes (GET /notes/events).
+ * EventSource cannot send the Authorization header, so the Server-Sent
+ * Events are read with fetch. Returns a function that closes the stream.
+ * If the server has events disabled (404) the stream is not retried.
+ */
+export const subscribeToNoteEvents = (handlers: NoteEventHandlers): (() => void) => {
+  const controller = new AbortController();
+  let retryMs = EVENT_RETRY_MS;
+
+  const handleFrame = (frame: string) => {
+    let event = 'message';
+    let data = '';
+    frame.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) data += line.slice(5).trim();
+      else if (line.startsWith('retry:')) retryMs = Number(line.slice(6).trim()) || retryMs;
+    });
+    if (event === 'ready') {
+      handlers.onReady(data ? (JSON.parse(data).etag as string) : undefined);
+    } else if (event === 'resync') {
+      handlers.onReady();
+    } else if (event === 'note' && data) {
+      handlers.onEvent(JSON.parse(data) as NoteEvent);
+    }
+  };
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const token = getToken();
+        const response = await fetch(`${API_URL}/notes/events`, {
+          headers: token ? { Authorization: `Bearer ${token}` } : {},
+          signal: controller.signal,
+        });
+        if (response.status === 404) return;
+        if (response.ok && response.body) {
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end: number;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+              handleFrame(buffer.slice(0, end));
+              buffer = buffer.slice(end + 2);
+            }
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  };
+
+  connect();
+  return () => controller.abort();
+};
+
 export default api; 
\ No newline at end of file
@@ -22,6 +22,15 @@ export interface Note {
   updated_at: number;
   decryptionPassword?: string;
   sensitivity?: NoteSensitivity;
+  version?: number;
+}
+
+// A change to one of the user's notes, streamed by GET /notes/events
+export interface NoteEvent {
+  type: 'created' | 'updated' | 'deleted' | 'analyzed';
+  id: string;
+  version?: number;
+  sensitivity_score?: number;
 }
 
 export interface NotePageProps {